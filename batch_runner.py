@@ -0,0 +1,138 @@
+# batch_runner.py
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Dict, Iterator, List, Optional, Set
+
+from clients.response_cache import ResponseStore, make_response_store
+from clients.scheduler import SCHEDULER, scheduling_priority
+from conversation import MAX_TOOL_WORKERS, get_api_client, run_turn
+from tools.weather_prefetch import WeatherPrefetcher
+from tools.weather_router import FastPathRouter
+
+
+def load_jobs(input_path: str) -> Iterator[Dict[str, Any]]:
+    """
+    Reads conversations from a JSONL file. Each line needs a `prompt` string
+    or a `turns` list of user messages, and may carry an `id` (the line
+    number is used otherwise).
+    """
+    with open(input_path, encoding="utf-8") as input_file:
+        for line_number, line in enumerate(input_file, start=1):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            turns = record.get("turns") or [record["prompt"]]
+            yield {"id": str(record.get("id", line_number)), "turns": turns}
+
+
+def load_completed_ids(output_path: str) -> Set[str]:
+    """Returns the ids that already finished without an error in a previous run."""
+    completed: Set[str] = set()
+    if not os.path.exists(output_path):
+        return completed
+    with open(output_path, encoding="utf-8") as output_file:
+        for line in output_file:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # A run killed mid-write leaves a truncated last line behind.
+                continue
+            if record.get("error"):
+                completed.discard(record["id"])
+            else:
+                completed.add(record["id"])
+    return completed
+
+
+def run_conversation(
+        job: Dict[str, Any],
+        client_type: str,
+        model_type: str,
+        tool_executor: ThreadPoolExecutor,
+        router: Optional[FastPathRouter] = None,
+        response_store: Optional[ResponseStore] = None,
+        prefetcher: Optional[WeatherPrefetcher] = None,
+) -> Dict[str, Any]:
+    """
+    Runs one conversation on its own client and returns its result record.
+    Its model calls are scheduled at batch priority, behind interactive ones.
+    """
+    turns: List[Dict[str, Any]] = []
+    error = None
+    start = time.perf_counter()
+    try:
+        with scheduling_priority("batch"):
+            client = get_api_client(client_type, model_type, response_store)
+            for user_input in job["turns"]:
+                turn_start = time.perf_counter()
+                turn = run_turn(client, user_input, tool_executor, router=router, prefetcher=prefetcher)
+                turns.append({**turn, "latency_s": round(time.perf_counter() - turn_start, 4)})
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+
+    return {
+        "id": job["id"],
+        "turns": turns,
+        "latency_s": round(time.perf_counter() - start, 4),
+        "tool_call_count": sum(len(turn["function_calls"]) for turn in turns),
+        "error": error,
+    }
+
+
+def run_batch(
+        input_path: str,
+        output_path: str,
+        client_type: str,
+        model_type: str,
+        concurrency: int = 4,
+        fast_path: bool = False,
+        response_cache: Optional[str] = None,
+        prefetch: bool = False,
+) -> Dict[str, Any]:
+    """
+    Runs every conversation in `input_path` through a pool of `concurrency`
+    workers and appends one JSON line per conversation to `output_path` as
+    soon as it finishes. Conversations that already completed successfully
+    in `output_path` are skipped, so an interrupted run can be resumed by
+    running it again.
+    """
+    completed_ids = load_completed_ids(output_path)
+    jobs = [job for job in load_jobs(input_path) if job["id"] not in completed_ids]
+
+    router = FastPathRouter() if fast_path else None
+    prefetcher = WeatherPrefetcher() if prefetch else None
+    # One store for the whole run, so identical opening turns across conversations are paid for once.
+    response_store = make_response_store(response_cache) if response_cache else None
+    summary = {"skipped": len(completed_ids), "succeeded": 0, "failed": 0, "tool_calls": 0}
+    start = time.perf_counter()
+
+    with open(output_path, "a", encoding="utf-8") as output_file, \
+            ThreadPoolExecutor(max_workers=max(MAX_TOOL_WORKERS, concurrency)) as tool_executor, \
+            ThreadPoolExecutor(max_workers=concurrency) as workers:
+        futures = [
+            workers.submit(
+                run_conversation, job, client_type, model_type, tool_executor, router, response_store, prefetcher
+            )
+            for job in jobs
+        ]
+        for future in as_completed(futures):
+            record = future.result()
+            output_file.write(json.dumps(record, ensure_ascii=False) + "\n")
+            output_file.flush()
+            summary["failed" if record["error"] else "succeeded"] += 1
+            summary["tool_calls"] += record["tool_call_count"]
+
+    summary["elapsed_s"] = round(time.perf_counter() - start, 2)
+    if router:
+        summary["fast_path"] = router.stats()
+    if prefetcher:
+        summary["prefetch"] = prefetcher.stats()
+    if response_store:
+        summary["response_cache"] = response_store.stats()
+    summary["scheduler"] = SCHEDULER.stats()
+    if summary["tool_calls"]:
+        from tools.weather_tool import forecast_batch_stats
+        summary["forecast_batches"] = forecast_batch_stats()
+    return summary
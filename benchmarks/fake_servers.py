@@ -0,0 +1,409 @@
+# benchmarks/fake_servers.py
+"""
+Local stand-ins for the services the chatbot talks to, so the turn pipeline
+can be measured without network access: an OpenAI-compatible chat endpoint
+(used for both the Gemini-compatible and the Ollama client) and the
+Open-Meteo geocoding and forecast endpoints.
+"""
+import hashlib
+import json
+import math
+import re
+import socket
+import sys
+import threading
+import time
+import urllib.parse
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+WEATHER_REQUEST = re.compile(r"\b(?:weather|temperature|wind|forecast)\b", re.IGNORECASE)
+LOCATION = re.compile(r"\b(?:in|for|and|vs)\s+((?:[A-Z][a-z]+)(?:\s[A-Z][a-z]+)*)")
+SUMMARY_MARKER = "You have received the following data"
+
+
+class _CountingReader:
+    def __init__(self, raw, server: "FakeServer"):
+        self._raw = raw
+        self._server = server
+
+    def read(self, *args):
+        data = self._raw.read(*args)
+        self._server.count_in(len(data))
+        return data
+
+    def readline(self, *args):
+        data = self._raw.readline(*args)
+        self._server.count_in(len(data))
+        return data
+
+    def close(self):
+        self._raw.close()
+
+
+class _CountingWriter:
+    def __init__(self, raw, server: "FakeServer"):
+        self._raw = raw
+        self._server = server
+
+    def write(self, data):
+        self._server.count_out(len(data))
+        return self._raw.write(data)
+
+    @property
+    def closed(self):
+        return self._raw.closed
+
+    def flush(self):
+        self._raw.flush()
+
+    def close(self):
+        self._raw.close()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: "FakeServer"
+
+    def setup(self):
+        super().setup()
+        # Headers and body go out in separate writes; without this Nagle's algorithm
+        # and delayed ACKs add ~40ms to every keep-alive response.
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.rfile = _CountingReader(self.rfile, self.server)
+        self.wfile = _CountingWriter(self.wfile, self.server)
+
+    def log_message(self, format, *args):
+        pass
+
+    def _read_json(self) -> Dict[str, Any]:
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def _send_json(self, body: Any, status: int = 200) -> None:
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class FakeServer(ThreadingHTTPServer):
+    """Threaded HTTP server on a free localhost port that counts requests and bytes."""
+
+    daemon_threads = True
+
+    def __init__(self, handler_class, latency_s: float = 0.0):
+        super().__init__(("127.0.0.1", 0), handler_class)
+        self.latency_s = latency_s
+        self._counter_lock = threading.Lock()
+        self.requests = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_port}"
+
+    def handle_error(self, request, client_address) -> None:
+        # Clients hang up mid-stream on purpose (the Ollama client stops at the end of a tool call);
+        # only unexpected errors are worth a traceback.
+        if not isinstance(sys.exc_info()[1], (ConnectionResetError, BrokenPipeError)):
+            super().handle_error(request, client_address)
+
+    def count_in(self, size: int) -> None:
+        with self._counter_lock:
+            self.bytes_in += size
+
+    def count_out(self, size: int) -> None:
+        with self._counter_lock:
+            self.bytes_out += size
+
+    def count_request(self) -> None:
+        with self._counter_lock:
+            self.requests += 1
+
+    def reset_counters(self) -> None:
+        with self._counter_lock:
+            self.requests = self.bytes_in = self.bytes_out = 0
+
+    def start(self) -> "FakeServer":
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+
+def _estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+def _message_text(message: Dict[str, Any]) -> str:
+    content = message.get("content") or ""
+    if isinstance(content, list):
+        content = " ".join(part.get("text", "") for part in content if isinstance(part, dict))
+    return content
+
+
+def _shared_prefix(keys: List[Tuple[str, str]], cached: List[Tuple[str, str]]) -> int:
+    shared = 0
+    for key, cached_key in zip(keys, cached):
+        if key != cached_key:
+            break
+        shared += 1
+    return shared
+
+
+class FakeChatHandler(_Handler):
+    """
+    OpenAI-compatible `/chat/completions`. When the last user message asks
+    about the weather in one or more capitalized places it answers with tool
+    calls: native `tool_calls` when the request declares tools, the JSON
+    envelope the Ollama prompt asks for otherwise. Tool results and anything
+    else get a short prose reply. Streaming is supported.
+    """
+
+    server: "FakeChatServer"
+
+    def do_POST(self):
+        self.server.count_request()
+        body = self._read_json()
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json({"error": {"message": "not found"}}, status=404)
+            return
+
+        messages = body.get("messages", [])
+        text, tool_calls = self.server.script(messages, bool(body.get("tools")))
+        prompt_tokens = sum(_estimate_tokens(_message_text(message)) for message in messages)
+        completion_tokens = _estimate_tokens(text or json.dumps(tool_calls))
+        evaluated_tokens = self.server.record_prompt(messages, prompt_tokens)
+        time.sleep(self.server.latency_s + self.server.prompt_token_latency_s * evaluated_tokens)
+
+        if body.get("stream"):
+            self._stream(body, text, tool_calls, prompt_tokens, completion_tokens)
+            return
+
+        # A complete reply takes as long to decode as its streamed tokens.
+        time.sleep(self.server.token_latency_s * len(re.findall(r"\S+\s*|\s+", text or "")))
+        message: Dict[str, Any] = {"role": "assistant", "content": text}
+        if tool_calls:
+            message["tool_calls"] = tool_calls
+        self._send_json({
+            "id": "chatcmpl-fake",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "fake"),
+            "choices": [{"index": 0, "message": message, "finish_reason": "tool_calls" if tool_calls else "stop"}],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        })
+
+    def _stream(
+            self, body: Dict[str, Any], text: Optional[str], tool_calls: List[Dict[str, Any]],
+            prompt_tokens: int, completion_tokens: int,
+    ) -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        base = {"id": "chatcmpl-fake", "object": "chat.completion.chunk", "created": int(time.time()),
+                "model": body.get("model", "fake")}
+
+        def send(delta: Dict[str, Any], finish_reason: Optional[str] = None) -> bool:
+            event = {**base, "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]}
+            return self._write_chunk(f"data: {json.dumps(event)}\n\n".encode())
+
+        for token in re.findall(r"\S+\s*|\s+", text or ""):
+            time.sleep(self.server.token_latency_s)
+            if not send({"content": token}):
+                return
+        for index, tool_call in enumerate(tool_calls):
+            send({"tool_calls": [{"index": index, "id": tool_call["id"], "type": "function",
+                                  "function": {"name": tool_call["function"]["name"], "arguments": ""}}]})
+            send({"tool_calls": [{"index": index, "function": {"arguments": tool_call["function"]["arguments"]}}]})
+        send({}, "tool_calls" if tool_calls else "stop")
+        if (body.get("stream_options") or {}).get("include_usage"):
+            # Like the real API, usage comes last in a chunk with no choices.
+            usage = {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                     "total_tokens": prompt_tokens + completion_tokens}
+            self._write_chunk(f"data: {json.dumps({**base, 'choices': [], 'usage': usage})}\n\n".encode())
+        self._write_chunk(b"data: [DONE]\n\n")
+        self._write_chunk(b"")
+
+    def _write_chunk(self, data: bytes) -> bool:
+        try:
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+            self.wfile.flush()
+            return True
+        except (BrokenPipeError, ConnectionResetError):
+            # The client stopped reading, e.g. after it saw everything it needed.
+            self.close_connection = True
+            return False
+
+
+class FakeChatServer(FakeServer):
+    """
+    Fake chat endpoint with configurable latency and a replaceable tool-call
+    script. Like Ollama, it keeps the prompts of its last `kv_slots` requests
+    and only evaluates the part of a new prompt after the longest message
+    prefix it shares with one of them, charging `prompt_token_latency_s` for
+    each evaluated token.
+    """
+
+    def __init__(
+            self, latency_s: float = 0.05, token_latency_s: float = 0.0, summary_words: int = 30,
+            chatter_words: int = 0, prompt_token_latency_s: float = 0.0, kv_slots: int = 16,
+    ):
+        super().__init__(FakeChatHandler, latency_s)
+        self.token_latency_s = token_latency_s
+        self.prompt_token_latency_s = prompt_token_latency_s
+        self.summary_words = summary_words
+        # Words of commentary after a JSON tool call, as small local models tend to add.
+        self.chatter_words = chatter_words
+        self.prompt_tokens = 0
+        self.prompt_eval_tokens = 0
+        self.prompts: List[List[Dict[str, Any]]] = []
+        self._kv_cache: Deque[List[Tuple[str, str]]] = deque(maxlen=kv_slots)
+
+    def record_prompt(self, messages: List[Dict[str, Any]], prompt_tokens: int) -> int:
+        """Records a prompt and returns how many of its tokens the cached prefixes do not cover."""
+        keys = [(message.get("role", ""), _message_text(message)) for message in messages]
+        with self._counter_lock:
+            shared = max((_shared_prefix(keys, cached) for cached in self._kv_cache), default=0)
+            cached_tokens = sum(_estimate_tokens(text) for _, text in keys[:shared])
+            self._kv_cache.append(keys)
+            self.prompt_tokens += prompt_tokens
+            self.prompt_eval_tokens += prompt_tokens - cached_tokens
+            self.prompts.append(messages)
+        return prompt_tokens - cached_tokens
+
+    def reset_counters(self) -> None:
+        super().reset_counters()
+        with self._counter_lock:
+            self.prompt_tokens = self.prompt_eval_tokens = 0
+            self.prompts = []
+            self._kv_cache.clear()
+
+    def script(self, messages: List[Dict[str, Any]], native_tools: bool) -> Tuple[Optional[str], List[Dict[str, Any]]]:
+        """Decides the reply: returns (text, native tool calls)."""
+        last = messages[-1] if messages else {}
+        last_text = _message_text(last)
+        if last.get("role") == "tool" or last_text.startswith(SUMMARY_MARKER):
+            words = ("The weather there is mild with a light breeze and scattered clouds " * 10).split()
+            return " ".join(words[:self.summary_words]) + ".", []
+
+        locations = LOCATION.findall(last_text) if WEATHER_REQUEST.search(last_text) else []
+        if not locations:
+            return "Hello! I can look up the current weather for any city.", []
+
+        calls = [{"name": "get_current_weather", "arguments": {"location": location}} for location in locations]
+        if native_tools:
+            return None, [
+                {"id": f"call_{index}", "type": "function",
+                 "function": {"name": call["name"], "arguments": json.dumps(call["arguments"])}}
+                for index, call in enumerate(calls)
+            ]
+        envelope = {"tool_call": calls[0]} if len(calls) == 1 else {"tool_calls": calls}
+        chatter = " ".join(("I will now look up the weather for you and report back " * 10).split()[:self.chatter_words])
+        return f"```json\n{json.dumps(envelope, indent=2)}\n```" + (f"\n\n{chatter}." if chatter else ""), []
+
+
+class FakeOpenMeteoHandler(_Handler):
+    """Geocoding (`/v1/search`) and forecast (`/v1/forecast`) with deterministic data."""
+
+    server: "FakeOpenMeteoServer"
+
+    def do_GET(self):
+        self.server.count_request()
+        split = urllib.parse.urlsplit(self.path)
+        query = urllib.parse.parse_qs(split.query)
+        time.sleep(self.server.latency_s)
+        if split.path.endswith("/search"):
+            self._send_json(self._geocode(query.get("name", [""])[0]))
+        elif split.path.endswith("/forecast"):
+            self._send_json(self._forecast(query))
+        else:
+            self._send_json({"error": True, "reason": "not found"}, status=404)
+
+    def _geocode(self, name: str) -> Dict[str, Any]:
+        if not name or name.casefold() in self.server.unknown_locations:
+            return {"generationtime_ms": 0.1}
+        digest = hashlib.sha256(name.casefold().encode()).digest()
+        latitude = round(digest[0] / 255 * 140 - 70, 4)
+        longitude = round(digest[1] / 255 * 360 - 180, 4)
+        return {
+            "results": [{
+                "id": int.from_bytes(digest[:4], "big"), "name": name, "latitude": latitude,
+                "longitude": longitude, "elevation": 35.0, "feature_code": "PPLC", "country_code": "XX",
+                "timezone": "GMT", "population": 1000000, "country": "Fakeland",
+            }],
+            "generationtime_ms": 0.1,
+        }
+
+    def _forecast(self, query: Dict[str, List[str]]) -> Any:
+        latitudes = query.get("latitude", ["0"])[0].split(",")
+        longitudes = query.get("longitude", ["0"])[0].split(",")
+        now = datetime.now(timezone.utc)
+        observed = now.replace(minute=now.minute - now.minute % 15, second=0, microsecond=0)
+        locations = []
+        for latitude, longitude in zip(latitudes, longitudes):
+            seed = int(abs(float(latitude) * 1000 + float(longitude) * 10))
+            if "hourly" in query:
+                locations.append(self._hourly(query, float(latitude), float(longitude), seed, now))
+                continue
+            locations.append({
+                "latitude": float(latitude), "longitude": float(longitude), "generationtime_ms": 0.1,
+                "utc_offset_seconds": 0, "timezone": "GMT", "timezone_abbreviation": "GMT", "elevation": 35.0,
+                "current_weather_units": {"time": "iso8601", "interval": "seconds", "temperature": "°C",
+                                          "windspeed": "km/h", "winddirection": "°", "is_day": "",
+                                          "weathercode": "wmo code"},
+                "current_weather": {
+                    "time": observed.strftime("%Y-%m-%dT%H:%M"), "interval": 900,
+                    "temperature": round(seed % 35 - 5 + 0.5, 1), "windspeed": float(seed % 40),
+                    "winddirection": seed % 360, "is_day": seed % 2, "weathercode": (0, 1, 2, 3, 61)[seed % 5],
+                },
+            })
+        return locations[0] if len(locations) == 1 else locations
+
+
+    @staticmethod
+    def _hourly(query: Dict[str, List[str]], latitude: float, longitude: float, seed: int, now: datetime) -> Any:
+        # Like the real API, only the requested variables are returned, as one array per variable.
+        days = int(query.get("forecast_days", ["7"])[0])
+        start = now.replace(hour=0, minute=0, second=0, microsecond=0)
+        hours = range(days * 24)
+        series = {
+            "temperature_2m": [
+                round(seed % 25 + 8 * math.sin((hour % 24 - 9) / 24 * 2 * math.pi) + hour / 24 * (seed % 3 - 1), 1)
+                for hour in hours
+            ],
+            "precipitation_probability": [(seed + hour * 7) % 101 for hour in hours],
+            "wind_speed_10m": [round(seed % 30 + (hour * 13 % 17) / 2, 1) for hour in hours],
+            "weather_code": [(0, 1, 2, 3, 61, 80)[(seed + hour // 6) % 6] for hour in hours],
+        }
+        fields = query["hourly"][0].split(",")
+        return {
+            "latitude": latitude, "longitude": longitude, "generationtime_ms": 0.1, "utc_offset_seconds": 0,
+            "timezone": "GMT", "timezone_abbreviation": "GMT", "elevation": 35.0,
+            "hourly_units": {"time": "iso8601", **{field: "" for field in fields}},
+            "hourly": {
+                "time": [(start + timedelta(hours=hour)).strftime("%Y-%m-%dT%H:%M") for hour in hours],
+                **{field: series[field] for field in fields if field in series},
+            },
+        }
+
+
+class FakeOpenMeteoServer(FakeServer):
+    def __init__(self, latency_s: float = 0.02, unknown_locations: Tuple[str, ...] = ("atlantis",)):
+        super().__init__(FakeOpenMeteoHandler, latency_s)
+        self.unknown_locations = {location.casefold() for location in unknown_locations}
@@ -0,0 +1,94 @@
+# benchmarks/import_budget.py
+"""
+Import-time budget report. Runs each startup path in a fresh interpreter
+under `python -X importtime`, subtracts what the bare interpreter imports
+anyway, and checks the remaining import time against a budget.
+
+    python -m benchmarks.import_budget
+    python -m benchmarks.import_budget --budget attach=10 --top 15
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Startup path -> (code to run, budget in ms).
+TARGETS: Dict[str, Tuple[str, float]] = {
+    "chatbot-script": ("import runpy; runpy.run_path('multi-model-chatbot.py', run_name='import_budget')", 15),
+    "attach": ("import chat_daemon", 15),
+    "interactive-ui": ("import prompt_toolkit", 150),
+    "turn-pipeline": ("import conversation", 60),
+    "client:gemini-genai": ("import clients.genai_client", 1500),
+    "client:gemini-openai": ("import clients.openai_client", 1000),
+    "client:gemma-openai": ("import clients.ollama_client", 1000),
+}
+
+_LINE = re.compile(r"^import time:\s+(?P<self>\d+) \|\s+(?P<cumulative>\d+) \| (?P<indent>\s*)(?P<module>\S+)$")
+
+
+def import_times(code: str) -> List[Tuple[str, int, int, int]]:
+    """Returns (module, depth, self_us, cumulative_us) for every import made by `code` in a fresh interpreter."""
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code], cwd=ROOT, capture_output=True, text=True, check=True
+    )
+    entries = []
+    for line in completed.stderr.splitlines():
+        match = _LINE.match(line)
+        if match:
+            depth = len(match.group("indent")) // 2
+            entries.append((match.group("module"), depth, int(match.group("self")), int(match.group("cumulative"))))
+    return entries
+
+
+def measure(code: str, baseline: set, repeat: int) -> Tuple[float, List[Tuple[str, int]]]:
+    """Returns the best-of-`repeat` import time in ms beyond the baseline, and the slowest top-level imports."""
+    best_total, best_top = None, []
+    for _ in range(repeat):
+        top_level = [
+            (module, cumulative)
+            for module, depth, _, cumulative in import_times(code)
+            if depth == 0 and module not in baseline
+        ]
+        total = sum(cumulative for _, cumulative in top_level) / 1000
+        if best_total is None or total < best_total:
+            best_total, best_top = total, sorted(top_level, key=lambda entry: -entry[1])
+    return best_total, best_top
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Import-time budget report for the chatbot's startup paths")
+    parser.add_argument("--targets", nargs="+", choices=sorted(TARGETS), default=list(TARGETS))
+    parser.add_argument("--budget", action="append", default=[], metavar="TARGET=MS", help="Override a budget.")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per target; the fastest one counts.")
+    parser.add_argument("--top", type=int, default=5, help="Slowest top-level imports to list per target.")
+    args = parser.parse_args()
+
+    budgets = {name: budget for name, (_, budget) in TARGETS.items()}
+    for override in args.budget:
+        name, _, value = override.partition("=")
+        budgets[name] = float(value)
+
+    baseline = {module for module, depth, _, _ in import_times("pass") if depth == 0}
+    over_budget = []
+    print(f"{'target':<24}{'import ms':>12}{'budget ms':>12}")
+    for name in args.targets:
+        total, top = measure(TARGETS[name][0], baseline, args.repeat)
+        flag = "" if total <= budgets[name] else "  OVER BUDGET"
+        print(f"{name:<24}{total:>12.1f}{budgets[name]:>12.0f}{flag}")
+        for module, cumulative in top[:args.top]:
+            print(f"    {module:<36}{cumulative / 1000:>8.1f} ms")
+        if flag:
+            over_budget.append(name)
+
+    if over_budget:
+        print(f"\nOver budget: {', '.join(over_budget)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
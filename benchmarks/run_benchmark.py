@@ -0,0 +1,307 @@
+# benchmarks/run_benchmark.py
+"""
+Offline benchmark for the turn pipeline. Starts the fake servers, points the
+OpenAI-compatible clients and the weather tool at them and drives realistic
+multi-turn scenarios, reporting turn latency percentiles, throughput,
+allocations and bytes on the wire.
+
+    python -m benchmarks.run_benchmark --save-baseline benchmarks/baseline.json
+    python -m benchmarks.run_benchmark --baseline benchmarks/baseline.json
+"""
+import argparse
+import gc
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from benchmarks.fake_servers import FakeChatServer, FakeOpenMeteoServer
+from tools.weather_prefetch import WeatherPrefetcher
+from tools.weather_router import FastPathRouter
+
+SCENARIOS: Dict[str, List[str]] = {
+    "greeting": ["hi", "how are you?"],
+    "single-city": ["what is the weather in Paris?", "and the temperature in Paris?"],
+    "multi-city": ["compare the weather in Paris and Rome and Oslo"],
+    "long-session": [
+        "hello there",
+        "weather in Tokyo",
+        "what is the wind in Sydney?",
+        "thanks, and the weather in Tokyo again?",
+        "temperature in Buenos Aires and Cairo",
+        "weather in Atlantis",
+        "what is the temperature in Paris?",
+        "bye",
+    ],
+}
+# Long enough to outgrow the conversation window, so how the window moves shows in prompt evaluation.
+SCENARIOS["extended-session"] = SCENARIOS["long-session"][:-1] * 3 + ["bye"]
+
+CLIENTS = {
+    "gemini-openai": "gemini-2.5-flash",
+    "gemma-openai": "gemma3:1b",
+}
+
+# Metrics where a larger value is a regression; throughput is the reverse.
+HIGHER_IS_WORSE = (
+    "p50_ms", "p95_ms", "p99_ms", "bytes_per_turn", "alloc_peak_kib_per_turn", "session_kib", "prompt_eval_per_turn",
+)
+LOWER_IS_WORSE = ("turns_per_s",)
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, round(fraction * len(ordered) + 0.5) - 1))
+    return ordered[index]
+
+
+def configure_endpoints(chat_server: FakeChatServer, meteo_server: FakeOpenMeteoServer) -> None:
+    """Points every client and the weather tool at the fake servers, with cold caches."""
+    os.environ.setdefault("GEMINI_API_KEY", "benchmark")
+    from clients import ollama_client, openai_client
+    from tools import weather_tool
+
+    openai_client.GEMINI_OPENAI_BASE_URL = f"{chat_server.url}/v1"
+    ollama_client.OLLAMA_BASE_URL = f"{chat_server.url}/v1"
+    weather_tool.GEOCODING_API_URL = f"{meteo_server.url}/v1/search"
+    weather_tool.FORECAST_API_URL = f"{meteo_server.url}/v1/forecast"
+    reset_caches()
+
+
+def reset_caches() -> None:
+    from tools import weather_tool
+    from tools.gazetteer import Gazetteer
+    from tools.weather_cache import ForecastCache, GeocodingCache
+
+    # Every geocoding lookup goes to the fake server, whether or not a local gazetteer is installed.
+    weather_tool.GAZETTEER = Gazetteer(path=None)
+    weather_tool.GEOCODING_CACHE = GeocodingCache(path=None)
+    weather_tool.FORECAST_CACHE = ForecastCache()
+
+
+def run_session(
+        client_type: str,
+        turns: List[str],
+        tool_executor: ThreadPoolExecutor,
+        router: Optional[FastPathRouter] = None,
+        prefetcher: Optional[WeatherPrefetcher] = None,
+) -> List[float]:
+    from conversation import get_api_client, run_turn
+
+    client = get_api_client(client_type, CLIENTS[client_type])
+    latencies = []
+    for user_input in turns:
+        start = time.perf_counter()
+        run_turn(client, user_input, tool_executor, router=router, prefetcher=prefetcher)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def measure_allocations(
+        client_type: str, turns: List[str], tool_executor: ThreadPoolExecutor, router: Optional[FastPathRouter] = None
+) -> float:
+    """Runs one session under tracemalloc and returns the mean peak KiB allocated per turn."""
+    from conversation import get_api_client, run_turn
+
+    client = get_api_client(client_type, CLIENTS[client_type])
+    peaks = []
+    tracemalloc.start()
+    try:
+        for user_input in turns:
+            tracemalloc.reset_peak()
+            before, _ = tracemalloc.get_traced_memory()
+            run_turn(client, user_input, tool_executor, router=router)
+            _, peak = tracemalloc.get_traced_memory()
+            peaks.append((peak - before) / 1024)
+    finally:
+        tracemalloc.stop()
+    return statistics.fmean(peaks)
+
+
+def measure_session_memory(
+        client_type: str,
+        turns: List[str],
+        tool_executor: ThreadPoolExecutor,
+        router: Optional[FastPathRouter] = None,
+        sessions: int = 10,
+) -> float:
+    """
+    Runs `sessions` sessions to completion and returns the mean KiB each one
+    keeps alive afterwards, measured as what is freed when its client goes.
+    """
+    from conversation import get_api_client, run_turn
+
+    tracemalloc.start()
+    try:
+        clients = [get_api_client(client_type, CLIENTS[client_type]) for _ in range(sessions)]
+        for client in clients:
+            for user_input in turns:
+                run_turn(client, user_input, tool_executor, router=router)
+        gc.collect()
+        with_sessions, _ = tracemalloc.get_traced_memory()
+        del client, clients
+        gc.collect()
+        without_sessions, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return (with_sessions - without_sessions) / sessions / 1024
+
+
+def run_case(
+        client_type: str,
+        scenario: str,
+        sessions: int,
+        concurrency: int,
+        chat_server: FakeChatServer,
+        meteo_server: FakeOpenMeteoServer,
+        fast_path: bool = False,
+        prefetch: bool = False,
+) -> Dict[str, Any]:
+    turns = SCENARIOS[scenario]
+    router = FastPathRouter() if fast_path else None
+    prefetcher = WeatherPrefetcher() if prefetch else None
+    with ThreadPoolExecutor(max_workers=4) as tool_executor, ThreadPoolExecutor(max_workers=concurrency) as pool:
+        # One untimed session warms imports, connection pools and SDK clients.
+        run_session(client_type, turns, tool_executor, router, prefetcher)
+        reset_caches()
+        chat_server.reset_counters()
+        meteo_server.reset_counters()
+
+        start = time.perf_counter()
+        latencies = [
+            latency
+            for session in pool.map(
+                lambda _: run_session(client_type, turns, tool_executor, router, prefetcher), range(sessions)
+            )
+            for latency in session
+        ]
+        elapsed = time.perf_counter() - start
+        wire_bytes = chat_server.bytes_in + chat_server.bytes_out + meteo_server.bytes_in + meteo_server.bytes_out
+        # Prompt tokens the model had to evaluate, i.e. not covered by a prefix cached from an earlier request.
+        prompt_eval_tokens, prompt_tokens = chat_server.prompt_eval_tokens, chat_server.prompt_tokens
+        upstream = {"model_requests": chat_server.requests, "weather_requests": meteo_server.requests}
+
+        reset_caches()
+        alloc_kib = measure_allocations(client_type, turns, tool_executor, router)
+        session_kib = measure_session_memory(client_type, turns, tool_executor, router)
+
+    return {
+        "turns": len(latencies),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+        "turns_per_s": round(len(latencies) / elapsed, 2),
+        "bytes_per_turn": round(wire_bytes / len(latencies)),
+        "alloc_peak_kib_per_turn": round(alloc_kib, 1),
+        "session_kib": round(session_kib, 1),
+        "prompt_eval_per_turn": round(prompt_eval_tokens / len(latencies)),
+        "prompt_cache_ratio": round(1 - prompt_eval_tokens / prompt_tokens, 3) if prompt_tokens else 0.0,
+        **upstream,
+        **({"fast_path_hit_ratio": round(router.stats()["hit_ratio"], 3)} if router else {}),
+        **({"prefetch_hit_ratio": round(prefetcher.stats()["hit_ratio"], 3)} if prefetcher else {}),
+    }
+
+
+def compare(results: Dict[str, Dict[str, Any]], baseline: Dict[str, Dict[str, Any]], tolerance: float) -> List[str]:
+    """Returns a description of every metric that regressed beyond `tolerance`."""
+    regressions = []
+    for case, metrics in results.items():
+        reference = baseline.get(case)
+        if not reference:
+            continue
+        for metric in HIGHER_IS_WORSE:
+            if reference.get(metric) and metrics[metric] > reference[metric] * (1 + tolerance):
+                regressions.append(f"{case} {metric}: {reference[metric]} -> {metrics[metric]}")
+        for metric in LOWER_IS_WORSE:
+            if reference.get(metric) and metrics[metric] < reference[metric] * (1 - tolerance):
+                regressions.append(f"{case} {metric}: {reference[metric]} -> {metrics[metric]}")
+    return regressions
+
+
+def print_table(results: Dict[str, Dict[str, Any]]) -> None:
+    columns = ("p50_ms", "p95_ms", "p99_ms", "turns_per_s", "bytes_per_turn", "alloc_peak_kib_per_turn",
+               "session_kib", "prompt_eval_per_turn", "model_requests", "weather_requests")
+    print(f"{'case':<30}" + "".join(f"{column:>25}" for column in columns))
+    for case, metrics in results.items():
+        print(f"{case:<30}" + "".join(f"{metrics[column]:>25}" for column in columns))
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Offline benchmark for the chatbot turn pipeline")
+    parser.add_argument("--clients", nargs="+", choices=sorted(CLIENTS), default=sorted(CLIENTS))
+    parser.add_argument("--scenarios", nargs="+", choices=sorted(SCENARIOS), default=sorted(SCENARIOS))
+    parser.add_argument("--sessions", type=int, default=20, help="Sessions per client and scenario.")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--llm-latency-ms", type=float, default=50)
+    parser.add_argument("--weather-latency-ms", type=float, default=20)
+    parser.add_argument("--token-latency-ms", type=float, default=0, help="Fake model decode time per token.")
+    parser.add_argument(
+        "--chatter-words", type=int, default=0,
+        help="Words the fake model adds after a JSON tool call, as small local models do.",
+    )
+    parser.add_argument(
+        "--prompt-token-latency-ms", type=float, default=0,
+        help="Fake model time per prompt token not covered by its prefix cache.",
+    )
+    parser.add_argument(
+        "--ollama-layout", choices=("stable", "sliding"), default="stable",
+        help="Prompt layout of the local client: fixed prefix with stepped eviction, or a window sliding every turn.",
+    )
+    parser.add_argument("--history-token-budget", type=int, help="Conversation window budget, to make it slide sooner.")
+    parser.add_argument("--fast-path", action="store_true", help="Route plain weather questions locally.")
+    parser.add_argument("--prefetch", action="store_true", help="Look up likely cities during the first model call.")
+    parser.add_argument("--output", help="Write the results as JSON to this file.")
+    parser.add_argument("--save-baseline", metavar="FILE", help="Store the results as the new baseline.")
+    parser.add_argument("--baseline", metavar="FILE", help="Compare against a stored baseline.")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative regression.")
+    args = parser.parse_args()
+
+    chat_server = FakeChatServer(
+        latency_s=args.llm_latency_ms / 1000, token_latency_s=args.token_latency_ms / 1000,
+        chatter_words=args.chatter_words, prompt_token_latency_s=args.prompt_token_latency_ms / 1000,
+    ).start()
+    meteo_server = FakeOpenMeteoServer(latency_s=args.weather_latency_ms / 1000).start()
+    try:
+        configure_endpoints(chat_server, meteo_server)
+        from clients import history, ollama_client
+
+        ollama_client.OLLAMA_STABLE_PREFIX = args.ollama_layout == "stable"
+        if args.history_token_budget:
+            history.CONVERSATION_TOKEN_BUDGET = args.history_token_budget
+        results = {
+            f"{client_type}/{scenario}": run_case(
+                client_type, scenario, args.sessions, args.concurrency, chat_server, meteo_server,
+                args.fast_path, args.prefetch,
+            )
+            for client_type in args.clients
+            for scenario in args.scenarios
+        }
+    finally:
+        chat_server.stop()
+        meteo_server.stop()
+
+    print_table(results)
+    for path in filter(None, (args.output, args.save_baseline)):
+        with open(path, "w", encoding="utf-8") as output_file:
+            json.dump(results, output_file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as baseline_file:
+            regressions = compare(results, json.load(baseline_file), args.tolerance)
+        if regressions:
+            print("\nRegressions beyond tolerance:")
+            for regression in regressions:
+                print(f"  {regression}")
+            return 1
+        print("\nNo regressions against baseline.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,139 @@
+# benchmarks/server_load.py
+"""
+Load test for the multi-session HTTP server. Starts the fake chat and
+Open-Meteo servers and a `ChatServer` pointed at them, opens many sessions,
+keeps most of them idle and drives turns through the rest concurrently.
+Reports turn latency percentiles, throughput, 503 rejections and the
+server's memory per idle session.
+
+    python -m benchmarks.server_load --sessions 2000 --active 64 --turns 4
+"""
+import argparse
+import asyncio
+import json
+import time
+import tracemalloc
+from typing import Any, Dict, List, Optional, Tuple
+
+from benchmarks.fake_servers import FakeChatServer, FakeOpenMeteoServer
+from benchmarks.run_benchmark import SCENARIOS, configure_endpoints, percentile
+from chat_server import ChatServer
+
+
+async def request(
+        host: str, port: int, method: str, path: str, body: Optional[Dict[str, Any]] = None
+) -> Tuple[int, List[Dict[str, Any]]]:
+    """Sends one request; returns the status and the JSON body, or the SSE events of a turn."""
+    reader, writer = await asyncio.open_connection(host, port)
+    payload = json.dumps(body).encode() if body is not None else b""
+    writer.write(
+        f"{method} {path} HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/json\r\n"
+        f"Content-Length: {len(payload)}\r\n\r\n".encode() + payload
+    )
+    await writer.drain()
+    raw = await reader.read()
+    writer.close()
+    head, _, content = raw.partition(b"\r\n\r\n")
+    status = int(head.split()[1])
+    if b"text/event-stream" in head:
+        events = [
+            json.loads(line[len(b"data: "):])
+            for line in content.splitlines() if line.startswith(b"data: ")
+        ]
+        return status, events
+    return status, [json.loads(content)] if content else []
+
+
+async def run_load(
+        host: str, port: int, sessions: int, active: int, turns: int, client_type: str, model: str,
+        stream: bool, fast_path: bool,
+) -> Dict[str, Any]:
+    prompts = [prompt for scenario in SCENARIOS.values() for prompt in scenario]
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    session_ids = []
+    for _ in range(sessions):
+        _, (created,) = await request(host, port, "POST", "/sessions", {
+            "client": client_type, "model": model, "stream": stream, "fast_path": fast_path,
+        })
+        session_ids.append(created["session_id"])
+    idle_bytes = (tracemalloc.get_traced_memory()[0] - before) / max(sessions, 1)
+    tracemalloc.stop()
+
+    latencies: List[float] = []
+    outcomes = {"done": 0, "error": 0, "rejected": 0}
+
+    async def converse(index: int) -> None:
+        session_id = session_ids[index]
+        for turn in range(turns):
+            start = time.perf_counter()
+            status, events = await request(host, port, "POST", f"/sessions/{session_id}/messages", {
+                "text": prompts[(index + turn) % len(prompts)],
+            })
+            if status == 503:
+                outcomes["rejected"] += 1
+                continue
+            latencies.append((time.perf_counter() - start) * 1000)
+            outcomes[events[-1]["type"] if events and events[-1]["type"] == "done" else "error"] += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(converse(index) for index in range(min(active, sessions))))
+    elapsed = time.perf_counter() - start
+
+    _, (health,) = await request(host, port, "GET", "/healthz")
+    return {
+        "sessions": sessions,
+        "active_sessions": min(active, sessions),
+        "idle_session_bytes": round(idle_bytes),
+        "turns": outcomes["done"],
+        "errors": outcomes["error"],
+        "rejected": outcomes["rejected"],
+        "turns_per_s": round(outcomes["done"] / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 0.50), 1),
+        "p95_ms": round(percentile(latencies, 0.95), 1),
+        "p99_ms": round(percentile(latencies, 0.99), 1),
+        "server": health,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Load test for the multi-session chat server")
+    parser.add_argument("--client", choices=["gemini-openai", "gemma-openai"], default="gemini-openai")
+    parser.add_argument("--sessions", type=int, default=1000, help="Sessions to open.")
+    parser.add_argument("--active", type=int, default=32, help="Sessions that send messages concurrently.")
+    parser.add_argument("--turns", type=int, default=4, help="Messages per active session.")
+    parser.add_argument("--latency-ms", type=float, default=50, help="Fake model latency per request.")
+    parser.add_argument("--max-pending-turns", type=int, help="Override the server's admission limit.")
+    parser.add_argument("--stream", action="store_true")
+    parser.add_argument("--fast-path", action="store_true")
+    args = parser.parse_args()
+
+    chat_server = FakeChatServer(latency_s=args.latency_ms / 1000).start()
+    meteo_server = FakeOpenMeteoServer().start()
+    configure_endpoints(chat_server, meteo_server)
+    model = "gemma3:1b" if args.client == "gemma-openai" else "gemini-2.5-flash"
+
+    async def run() -> Dict[str, Any]:
+        options = {"max_sessions": args.sessions}
+        if args.max_pending_turns:
+            options["max_pending_turns"] = args.max_pending_turns
+        server = ChatServer(args.client, model, **options)
+        host, port = await server.start("127.0.0.1", 0)
+        try:
+            return await run_load(
+                host, port, args.sessions, args.active, args.turns, args.client, model,
+                args.stream, args.fast_path,
+            )
+        finally:
+            await server.drain()
+
+    try:
+        print(json.dumps(asyncio.run(run()), indent=2))
+    finally:
+        chat_server.stop()
+        meteo_server.stop()
+
+
+if __name__ == "__main__":
+    main()
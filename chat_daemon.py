@@ -0,0 +1,193 @@
+# chat_daemon.py
+"""
+Optional daemon mode. `serve` runs a long-lived process that keeps the SDKs
+imported and the HTTP pools, caches and fast-path router warm, and accepts
+chat sessions over a Unix socket. `attach` is the thin client behind
+`--attach`: it imports only the standard library, so the first prompt
+appears in tens of milliseconds.
+
+The protocol is newline-delimited JSON. A session starts with
+{"type": "hello", "client": ..., "model": ..., "stream": ..., "fast_path": ..., "prefetch": ...}
+and then sends {"type": "input", "text": ...} per turn. The daemon confirms
+the session with "ready" and answers each turn with "tool_calls", "chunk"
+and "message" events and a final "done" (or "error").
+"""
+import io
+import json
+import os
+import socket
+import socketserver
+import sys
+from typing import Any, Callable, Dict, Optional
+
+CHATBOT_SOCKET = os.environ.get(
+    "CHATBOT_SOCKET",
+    os.path.join(os.path.expanduser("~"), ".cache", "gemini-function-calling", "chatbot.sock"),
+)
+
+def _run_session(reader, send: Callable[[Dict[str, Any]], None], executor, router, prefetcher) -> None:
+    from conversation import get_api_client, run_turn_events
+
+    hello = json.loads(reader.readline() or "{}")
+    if hello.get("type") != "hello":
+        send({"type": "error", "message": "expected a hello message"})
+        return
+    client = get_api_client(hello["client"], hello["model"])
+    stream = bool(hello.get("stream"))
+    session_router = router if hello.get("fast_path") else None
+    session_prefetcher = prefetcher if hello.get("prefetch") else None
+    send({"type": "ready", "pid": os.getpid()})
+
+    for line in reader:
+        request = json.loads(line)
+        if request.get("type") != "input":
+            continue
+        try:
+            run_turn_events(
+                client, request["text"], executor, send,
+                stream=stream, router=session_router, prefetcher=session_prefetcher,
+            )
+            send({"type": "done"})
+        except Exception as e:
+            send({"type": "error", "message": f"{type(e).__name__}: {e}"})
+
+
+def serve(socket_path: str = CHATBOT_SOCKET, client_type: Optional[str] = None, model_type: Optional[str] = None) -> None:
+    """
+    Serves chat sessions on `socket_path` until interrupted. Each connection
+    is one conversation with its own client; SDK imports, the HTTP transport,
+    the weather caches and the fast-path router are shared by all of them.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    from conversation import MAX_TOOL_WORKERS, get_api_client
+    from tools.http_transport import get_transport
+    from tools.weather_prefetch import WeatherPrefetcher
+    from tools.weather_router import FastPathRouter
+
+    if client_type and model_type:
+        # Importing the SDK and building one client up front makes the first session as fast as later ones.
+        get_api_client(client_type, model_type)
+    get_transport()
+    executor = ThreadPoolExecutor(max_workers=MAX_TOOL_WORKERS * 4)
+    router = FastPathRouter()
+    prefetcher = WeatherPrefetcher()
+
+    class SessionHandler(socketserver.StreamRequestHandler):
+        def handle(self):
+            reader = io.TextIOWrapper(self.rfile, encoding="utf-8")
+
+            def send(event: Dict[str, Any]) -> None:
+                self.wfile.write((json.dumps(event, ensure_ascii=False) + "\n").encode("utf-8"))
+                self.wfile.flush()
+
+            try:
+                _run_session(reader, send, executor, router, prefetcher)
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+
+    os.makedirs(os.path.dirname(socket_path) or ".", exist_ok=True)
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+    server = socketserver.ThreadingUnixStreamServer(socket_path, SessionHandler)
+    server.daemon_threads = True
+    os.chmod(socket_path, 0o600)
+    print(f"Chatbot daemon listening on {socket_path} (pid {os.getpid()})", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        executor.shutdown(wait=False)
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        stats = router.stats()
+        if stats["queries"]:
+            print(f"Fast path: {stats['hits']}/{stats['queries']} turns", flush=True)
+        stats = prefetcher.stats()
+        if stats["turns"]:
+            print(f"Prefetch: {stats['paid_off_turns']}/{stats['turns']} speculative turns paid off", flush=True)
+
+
+# ANSI equivalents of the prompt_toolkit colors used by the interactive chatbot.
+_BOT = "\033[1;32md[o_0]b\033[0m"
+_TOOL = "\033[34m[Tool: {}]: \033[0m"
+_YOU = "\033[1;33mYou: \033[0m"
+
+
+def attach(
+        socket_path: str = CHATBOT_SOCKET,
+        client_type: str = "gemini-genai",
+        model_type: str = "gemini-2.5-flash-lite-preview-06-17",
+        stream: bool = False,
+        fast_path: bool = False,
+        prefetch: bool = False,
+) -> int:
+    """Runs an interactive session against a running daemon using only the standard library."""
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        connection.connect(socket_path)
+    except OSError as e:
+        print(f"Cannot reach the chatbot daemon at {socket_path}: {e}. Start it with --daemon.", file=sys.stderr)
+        return 1
+    events = connection.makefile("r", encoding="utf-8")
+    writer = connection.makefile("w", encoding="utf-8")
+
+    def send(message: Dict[str, Any]) -> None:
+        writer.write(json.dumps(message) + "\n")
+        writer.flush()
+
+    send({
+        "type": "hello", "client": client_type, "model": model_type, "stream": stream, "fast_path": fast_path,
+        "prefetch": prefetch,
+    })
+    print(f"\033[1mMulti-model Chatbot {_BOT}\033[1m (Client: {client_type}, model: {model_type}, attached; "
+          f"type 'exit' or press 'Ctrl + D' to quit)\033[0m")
+    print("\033[1m" + "=" * 60 + "\033[0m")
+
+    while True:
+        try:
+            user_input = input(_YOU).strip()
+        except KeyboardInterrupt:
+            print()
+            continue
+        except EOFError:
+            break
+        if user_input.lower() in ("exit", "quit"):
+            break
+        if not user_input:
+            continue
+
+        send({"type": "input", "text": user_input})
+        streaming = False
+        for line in events:
+            event = json.loads(line)
+            if event["type"] == "tool_calls":
+                for call in event["calls"]:
+                    print(f"{_BOT}{_TOOL.format('None')}I am gonna call {call['name']} tool with arguments: "
+                          f"{json.dumps(call['arguments'])}")
+            elif event["type"] == "chunk":
+                if not streaming:
+                    print(f"{_BOT}{_TOOL.format(event['tool'])}", end="")
+                    streaming = True
+                print(event["text"], end="", flush=True)
+            elif event["type"] == "message":
+                if streaming:
+                    print()
+                    streaming = False
+                print(f"{_BOT}{_TOOL.format(event['tool'])}{event['text']}")
+            elif event["type"] == "error":
+                print(f"\033[31m{event['message']}\033[0m")
+                break
+            elif event["type"] == "done":
+                # "ready" and any other informational events need no output.
+                if streaming:
+                    print()
+                break
+        else:
+            print("\033[31mThe daemon closed the connection.\033[0m")
+            return 1
+
+    connection.close()
+    return 0
@@ -0,0 +1,336 @@
+# chat_server.py
+"""
+Multi-session HTTP server. Each session keeps its own client and history;
+replies stream back as Server-Sent Events. Connections, sessions and
+admission control live on one asyncio loop, so idle sessions cost a small
+object each. Model calls and tools are blocking, so turns run on a bounded
+thread pool and their events are handed back to the loop.
+
+    POST   /sessions                 {"client": ..., "model": ..., "stream": ..., "fast_path": ..., "prefetch": ...}
+    POST   /sessions/{id}/messages   {"text": ...}   -> text/event-stream
+    DELETE /sessions/{id}
+    GET    /healthz
+
+A turn streams "tool_calls", "chunk" and "message" events and ends with
+"done" or "error", the same events the daemon sends. Turns of one session
+run one at a time; when too many turns are queued the server answers 503
+with Retry-After instead of queueing more.
+"""
+import asyncio
+import json
+import os
+import secrets
+import signal
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional, Tuple
+
+CHAT_SERVER_MAX_SESSIONS = int(os.environ.get("CHAT_SERVER_MAX_SESSIONS", "10000"))
+# Turns running or waiting for a worker or for their session; beyond this, new turns get 503.
+CHAT_SERVER_MAX_PENDING_TURNS = int(os.environ.get("CHAT_SERVER_MAX_PENDING_TURNS", "64"))
+CHAT_SERVER_TURN_WORKERS = int(os.environ.get("CHAT_SERVER_TURN_WORKERS", "16"))
+CHAT_SERVER_IDLE_TIMEOUT = float(os.environ.get("CHAT_SERVER_IDLE_TIMEOUT", "900"))
+CHAT_SERVER_DRAIN_TIMEOUT = float(os.environ.get("CHAT_SERVER_DRAIN_TIMEOUT", "30"))
+MAX_REQUEST_BYTES = 64 * 1024
+
+_REASONS = {200: "OK", 201: "Created", 204: "No Content", 400: "Bad Request", 404: "Not Found",
+            405: "Method Not Allowed", 409: "Conflict", 413: "Payload Too Large", 503: "Service Unavailable"}
+
+
+class HttpError(Exception):
+    def __init__(self, status: int, message: str, retry_after: Optional[int] = None):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+
+class Session:
+    """One conversation. The client is created on the first message, so sessions that never talk stay cheap."""
+
+    __slots__ = (
+        "id", "client_type", "model_type", "stream", "fast_path", "prefetch", "client", "lock", "last_active", "turns",
+    )
+
+    def __init__(
+            self, session_id: str, client_type: str, model_type: str, stream: bool, fast_path: bool, prefetch: bool
+    ):
+        self.id = session_id
+        self.client_type = client_type
+        self.model_type = model_type
+        self.stream = stream
+        self.fast_path = fast_path
+        self.prefetch = prefetch
+        self.client = None
+        self.lock = asyncio.Lock()
+        self.last_active = time.monotonic()
+        self.turns = 0
+
+
+class ChatServer:
+    """Sessions, admission control, idle eviction and graceful drain around the shared turn pipeline."""
+
+    def __init__(
+            self,
+            client_type: str = "gemini-genai",
+            model_type: str = "gemini-2.5-flash-lite-preview-06-17",
+            max_sessions: int = CHAT_SERVER_MAX_SESSIONS,
+            max_pending_turns: int = CHAT_SERVER_MAX_PENDING_TURNS,
+            turn_workers: int = CHAT_SERVER_TURN_WORKERS,
+            idle_timeout: float = CHAT_SERVER_IDLE_TIMEOUT,
+            drain_timeout: float = CHAT_SERVER_DRAIN_TIMEOUT,
+    ):
+        from conversation import MAX_TOOL_WORKERS
+        from tools.weather_prefetch import WeatherPrefetcher
+        from tools.weather_router import FastPathRouter
+
+        self.client_type = client_type
+        self.model_type = model_type
+        self.max_sessions = max_sessions
+        self.max_pending_turns = max_pending_turns
+        self.idle_timeout = idle_timeout
+        self.drain_timeout = drain_timeout
+        self.sessions: Dict[str, Session] = {}
+        self.router = FastPathRouter()
+        self.prefetcher = WeatherPrefetcher()
+        # Turns and tools get separate pools: a turn blocks on its tools, so sharing one could deadlock.
+        self.turn_executor = ThreadPoolExecutor(max_workers=turn_workers, thread_name_prefix="turn")
+        self.tool_executor = ThreadPoolExecutor(max_workers=MAX_TOOL_WORKERS * 4, thread_name_prefix="tool")
+        self.pending_turns = 0
+        self.draining = False
+        self.counters = {"turns": 0, "errors": 0, "rejected": 0, "evicted": 0}
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._idle_turns = asyncio.Event()
+        self._idle_turns.set()
+
+    async def start(self, host: str, port: int) -> Tuple[str, int]:
+        """Starts listening and the idle-session sweeper; returns the bound address."""
+        self._server = await asyncio.start_server(self._handle_connection, host, port, limit=MAX_REQUEST_BYTES)
+        asyncio.get_running_loop().create_task(self._evict_idle_sessions())
+        return self._server.sockets[0].getsockname()[:2]
+
+    async def drain(self) -> None:
+        """Stops accepting connections and new turns, then waits up to `drain_timeout` for running turns."""
+        self.draining = True
+        if self._server:
+            self._server.close()
+        try:
+            await asyncio.wait_for(self._idle_turns.wait(), self.drain_timeout)
+        except asyncio.TimeoutError:
+            pass
+        self.turn_executor.shutdown(wait=False, cancel_futures=True)
+        self.tool_executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> Dict[str, Any]:
+        from clients.scheduler import SCHEDULER
+        from tools.weather_tool import forecast_batch_stats, single_flight_stats
+
+        return {
+            "sessions": len(self.sessions),
+            "active_sessions": sum(1 for session in self.sessions.values() if session.client is not None),
+            "pending_turns": self.pending_turns,
+            "draining": self.draining,
+            **self.counters,
+            "fast_path": self.router.stats(),
+            "prefetch": self.prefetcher.stats(),
+            "single_flight": single_flight_stats(),
+            "forecast_batches": forecast_batch_stats(),
+            "scheduler": SCHEDULER.stats(),
+        }
+
+    async def _evict_idle_sessions(self) -> None:
+        interval = max(1.0, self.idle_timeout / 4)
+        while not self.draining:
+            await asyncio.sleep(interval)
+            cutoff = time.monotonic() - self.idle_timeout
+            for session in list(self.sessions.values()):
+                if session.last_active < cutoff and not session.lock.locked():
+                    del self.sessions[session.id]
+                    self.counters["evicted"] += 1
+
+    # HTTP plumbing
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            try:
+                method, path, body = await self._read_request(reader)
+                await self._dispatch(method, path, body, writer)
+            except HttpError as e:
+                headers = {"Retry-After": str(e.retry_after)} if e.retry_after else {}
+                await self._send_json(writer, e.status, {"error": str(e)}, headers)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _read_request(reader: asyncio.StreamReader) -> Tuple[str, str, Dict[str, Any]]:
+        try:
+            request_line = (await reader.readline()).decode("latin-1").split()
+            headers = {}
+            while True:
+                line = (await reader.readline()).decode("latin-1")
+                if line in ("\r\n", "\n", ""):
+                    break
+                name, _, value = line.partition(":")
+                headers[name.strip().lower()] = value.strip()
+        except (asyncio.LimitOverrunError, ValueError):
+            raise HttpError(413, "request headers too large")
+        if len(request_line) != 3:
+            raise HttpError(400, "malformed request line")
+        length = headers.get("content-length", "0")
+        if not length.isdigit():
+            raise HttpError(400, "invalid Content-Length")
+        length = int(length)
+        if length > MAX_REQUEST_BYTES:
+            raise HttpError(413, "request body too large")
+        raw = await reader.readexactly(length) if length else b""
+        try:
+            body = json.loads(raw) if raw else {}
+        except ValueError:
+            raise HttpError(400, "request body is not valid JSON")
+        if not isinstance(body, dict):
+            raise HttpError(400, "request body must be a JSON object")
+        return request_line[0].upper(), request_line[1].split("?")[0].rstrip("/"), body
+
+    @staticmethod
+    async def _send_json(
+            writer: asyncio.StreamWriter, status: int, body: Any, headers: Optional[Dict[str, str]] = None
+    ) -> None:
+        payload = json.dumps(body).encode() if body is not None else b""
+        head = [f"HTTP/1.1 {status} {_REASONS.get(status, '')}", "Connection: close",
+                f"Content-Length: {len(payload)}"]
+        if payload:
+            head.append("Content-Type: application/json")
+        head.extend(f"{name}: {value}" for name, value in (headers or {}).items())
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode() + payload)
+        await writer.drain()
+
+    async def _dispatch(self, method: str, path: str, body: Dict[str, Any], writer: asyncio.StreamWriter) -> None:
+        parts = path.strip("/").split("/")
+        if parts == ["healthz"] and method == "GET":
+            await self._send_json(writer, 503 if self.draining else 200, self.stats())
+        elif parts == ["sessions"] and method == "POST":
+            await self._send_json(writer, 201, {"session_id": self._create_session(body)})
+        elif len(parts) == 2 and parts[0] == "sessions" and method == "DELETE":
+            if self.sessions.pop(parts[1], None) is None:
+                raise HttpError(404, "unknown session")
+            await self._send_json(writer, 204, None)
+        elif len(parts) == 3 and parts[0] == "sessions" and parts[2] == "messages" and method == "POST":
+            session = self.sessions.get(parts[1])
+            if session is None:
+                raise HttpError(404, "unknown session")
+            text = body.get("text")
+            if not isinstance(text, str) or not text.strip():
+                raise HttpError(400, "'text' must be a non-empty string")
+            await self._stream_turn(session, text.strip(), writer)
+        elif parts[0] in ("healthz", "sessions"):
+            raise HttpError(405, "method not allowed")
+        else:
+            raise HttpError(404, "not found")
+
+    def _create_session(self, body: Dict[str, Any]) -> str:
+        if self.draining:
+            raise HttpError(503, "server is shutting down")
+        if len(self.sessions) >= self.max_sessions:
+            self.counters["rejected"] += 1
+            raise HttpError(503, "too many sessions", retry_after=5)
+        session_id = secrets.token_urlsafe(16)
+        self.sessions[session_id] = Session(
+            session_id,
+            body.get("client", self.client_type),
+            body.get("model", self.model_type),
+            bool(body.get("stream")),
+            bool(body.get("fast_path")),
+            bool(body.get("prefetch")),
+        )
+        return session_id
+
+    # Turns
+
+    async def _stream_turn(self, session: Session, text: str, writer: asyncio.StreamWriter) -> None:
+        if self.draining:
+            raise HttpError(503, "server is shutting down")
+        if self.pending_turns >= self.max_pending_turns:
+            self.counters["rejected"] += 1
+            raise HttpError(503, "server is busy", retry_after=1)
+
+        self.pending_turns += 1
+        self._idle_turns.clear()
+        try:
+            writer.write(("HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nCache-Control: no-cache\r\n"
+                          "Connection: close\r\n\r\n").encode())
+            async with session.lock:
+                session.last_active = time.monotonic()
+                events: "asyncio.Queue[Dict[str, Any]]" = asyncio.Queue()
+                turn = asyncio.get_running_loop().run_in_executor(
+                    self.turn_executor, self._run_turn, session, text, asyncio.get_running_loop(), events
+                )
+                connected = True
+                while True:
+                    event = await events.get()
+                    if connected:
+                        # A client that goes away does not cancel the turn; its history stays consistent.
+                        try:
+                            writer.write(f"event: {event['type']}\ndata: {json.dumps(event)}\n\n".encode())
+                            await writer.drain()
+                        except ConnectionError:
+                            connected = False
+                    if event["type"] in ("done", "error"):
+                        break
+                if await turn:
+                    session.turns += 1
+                    self.counters["turns"] += 1
+                else:
+                    self.counters["errors"] += 1
+                session.last_active = time.monotonic()
+        finally:
+            self.pending_turns -= 1
+            if not self.pending_turns:
+                self._idle_turns.set()
+
+    def _run_turn(self, session: Session, text: str, loop: asyncio.AbstractEventLoop, events: asyncio.Queue) -> bool:
+        """Runs on a turn worker; every event, including the closing one, is handed to the loop's queue."""
+        from conversation import get_api_client, run_turn_events
+
+        def send(event: Dict[str, Any]) -> None:
+            loop.call_soon_threadsafe(events.put_nowait, event)
+
+        try:
+            if session.client is None:
+                session.client = get_api_client(session.client_type, session.model_type)
+            run_turn_events(
+                session.client, text, self.tool_executor, send,
+                stream=session.stream, router=self.router if session.fast_path else None,
+                prefetcher=self.prefetcher if session.prefetch else None,
+            )
+            send({"type": "done"})
+            return True
+        except Exception as e:
+            send({"type": "error", "message": f"{type(e).__name__}: {e}"})
+            return False
+
+
+def serve(host: str, port: int, client_type: str, model_type: str) -> None:
+    """Runs a `ChatServer` until SIGINT or SIGTERM, then drains it."""
+    from conversation import get_api_client
+    from tools.http_transport import get_transport
+
+    async def run() -> None:
+        server = ChatServer(client_type, model_type)
+        # Importing the SDK up front keeps the first session's first turn as fast as later ones.
+        await asyncio.get_running_loop().run_in_executor(None, get_api_client, client_type, model_type)
+        get_transport()
+        bound_host, bound_port = await server.start(host, port)
+        print(f"Chat server listening on http://{bound_host}:{bound_port} (pid {os.getpid()})", flush=True)
+
+        stop = asyncio.Event()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            asyncio.get_running_loop().add_signal_handler(sig, stop.set)
+        await stop.wait()
+        print(f"Draining {server.pending_turns} turn(s)...", flush=True)
+        await server.drain()
+        stats = server.stats()
+        print(f"Served {stats['turns']} turns; rejected {stats['rejected']}, evicted {stats['evicted']} sessions",
+              flush=True)
+
+    asyncio.run(run())
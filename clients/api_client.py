@@ -1,6 +1,6 @@
 # clients/api_client.py
 from abc import ABC, abstractmethod
-from typing import Any, Dict, Optional
+from typing import Any, Dict, Iterator, List, Optional
 
 class ApiClient(ABC):
     """Abstract base class for API clients."""
@@ -11,20 +11,94 @@ class ApiClient(ABC):
         self.history = []
 
     @abstractmethod
-    def generate_content(self, user_input: str, function_execution_result: dict | None) -> None:
+    def generate_content(
+            self, user_input: Optional[str], function_execution_results: Optional[List[Dict[str, Any]]] = None
+    ) -> None:
         """
         Sends user input to the model and stores the response.
+        When `function_execution_results` is given, every result of the last
+        response's function calls is sent back in a single request. Each entry
+        is a dictionary with the originating call's 'id' and 'name' plus the
+        tool's 'result'.
         """
         pass
 
+    def stream_content(
+            self, user_input: Optional[str], function_execution_results: Optional[List[Dict[str, Any]]] = None
+    ) -> Iterator[str]:
+        """
+        Streaming variant of `generate_content` that yields text chunks as the
+        model produces them. Function-call fragments are assembled along the
+        way, so once the iterator is exhausted the client is in the same state
+        as after `generate_content`. Clients without native streaming fall
+        back to yielding the complete text response once.
+        """
+        self.generate_content(user_input, function_execution_results)
+        text = self.get_text_response()
+        if text:
+            yield text
+
     @abstractmethod
-    def get_function_call(self) -> Optional[Dict[str, Any]]:
+    def inject_function_calls(
+            self,
+            user_input: Optional[str],
+            function_calls: List[Dict[str, Any]],
+            function_execution_results: Optional[List[Dict[str, Any]]] = None,
+    ) -> None:
+        """
+        Records `user_input` (or `function_execution_results`) and a reply
+        requesting `function_calls` as if the model had produced it, without
+        calling the model. Used when the calls are decided elsewhere; the
+        results are then sent with `generate_content` as usual. Each call is
+        a dictionary with 'id', 'name' and 'arguments'.
+        """
+        pass
+
+    @abstractmethod
+    def inject_text_response(
+            self,
+            user_input: Optional[str],
+            function_execution_results: Optional[List[Dict[str, Any]]],
+            text: str,
+    ) -> None:
+        """
+        Counterpart of `inject_function_calls` for text replies: records the
+        input exactly as `generate_content` would and `text` as the model's
+        answer, without calling the model.
+        """
+        pass
+
+    @abstractmethod
+    def fork(self) -> "ApiClient":
         """
-        Extracts a function call from the last response, if present.
-        Should return a dictionary with 'name' and 'arguments'.
+        A copy with its own conversation state that shares the SDK client, so
+        a request can be tried on the copy and the copy kept or dropped.
         """
         pass
 
+    def state_fingerprint(self) -> Optional[str]:
+        """
+        A stable description of everything that determines the next reply
+        apart from the new input: model, instructions, tool schema and the
+        current conversation window. None means replies cannot be cached.
+        """
+        return None
+
+    @abstractmethod
+    def get_function_calls(self) -> List[Dict[str, Any]]:
+        """
+        Extracts every function call from the last response, in order.
+        Each call is a dictionary with 'id', 'name' and 'arguments'.
+        """
+        pass
+
+    def get_function_call(self) -> Optional[Dict[str, Any]]:
+        """
+        Returns the first function call from the last response, if present.
+        """
+        function_calls = self.get_function_calls()
+        return function_calls[0] if function_calls else None
+
     @abstractmethod
     def get_text_response(self) -> Optional[str]:
         """
@@ -1,36 +1,67 @@
 # clients/genai_client.py
+import copy
+import functools
+import json
 import os
-from typing import Dict, Any, Optional
-from collections import deque
+import time
+from typing import Dict, Any, Iterator, List, Optional
 
 from google.genai.client import Client
 from google.genai.types import (
     Tool,
     Content,
     Part,
+    FunctionCall,
     FunctionResponse,
     GenerateContentConfig,
 )
 
+import tracing
+from token_estimate import estimate_tokens
 from clients.api_client import ApiClient
-from tools.weather_tool import WEATHER_TOOL_INSTRUCTIONS
-
-CONVERSATION_WINDOW_SIZE = 10
-
-WEATHER_TOOL_GENAI = {
-    "name": "get_current_weather",
-    "description": "🌡️Gets the current temperature for a given location.",
-    "parameters": {
-        "type": "object",
-        "properties": {
-            "location": {
-                "type": "string",
-                "description": "The city name, e.g. New York",
-            },
-        },
-        "required": ["location"],
-    },
-}
+from clients.history import ConversationHistory
+from clients.messages import Message, ToolCall, tool_result
+from clients.scheduler import SCHEDULER, started
+from tools.registry import TOOL_REGISTRY
+
+@functools.lru_cache(maxsize=None)
+def _shared_sdk_client(api_key: Optional[str]) -> Client:
+    # One SDK client, and so one connection pool, per API key for all sessions in the process.
+    return Client(api_key=api_key)
+
+
+def _to_genai(message: Message) -> Content:
+    if message.tool_results:
+        return Content(
+            parts=[
+                Part(
+                    function_response=FunctionResponse(
+                        id=result.id, name=result.name, response={"result": json.loads(result.content)}
+                    )
+                )
+                for result in message.tool_results
+            ],
+            role="tool",
+        )
+    parts = [Part(text=message.text)] if message.text else []
+    parts.extend(
+        Part(function_call=FunctionCall(id=call.id, name=call.name, args=call.arguments))
+        for call in message.tool_calls
+    )
+    return Content(parts=parts, role="model" if message.role == "assistant" else message.role)
+
+
+def _from_genai(content: Content) -> Message:
+    # The reply keeps the Content it arrived in, so parts the record has no field for are sent back unchanged.
+    parts = content.parts or []
+    return Message(
+        "assistant",
+        "".join(part.text for part in parts if part.text) or None,
+        tuple(
+            ToolCall(part.function_call.id, part.function_call.name, dict(part.function_call.args or {}))
+            for part in parts if part.function_call
+        ),
+    ).with_encoding("genai", content)
 
 
 class GenAIClient(ApiClient):
@@ -39,70 +70,152 @@ class GenAIClient(ApiClient):
     def __init__(self, model: str):
         super().__init__(model)
         api_key = os.environ.get("GEMINI_API_KEY")
-        self.client = Client(api_key=api_key)
-        self.history = deque(maxlen=CONVERSATION_WINDOW_SIZE)
-        tool = Tool(function_declarations=[WEATHER_TOOL_GENAI])
+        self.client = _shared_sdk_client(api_key)
+        self.history = ConversationHistory(describe=Message.describe)
+        self._last_message: Optional[Message] = None
+        self.prompt_tokens = 0
+        self.instructions = TOOL_REGISTRY.instructions()
+        tool = Tool(function_declarations=TOOL_REGISTRY.schemas("genai"))
         self.config = GenerateContentConfig(
             tools=[tool],
-            system_instruction=WEATHER_TOOL_INSTRUCTIONS
+            system_instruction=self.instructions
         )
 
-    def generate_content(
-            self, user_input: Optional[str], function_execution_result: Optional[dict] = None
-    ) -> None:
-        if function_execution_result:
-            function_call = self.get_function_call()
-            if not function_call:
-                return
-
-            function_name = function_call.get("name")
-            function_response = FunctionResponse(
-                name=function_name,
-                response={"result": function_execution_result},
-            )
-
-            if self._last_response and self._last_response.candidates:
-                 self.history.append(self._last_response.candidates[0].content)
+    def _append_input(
+            self, user_input: Optional[str], function_execution_results: Optional[List[Dict[str, Any]]]
+    ) -> List[Content]:
+        if function_execution_results:
+            if self._last_message:
+                self.history.append(self._last_message)
 
             self.history.append(
-                Content(
-                    parts=[Part(function_response=function_response)],
-                    role="tool",
-                )
+                Message("tool", tool_results=tuple(tool_result(result) for result in function_execution_results))
             )
         elif user_input:
-            self.history.append(Content(parts=[Part(text=user_input)], role="user"))
-
-        contents_to_send = list(self.history)
+            self.history.start_turn(Message("user", user_input))
 
-        self._last_response = self.client.models.generate_content(
-            model=self.model,
-            contents=contents_to_send,
-            config=self.config,
+        # Turns evicted from the window survive as a summary in the system instruction.
+        summary_block = self.history.summary_block()
+        self.config.system_instruction = (
+            f"{self.instructions}\n\n{summary_block}" if summary_block else self.instructions
         )
+        self.prompt_tokens = estimate_tokens(self.config.system_instruction) + self.history.tokens
+        return [message.encode("genai", _to_genai) for message in self.history]
 
-        part = self._last_response.candidates[0].content.parts[0]
-        if not part.function_call:
-             self.history.append(self._last_response.candidates[0].content)
+    def _record_response(self, message: Optional[Message]) -> None:
+        self._last_message = message
+        # Function-call turns are added to history together with their results.
+        if message and not message.tool_calls:
+            self.history.append(message)
 
-
-    def get_function_call(self) -> Optional[Dict[str, Any]]:
-        if self._last_response and self._last_response.candidates:
-            part = self._last_response.candidates[0].content.parts[0]
-            if part.function_call:
-                return {
-                    "name": part.function_call.name,
-                    "arguments": dict(part.function_call.args),
-                    "description": WEATHER_TOOL_GENAI.get("description"),
-                }
-        return None
+    def generate_content(
+            self, user_input: Optional[str], function_execution_results: Optional[List[Dict[str, Any]]] = None
+    ) -> None:
+        contents_to_send = self._append_input(user_input, function_execution_results)
+
+        with tracing.span("llm.generate_content", provider="genai", model=self.model) as span:
+            response = SCHEDULER.call(
+                "gemini", self.model, self.prompt_tokens,
+                lambda: self.client.models.generate_content(
+                    model=self.model,
+                    contents=contents_to_send,
+                    config=self.config,
+                ),
+            )
+            self._record_usage(span, response)
+
+        candidates = response.candidates
+        self._record_response(_from_genai(candidates[0].content) if candidates and candidates[0].content else None)
+
+    def stream_content(
+            self, user_input: Optional[str], function_execution_results: Optional[List[Dict[str, Any]]] = None
+    ) -> Iterator[str]:
+        contents_to_send = self._append_input(user_input, function_execution_results)
+
+        text_parts: List[str] = []
+        function_call_parts: List[Part] = []
+        last_chunk = None
+        with tracing.span("llm.stream_content", provider="genai", model=self.model) as span:
+            start = time.perf_counter()
+            # The SDK sends the request on the first pull, so that happens inside the scheduled call.
+            stream = SCHEDULER.call(
+                "gemini", self.model, self.prompt_tokens,
+                lambda: started(
+                    self.client.models.generate_content_stream(
+                        model=self.model,
+                        contents=contents_to_send,
+                        config=self.config,
+                    )
+                ),
+            )
+            for chunk in stream:
+                last_chunk = chunk
+                if not (chunk.candidates and chunk.candidates[0].content):
+                    continue
+                for part in chunk.candidates[0].content.parts or []:
+                    if part.function_call:
+                        function_call_parts.append(part)
+                    elif part.text:
+                        if not text_parts:
+                            span.set(time_to_first_token_ms=round((time.perf_counter() - start) * 1000, 1))
+                        text_parts.append(part.text)
+                        yield part.text
+            if last_chunk is not None:
+                self._record_usage(span, last_chunk)
+
+        parts = ([Part(text="".join(text_parts))] if text_parts else []) + function_call_parts
+        self._record_response(_from_genai(Content(role="model", parts=parts)) if parts else None)
+
+    @staticmethod
+    def _record_usage(span, response) -> None:
+        usage = response.usage_metadata
+        if usage:
+            span.set(prompt_tokens=usage.prompt_token_count, completion_tokens=usage.candidates_token_count)
+
+    def inject_function_calls(
+            self,
+            user_input: Optional[str],
+            function_calls: List[Dict[str, Any]],
+            function_execution_results: Optional[List[Dict[str, Any]]] = None,
+    ) -> None:
+        self._append_input(user_input, function_execution_results)
+        self._record_response(Message("assistant", tool_calls=tuple(
+            ToolCall(call["id"], call["name"], call["arguments"]) for call in function_calls
+        )))
+
+    def inject_text_response(
+            self,
+            user_input: Optional[str],
+            function_execution_results: Optional[List[Dict[str, Any]]],
+            text: str,
+    ) -> None:
+        self._append_input(user_input, function_execution_results)
+        self._record_response(Message("assistant", text))
+
+    def fork(self) -> "GenAIClient":
+        clone = copy.copy(self)
+        clone.history = self.history.copy()
+        # The system instruction is rewritten on every request, so each copy needs its own config.
+        clone.config = self.config.model_copy()
+        return clone
+
+    def state_fingerprint(self) -> Optional[str]:
+        return json.dumps([
+            self.model, self.instructions, TOOL_REGISTRY.serialized("genai"), self.history.fingerprint()
+        ])
+
+    def get_function_calls(self) -> List[Dict[str, Any]]:
+        if not self._last_message:
+            return []
+        return [
+            {
+                "id": call.id,
+                "name": call.name,
+                "arguments": dict(call.arguments),
+                "description": TOOL_REGISTRY.description(call.name),
+            }
+            for call in self._last_message.tool_calls
+        ]
 
     def get_text_response(self) -> Optional[str]:
-        if (
-                self._last_response
-                and self._last_response.candidates
-                and self._last_response.candidates[0].content.parts
-                and self._last_response.candidates[0].content.parts[0].text
-        ):
-            return self._last_response.candidates[0].content.parts[0].text
-        return ""
+        return (self._last_message.text or "") if self._last_message else ""
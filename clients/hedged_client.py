@@ -0,0 +1,278 @@
+# clients/hedged_client.py
+"""
+Composite client that hedges and fails over across several `ApiClient`s.
+Each request goes to the first (primary) client. If it has not produced
+anything by the hedge delay, the same request is also sent to the next
+client, and whichever answers first wins. If a request fails, the next
+client is tried. The primary's recent latencies set the hedge delay: it is
+their `percentile`, so only the slowest requests are hedged.
+
+Every attempt runs on a fork of its client, so a losing or failed attempt
+leaves no trace. The winner's fork takes its client's place, and every
+other client has the winning reply recorded as if it had produced it, so
+all histories stay the same and any client can serve the next request.
+"""
+import contextvars
+import os
+import queue
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Iterator, List, Optional
+
+from clients.api_client import ApiClient
+
+MODEL_HEDGE_PERCENTILE = float(os.environ.get("MODEL_HEDGE_PERCENTILE", "0.95"))
+# Used until enough primary latencies have been observed.
+MODEL_HEDGE_DELAY = float(os.environ.get("MODEL_HEDGE_DELAY_MS", "2000")) / 1000
+MODEL_HEDGE_MIN_SAMPLES = 20
+MODEL_HEDGE_WINDOW = 200
+
+
+class _Attempt:
+    __slots__ = ("index", "client", "cancelled", "started")
+
+    def __init__(self, index: int, client: ApiClient):
+        self.index = index
+        self.client = client
+        self.cancelled = threading.Event()
+        self.started = time.perf_counter()
+
+
+def _with_call_ids(function_calls: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    # Gemini may return calls without ids, which the OpenAI API rejects in the history of another client.
+    return [
+        call if call.get("id") else {**call, "id": f"call_{index}"} for index, call in enumerate(function_calls)
+    ]
+
+
+def _results_for(
+        client: ApiClient, function_execution_results: Optional[List[Dict[str, Any]]]
+) -> Optional[List[Dict[str, Any]]]:
+    """The results with the ids of the calls as `client` recorded them, which may differ from the winner's."""
+    if not function_execution_results:
+        return function_execution_results
+    own_calls = client.get_function_calls()
+    if len(own_calls) != len(function_execution_results):
+        return function_execution_results
+    return [{**result, "id": call["id"]} for result, call in zip(function_execution_results, own_calls)]
+
+
+class HedgedClient(ApiClient):
+    """
+    Wraps `clients` in priority order. With `percentile` at 0 requests are
+    never hedged and later clients are only used for failover.
+    """
+
+    def __init__(self, clients: List[ApiClient], percentile: float = MODEL_HEDGE_PERCENTILE,
+                 initial_delay: float = MODEL_HEDGE_DELAY):
+        if not clients:
+            raise ValueError("HedgedClient needs at least one client")
+        self.clients = list(clients)
+        self.model = clients[0].model
+        self.percentile = percentile
+        self.initial_delay = initial_delay
+        self._winner = 0
+        self._lock = threading.Lock()
+        self._latencies: Deque[float] = deque(maxlen=MODEL_HEDGE_WINDOW)
+        self.counters = {"requests": 0, "hedges_fired": 0, "hedges_won": 0, "failovers": 0, "errors": 0}
+
+    def hedge_delay(self) -> Optional[float]:
+        """Seconds to wait for the primary before hedging, or None when hedging is off."""
+        if self.percentile <= 0 or len(self.clients) < 2:
+            return None
+        with self._lock:
+            if len(self._latencies) < MODEL_HEDGE_MIN_SAMPLES:
+                return self.initial_delay
+            ordered = sorted(self._latencies)
+        return ordered[min(len(ordered) - 1, int(self.percentile * len(ordered)))]
+
+    def _record_latency(self, attempt: _Attempt) -> None:
+        """Records how long the primary took to answer (its first chunk when streaming, else the whole reply)."""
+        if attempt.index == 0:
+            with self._lock:
+                self._latencies.append(time.perf_counter() - attempt.started)
+
+    def _run_attempt(
+            self,
+            attempt: _Attempt,
+            user_input: Optional[str],
+            function_execution_results: Optional[List[Dict[str, Any]]],
+            stream: bool,
+            events: "queue.Queue",
+    ) -> None:
+        try:
+            if attempt.cancelled.is_set():
+                return
+            # Attempts always stream, even for `generate_content`, so a loser can be stopped mid-reply
+            # instead of running to completion; without `stream` the chunks are simply not passed on.
+            chunks = attempt.client.stream_content(user_input, function_execution_results)
+            measured = False
+            try:
+                for chunk in chunks:
+                    if not measured and (stream or attempt.cancelled.is_set()):
+                        # A primary that loses is measured too, or the delay would only learn from fast requests.
+                        # A cancelled non-stream attempt is cut short, so it counts the time it ran for.
+                        self._record_latency(attempt)
+                        measured = True
+                    if attempt.cancelled.is_set():
+                        # Closing the generator closes the loser's HTTP stream.
+                        return
+                    if stream:
+                        events.put((attempt, "chunk", chunk))
+            finally:
+                chunks.close()
+            if not measured:
+                self._record_latency(attempt)
+            if not attempt.cancelled.is_set():
+                events.put((attempt, "done", None))
+        except Exception as e:
+            events.put((attempt, "error", e))
+
+    def _race(
+            self,
+            user_input: Optional[str],
+            function_execution_results: Optional[List[Dict[str, Any]]],
+            stream: bool,
+    ) -> Iterator[str]:
+        events: "queue.Queue" = queue.Queue()
+        attempts: List[_Attempt] = []
+        hedges: List[_Attempt] = []
+        running = 0
+
+        def launch(index: int) -> None:
+            nonlocal running
+            attempt = _Attempt(index, self.clients[index].fork())
+            attempts.append(attempt)
+            running += 1
+            context = contextvars.copy_context()
+            results = _results_for(self.clients[index], function_execution_results)
+            threading.Thread(
+                target=context.run,
+                args=(self._run_attempt, attempt, user_input, results, stream, events),
+                daemon=True,
+            ).start()
+
+        with self._lock:
+            self.counters["requests"] += 1
+        hedge_delay = self.hedge_delay()
+        launch(0)
+        winner: Optional[_Attempt] = None
+        last_error: Optional[Exception] = None
+        while True:
+            hedge_due = winner is None and hedge_delay is not None and len(attempts) == 1 < len(self.clients)
+            timeout = max(0.0, attempts[0].started + hedge_delay - time.perf_counter()) if hedge_due else None
+            try:
+                attempt, kind, payload = events.get(timeout=timeout)
+            except queue.Empty:
+                with self._lock:
+                    self.counters["hedges_fired"] += 1
+                launch(len(attempts))
+                hedges.append(attempts[-1])
+                continue
+            if winner is not None and attempt is not winner:
+                continue
+
+            if kind == "error":
+                running -= 1
+                last_error = payload
+                if attempt is winner:
+                    # Part of the reply has already been streamed; another client cannot take over now.
+                    raise payload
+                if running == 0 and len(attempts) < len(self.clients):
+                    with self._lock:
+                        self.counters["failovers"] += 1
+                    launch(len(attempts))
+                elif running == 0:
+                    with self._lock:
+                        self.counters["errors"] += 1
+                    raise last_error
+                continue
+
+            if winner is None:
+                winner = attempt
+                for other in attempts:
+                    if other is not winner:
+                        other.cancelled.set()
+                if winner in hedges:
+                    with self._lock:
+                        self.counters["hedges_won"] += 1
+            if kind == "chunk":
+                yield payload
+            else:
+                break
+
+        self._adopt(winner, user_input, function_execution_results)
+
+    def _adopt(
+            self,
+            winner: _Attempt,
+            user_input: Optional[str],
+            function_execution_results: Optional[List[Dict[str, Any]]],
+    ) -> None:
+        self.clients[winner.index] = winner.client
+        self._winner = winner.index
+        function_calls = _with_call_ids(winner.client.get_function_calls())
+        text = winner.client.get_text_response() or ""
+        for index, client in enumerate(self.clients):
+            if index == winner.index:
+                continue
+            results = _results_for(client, function_execution_results)
+            if function_calls:
+                client.inject_function_calls(user_input, function_calls, results)
+            else:
+                client.inject_text_response(user_input, results, text)
+
+    def generate_content(
+            self, user_input: Optional[str], function_execution_results: Optional[List[Dict[str, Any]]] = None
+    ) -> None:
+        for _ in self._race(user_input, function_execution_results, stream=False):
+            pass
+
+    def stream_content(
+            self, user_input: Optional[str], function_execution_results: Optional[List[Dict[str, Any]]] = None
+    ) -> Iterator[str]:
+        yield from self._race(user_input, function_execution_results, stream=True)
+
+    def inject_function_calls(
+            self,
+            user_input: Optional[str],
+            function_calls: List[Dict[str, Any]],
+            function_execution_results: Optional[List[Dict[str, Any]]] = None,
+    ) -> None:
+        for client in self.clients:
+            client.inject_function_calls(
+                user_input, _with_call_ids(function_calls), _results_for(client, function_execution_results)
+            )
+
+    def inject_text_response(
+            self,
+            user_input: Optional[str],
+            function_execution_results: Optional[List[Dict[str, Any]]],
+            text: str,
+    ) -> None:
+        for client in self.clients:
+            client.inject_text_response(user_input, _results_for(client, function_execution_results), text)
+
+    def fork(self) -> "HedgedClient":
+        clone = HedgedClient([client.fork() for client in self.clients], self.percentile, self.initial_delay)
+        clone._winner = self._winner
+        return clone
+
+    def state_fingerprint(self) -> Optional[str]:
+        return self.clients[0].state_fingerprint()
+
+    def get_function_calls(self) -> List[Dict[str, Any]]:
+        return _with_call_ids(self.clients[self._winner].get_function_calls())
+
+    def get_text_response(self) -> Optional[str]:
+        return self.clients[self._winner].get_text_response()
+
+    def stats(self) -> Dict[str, Any]:
+        """Requests, hedges fired and won, failovers, requests no client answered, and the current hedge delay."""
+        delay = self.hedge_delay()
+        with self._lock:
+            return {
+                **self.counters,
+                "hedge_delay_ms": round(delay * 1000, 1) if delay is not None else None,
+            }
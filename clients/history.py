@@ -0,0 +1,129 @@
+# clients/history.py
+import os
+from collections import deque
+from typing import Any, Callable, Deque, Iterator, List, Optional, Tuple
+
+from token_estimate import estimate_tokens
+
+CONVERSATION_TOKEN_BUDGET = int(os.environ.get("CONVERSATION_TOKEN_BUDGET", "2000"))
+SUMMARY_TOKEN_BUDGET = int(os.environ.get("CONVERSATION_SUMMARY_TOKEN_BUDGET", "300"))
+SUMMARY_LINE_CHARS = 240
+SUMMARY_HEADER = "Summary of earlier turns that no longer fit in the conversation window:"
+
+
+def _shorten(text: str, limit: int) -> str:
+    text = " ".join(text.split())
+    return text if len(text) <= limit else text[: limit - 1] + "…"
+
+
+class ConversationHistory:
+    """
+    Token-budgeted conversation window shared by all clients.
+
+    Messages are grouped into turns: `start_turn` opens a turn with the
+    user's message and `append` adds everything that follows it (assistant
+    replies, function calls and their results). Eviction drops whole turns,
+    oldest first, so a function call is never separated from its result and
+    the window always starts with a user message. Evicted turns are
+    compacted into a bounded rolling `summary` the client can send ahead of
+    the window.
+
+    By default the window slides a turn at a time, keeping as much history
+    as fits. With `evict_to` below 1, going over budget evicts down to that
+    fraction of it instead, so the window (and the prompt prefix built from
+    it) moves in larger, rarer steps.
+    """
+
+    def __init__(
+            self,
+            describe: Callable[[Any], str],
+            token_budget: Optional[int] = None,
+            summary_budget: int = SUMMARY_TOKEN_BUDGET,
+            evict_to: float = 1.0,
+    ):
+        self.describe = describe
+        self.token_budget = CONVERSATION_TOKEN_BUDGET if token_budget is None else token_budget
+        self.summary_budget = summary_budget
+        self.evict_to = evict_to
+        self._turns: Deque[List[Tuple[Any, int]]] = deque()
+        self._tokens = 0
+        self._summary_lines: Deque[Tuple[str, int]] = deque()
+        self._summary_tokens = 0
+        self.evicted_turns = 0
+
+    def start_turn(self, message: Any) -> None:
+        """Opens a new turn with the user's message."""
+        self._turns.append([])
+        self.append(message)
+
+    def append(self, message: Any) -> None:
+        """Adds a message to the current turn, then evicts old turns over budget."""
+        if not self._turns:
+            self._turns.append([])
+        tokens = estimate_tokens(self.describe(message))
+        self._turns[-1].append((message, tokens))
+        self._tokens += tokens
+        self._evict()
+
+    def _evict(self) -> None:
+        # The current turn is never evicted, even if it alone exceeds the budget.
+        if self._tokens <= self.token_budget:
+            return
+        while self._tokens > self.token_budget * self.evict_to and len(self._turns) > 1:
+            turn = self._turns.popleft()
+            self._tokens -= sum(tokens for _, tokens in turn)
+            self.evicted_turns += 1
+            self._compact(turn)
+
+    def _compact(self, turn: List[Tuple[Any, int]]) -> None:
+        line = _shorten(" | ".join(self.describe(message) for message, _ in turn), SUMMARY_LINE_CHARS)
+        tokens = estimate_tokens(line)
+        self._summary_lines.append((line, tokens))
+        self._summary_tokens += tokens
+        while self._summary_tokens > self.summary_budget and len(self._summary_lines) > 1:
+            _, dropped = self._summary_lines.popleft()
+            self._summary_tokens -= dropped
+
+    @property
+    def summary(self) -> str:
+        """Compacted digest of evicted turns, oldest first; empty until something is evicted."""
+        return "\n".join(line for line, _ in self._summary_lines)
+
+    def summary_block(self) -> str:
+        """The rolling summary under a short header, ready to send as instructions; empty if none."""
+        summary = self.summary
+        return f"{SUMMARY_HEADER}\n{summary}" if summary else ""
+
+    def fingerprint(self) -> List[str]:
+        """Whitespace-normalized summary and window, for keying caches on the conversation state."""
+        return [" ".join(text.split()) for text in [self.summary, *map(self.describe, self)]]
+
+    @property
+    def tokens(self) -> int:
+        return self._tokens
+
+    def __iter__(self) -> Iterator[Any]:
+        for turn in self._turns:
+            for message, _ in turn:
+                yield message
+
+    def __len__(self) -> int:
+        return sum(len(turn) for turn in self._turns)
+
+    def last(self) -> Optional[Any]:
+        return self._turns[-1][-1][0] if self._turns and self._turns[-1] else None
+
+    def copy(self) -> "ConversationHistory":
+        """An independent window with the same turns and summary; the messages themselves are shared."""
+        clone = ConversationHistory(self.describe, self.token_budget, self.summary_budget, self.evict_to)
+        clone._turns = deque(list(turn) for turn in self._turns)
+        clone._tokens = self._tokens
+        clone._summary_lines = deque(self._summary_lines)
+        clone._summary_tokens = self._summary_tokens
+        clone.evicted_turns = self.evicted_turns
+        return clone
+
+    def clear(self) -> None:
+        self._turns.clear()
+        self._summary_lines.clear()
+        self._tokens = self._summary_tokens = 0
@@ -0,0 +1,71 @@
+# clients/messages.py
+"""
+Provider-neutral conversation records kept in every client's history.
+A `Message` stores only plain strings and tuples; each client turns it into
+its provider's wire format through `encode`, which caches the result on the
+message, so a request only encodes the messages added since the last one.
+"""
+import json
+from typing import Any, Callable, Dict, NamedTuple, Optional, Tuple
+
+from tools.registry import encode_result
+
+
+class ToolCall(NamedTuple):
+    id: Optional[str]
+    name: str
+    arguments: Dict[str, Any]
+
+
+class ToolResult(NamedTuple):
+    id: Optional[str]
+    name: str
+    content: str  # The tool's result as compact JSON text.
+
+
+def tool_result(result: Dict[str, Any]) -> ToolResult:
+    """Builds a `ToolResult` from an entry of `function_execution_results`."""
+    return ToolResult(result.get("id"), result["name"], encode_result(result["result"]))
+
+
+class Message:
+    """One entry of a conversation: "user", "assistant" or "tool", with its text, calls or results."""
+
+    __slots__ = ("role", "text", "tool_calls", "tool_results", "_wire_provider", "_wire")
+
+    def __init__(
+            self,
+            role: str,
+            text: Optional[str] = None,
+            tool_calls: Tuple[ToolCall, ...] = (),
+            tool_results: Tuple[ToolResult, ...] = (),
+    ):
+        self.role = role
+        self.text = text
+        self.tool_calls = tool_calls
+        self.tool_results = tool_results
+        self._wire_provider: Optional[str] = None
+        self._wire: Any = None
+
+    def encode(self, provider: str, encoder: Callable[["Message"], Any]) -> Any:
+        """This message in `provider`'s wire format, built by `encoder` once and then reused."""
+        if self._wire_provider != provider:
+            self._wire = encoder(self)
+            self._wire_provider = provider
+        return self._wire
+
+    def with_encoding(self, provider: str, wire: Any) -> "Message":
+        """Seeds the cache with the provider's own rendering, e.g. a reply exactly as the API returned it."""
+        self._wire = wire
+        self._wire_provider = provider
+        return self
+
+    def describe(self) -> str:
+        """Plain-text rendering used for token estimates, summaries and cache fingerprints."""
+        parts = [self.text or ""]
+        parts.extend(f"called {call.name}({json.dumps(call.arguments)})" for call in self.tool_calls)
+        parts.extend(f"{result.name} returned {result.content}" for result in self.tool_results)
+        return f"{self.role}: {' '.join(parts).strip()}"
+
+    def __repr__(self) -> str:
+        return f"Message({self.describe()!r})"
@@ -1,38 +1,38 @@
 # clients/ollama_client.py
 
+import copy
+import functools
 import json
-from collections import deque
+import os
+import time
 from openai import OpenAI
-from typing import Dict, List, Optional, Any
+from typing import Any, Dict, Iterator, List, Optional
 
+import tracing
+from token_estimate import estimate_tokens
 from clients.api_client import ApiClient
-
-CONVERSATION_WINDOW_SIZE = 10
-
-WEATHER_TOOL_OLLAMA = {
-    "name": "get_current_weather",
-    "description": "Get the current weather in a given location",
-    "parameters": {
-        "type": "object",
-        "properties": {
-            "location": {
-                "type": "string",
-                "description": "The city and state, e.g. San Francisco, CA",
-            },
-        },
-        "required": ["location"],
-    },
-}
-
-OLLAMA_SYSTEM_PROMPT = f"""
+from clients.history import ConversationHistory
+from clients.messages import Message
+from clients.scheduler import SCHEDULER
+from clients.tool_call_parser import ToolCallParser, parse_tool_calls
+from tools.registry import TOOL_REGISTRY, encode_result
+
+OLLAMA_BASE_URL = os.environ.get("OLLAMA_BASE_URL", "http://localhost:11434/v1")
+# Keep the prompt prefix stable between requests so Ollama can reuse its KV cache; "0" restores the sliding layout.
+OLLAMA_STABLE_PREFIX = os.environ.get("OLLAMA_STABLE_PREFIX", "1") != "0"
+# In the stable layout, going over the history budget evicts down to this fraction of it.
+OLLAMA_HISTORY_EVICT_TO = float(os.environ.get("OLLAMA_HISTORY_EVICT_TO", "0.5"))
+
+# Filled in with the tool definitions by `ollama_system_prompt`, so the tools are only imported once a client is made.
+_OLLAMA_SYSTEM_PROMPT_TEMPLATE = """
 You are a helpful assistant that can access a tool to get the weather in a particular city. Your goal is to assist the user, and that includes deciding when it is appropriate to use your tools.
 
 If you have identified a city and weather request, you MUST use the weather tool.
 
 To use the tool, you MUST respond with a JSON object that specifies the tool name and its arguments. The JSON object must be the only thing in your response, wrapped in ```json tags.
 
-Here is the tool's definition:
-{json.dumps(WEATHER_TOOL_OLLAMA, indent=2)}
+Here are the definitions of your tools:
+{tool_definitions}
 
 For example, to get the weather in Paris, you must respond with:
 ```json
@@ -44,93 +44,204 @@ For example, to get the weather in Paris, you must respond with:
 }}
 ```
 
+If the user asks about several cities at once, respond with a single JSON object holding a `tool_calls` list, one entry per city:
+```json
+{{
+  "tool_calls": [
+    {{"name": "get_current_weather", "arguments": {{"location": "Paris"}}}},
+    {{"name": "get_current_weather", "arguments": {{"location": "Rome"}}}}
+  ]
+}}
+```
+
 If the user's request is not about weather, or if they are just making a general statement or greeting, you should respond with a natural language message, not a tool call. For example, if the user says "hello" or "how are you", you should respond with a friendly greeting, not a tool call.
 """
 
 
+@functools.lru_cache(maxsize=None)
+def ollama_system_prompt() -> str:
+    return _OLLAMA_SYSTEM_PROMPT_TEMPLATE.format(tool_definitions=TOOL_REGISTRY.serialized("ollama"))
+
+
+@functools.lru_cache(maxsize=None)
+def _shared_sdk_client(base_url: str) -> OpenAI:
+    # One SDK client, and so one connection pool, per Ollama server for all sessions in the process.
+    return OpenAI(base_url=base_url, api_key="ollama")  # lib stub
+
+
+def _to_ollama(message: Message) -> Dict[str, Any]:
+    return {"role": message.role, "content": message.text}
+
+
 class OllamaClient(ApiClient):
     """
     A compliant client for interacting with a local Ollama server that uses a
     prompt-based strategy for function calling.
     """
 
-    def __init__(self, model: str = "gemma3:1b"):
+    def __init__(self, model: str = "gemma3:1b", base_url: Optional[str] = None, stable_prefix: Optional[bool] = None):
         self.model = model
-        self.client = OpenAI(
-            base_url="http://localhost:11434/v1",
-            api_key="ollama",  # lib stub
-        )
-        self.initial_prompt: List[Dict[str, Any]] = [
+        self.client = _shared_sdk_client(base_url or OLLAMA_BASE_URL)
+        self.stable_prefix = OLLAMA_STABLE_PREFIX if stable_prefix is None else stable_prefix
+        few_shot = [
             {"role": "user", "content": "Hello"},
             {"role": "assistant", "content": "Hello! How can I help you today?"},
-            {"role": "system", "content": OLLAMA_SYSTEM_PROMPT},
         ]
-        self.history: deque[Dict[str, Any]] = deque(maxlen=CONVERSATION_WINDOW_SIZE)
+        system = {"role": "system", "content": ollama_system_prompt()}
+        if self.stable_prefix:
+            # The fixed block comes first and the window only moves in steps, so consecutive
+            # requests share everything up to the newest messages.
+            self.initial_prompt: List[Dict[str, Any]] = [system] + few_shot
+            self.history = ConversationHistory(describe=Message.describe, evict_to=OLLAMA_HISTORY_EVICT_TO)
+        else:
+            self.initial_prompt = few_shot + [system]
+            self.history = ConversationHistory(describe=Message.describe)
+        self.latest_response: Optional[ToolCallParser] = None
         self.latest_response_content: Optional[str] = None
+        self.prompt_tokens = 0
 
-    def generate_content(self, user_input: Optional[str], function_execution_result: Optional[dict]) -> None:
-        """
-        Compliant method to generate a response from the Ollama model.
-        It mutates the client's internal state and returns None.
-        """
+    def _append_input(
+            self, user_input: Optional[str], function_execution_results: Optional[List[Dict[str, Any]]]
+    ) -> List[Dict[str, Any]]:
         if user_input:
-            self.history.append({"role": "user", "content": user_input})
-
-        if function_execution_result:
-            summary_prompt = (
-                "You have received the following data from the weather tool: "
-                f"{json.dumps(function_execution_result)}. "
-                "Use this data to answer the user's request. If the user asked a general question (e.g., 'what is the weather?'), "
-                "provide a full summary in a natural language. If the user asked a specific question (e.g., 'what is the temperature?'), "
-                "provide a direct answer to that specific question. Use natural language."
-            )
-            self.history.append({"role": "user", "content": summary_prompt})
+            self.history.start_turn(Message("user", user_input))
 
-        messages_to_send = self.initial_prompt + list(self.history)
+        if function_execution_results:
+            self.history.append(Message("user", self._summary_prompt(function_execution_results)))
 
-        response = self.client.chat.completions.create(
-            model=self.model,
-            messages=messages_to_send,
-            temperature=0,
-        )
+        summary_block = self.history.summary_block()
+        summary = [{"role": "system", "content": summary_block}] if summary_block else []
+        self.prompt_tokens = estimate_tokens(ollama_system_prompt() + summary_block) + self.history.tokens
+        return self.initial_prompt + summary + [message.encode("ollama", _to_ollama) for message in self.history]
 
-        self.latest_response_content = response.choices[0].message.content
-        self.history.append({"role": "assistant", "content": self.latest_response_content})
+    def _record_response(self, reply: ToolCallParser) -> None:
+        self.latest_response = reply
+        self.latest_response_content = reply.reply_text()
+        self.history.append(Message("assistant", self.latest_response_content))
 
-    def get_function_call(self) -> Optional[Dict[str, Any]]:
+    def _stream_reply(self, messages_to_send: List[Dict[str, Any]], span_name: str) -> Iterator[str]:
         """
-        Compliant method to parse the latest response for a JSON tool call.
-        Returns a dictionary with 'name' and 'arguments', or None.
+        Streams the reply through a `ToolCallParser`. Prose is yielded as soon
+        as its first characters rule out a tool call; a tool call is held back
+        and the stream is closed the moment its JSON object is complete, so
+        the model stops generating whatever it would have added after it.
+        """
+        reply = ToolCallParser()
+        with tracing.span(span_name, provider="ollama", model=self.model) as span:
+            start = time.perf_counter()
+            stream = SCHEDULER.call(
+                "ollama", self.model, self.prompt_tokens,
+                lambda: self.client.chat.completions.create(
+                    model=self.model,
+                    messages=messages_to_send,
+                    temperature=0,
+                    stream=True,
+                    stream_options={"include_usage": True},
+                ),
+            )
+            try:
+                for chunk in stream:
+                    if chunk.usage:
+                        span.set(prompt_tokens=chunk.usage.prompt_tokens,
+                                 completion_tokens=chunk.usage.completion_tokens)
+                    if not chunk.choices or not chunk.choices[0].delta.content:
+                        continue
+                    if not reply.text:
+                        span.set(time_to_first_token_ms=round((time.perf_counter() - start) * 1000, 1))
+                    decided = reply.is_prose is not None
+                    reply.feed(chunk.choices[0].delta.content)
+                    if reply.is_prose:
+                        yield chunk.choices[0].delta.content if decided else reply.text.lstrip()
+                    elif reply.closed:
+                        span.set(stopped_early=True)
+                        break
+            finally:
+                stream.close()
+
+        self._record_response(reply)
+
+    def generate_content(
+            self, user_input: Optional[str], function_execution_results: Optional[List[Dict[str, Any]]] = None
+    ) -> None:
+        """
+        Compliant method to generate a response from the Ollama model.
+        It mutates the client's internal state and returns None. The reply is
+        streamed internally so generation can stop once a tool call is complete.
         """
-        if not self.latest_response_content:
-            return None
-
-        content = self.latest_response_content
-        if "```json" in content:
-            content = content.split("```json")[1].split("```")[0].strip()
-
-        try:
-            parsed_content = json.loads(content)
-            tool_call = parsed_content.get("tool_call")
-
-            if (
-                tool_call
-                and isinstance(tool_call, dict)
-                and "name" in tool_call
-                and "arguments" in tool_call
-            ):
-                return {"name": tool_call["name"], "arguments": tool_call["arguments"]}
-
-        except (json.JSONDecodeError, AttributeError):
+        messages_to_send = self._append_input(user_input, function_execution_results)
+        for _ in self._stream_reply(messages_to_send, "llm.generate_content"):
             pass
 
-        return None
+    def stream_content(
+            self, user_input: Optional[str], function_execution_results: Optional[List[Dict[str, Any]]] = None
+    ) -> Iterator[str]:
+        """
+        Streams the model's reply. Tool calls are plain JSON in the text, so
+        output that opens like a JSON block is held back instead of yielded;
+        prose is yielded as soon as its first characters rule that out.
+        """
+        messages_to_send = self._append_input(user_input, function_execution_results)
+        yield from self._stream_reply(messages_to_send, "llm.stream_content")
+
+    def _summary_prompt(self, function_execution_results: List[Dict[str, Any]]) -> str:
+        if len(function_execution_results) == 1:
+            tool_data = encode_result(function_execution_results[0]["result"])
+        else:
+            arguments_by_id = {call["id"]: call["arguments"] for call in self.get_function_calls()}
+            tool_data = encode_result([
+                {"arguments": arguments_by_id.get(result["id"]), "result": result["result"]}
+                for result in function_execution_results
+            ])
+        return (
+            "You have received the following data from the weather tool: "
+            f"{tool_data}. "
+            "Use this data to answer the user's request. If the user asked a general question (e.g., 'what is the weather?'), "
+            "provide a full summary in a natural language. If the user asked a specific question (e.g., 'what is the temperature?'), "
+            "provide a direct answer to that specific question. Use natural language."
+        )
+
+    def inject_function_calls(
+            self,
+            user_input: Optional[str],
+            function_calls: List[Dict[str, Any]],
+            function_execution_results: Optional[List[Dict[str, Any]]] = None,
+    ) -> None:
+        # Recorded in the same JSON envelope the system prompt asks the model for.
+        self._append_input(user_input, function_execution_results)
+        tool_calls = [{"name": call["name"], "arguments": call["arguments"]} for call in function_calls]
+        self._record_response(parse_tool_calls(f"```json\n{json.dumps({'tool_calls': tool_calls})}\n```"))
+
+    def inject_text_response(
+            self,
+            user_input: Optional[str],
+            function_execution_results: Optional[List[Dict[str, Any]]],
+            text: str,
+    ) -> None:
+        self._append_input(user_input, function_execution_results)
+        self._record_response(parse_tool_calls(text))
+
+    def fork(self) -> "OllamaClient":
+        clone = copy.copy(self)
+        clone.history = self.history.copy()
+        return clone
+
+    def state_fingerprint(self) -> Optional[str]:
+        return json.dumps([self.model, self.initial_prompt, self.history.fingerprint()])
+
+    def get_function_calls(self) -> List[Dict[str, Any]]:
+        """
+        Compliant method to return the JSON tool calls of the latest response.
+        Accepts a single `tool_call` object or a `tool_calls` list and returns
+        dictionaries with 'id', 'name' and 'arguments'. The response is parsed
+        once, while it streams in.
+        """
+        return self.latest_response.function_calls() if self.latest_response else []
 
     def get_text_response(self) -> Optional[str]:
         """
         Compliant method to return the text response if no tool was called.
         """
         if self.latest_response_content:
-            if not self.get_function_call():
+            if not self.get_function_calls():
                 return self.latest_response_content
         return None
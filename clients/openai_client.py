@@ -1,86 +1,200 @@
 # clients/openai_client.py
 from openai import OpenAI
+import copy
+import functools
 import os
 import json
-from typing import Optional
-from collections import deque
+import time
+from typing import Any, Dict, Iterator, List, Optional
 
+import tracing
+from token_estimate import estimate_tokens
 from clients.api_client import ApiClient
-from tools.weather_tool import WEATHER_TOOL_INSTRUCTIONS
-
-CONVERSATION_WINDOW_SIZE = 10
-
-WEATHER_TOOL_OPENAI = {
-    "type": "function",
-    "function": {
-        "name": "get_current_weather",
-        "description": "🌡️Gets the current temperature for a given location.",
-        "parameters": {
-            "type": "object",
-            "properties": {
-                "location": {
-                    "type": "string",
-                    "description": "The city name, e.g. New York",
-                },
-            },
-            "required": ["location"],
-        },
-    }
-}
+from clients.history import ConversationHistory
+from clients.messages import Message, ToolCall, tool_result
+from clients.scheduler import SCHEDULER
+from tools.registry import TOOL_REGISTRY
+
+GEMINI_OPENAI_BASE_URL = os.environ.get(
+    "GEMINI_OPENAI_BASE_URL", "https://generativelanguage.googleapis.com/v1beta/"
+)
+
+@functools.lru_cache(maxsize=None)
+def _shared_sdk_client(base_url: str, api_key: str) -> OpenAI:
+    # One SDK client, and so one connection pool, per endpoint for all sessions in the process.
+    return OpenAI(base_url=base_url, api_key=api_key)
+
+
+def _to_openai(message: Message) -> Dict[str, Any]:
+    if message.tool_results:
+        (result,) = message.tool_results
+        return {"role": "tool", "tool_call_id": result.id, "name": result.name, "content": result.content}
+    encoded: Dict[str, Any] = {"role": message.role, "content": message.text}
+    if message.tool_calls:
+        encoded["tool_calls"] = [
+            {
+                "id": call.id,
+                "type": "function",
+                "function": {"name": call.name, "arguments": json.dumps(call.arguments)},
+            }
+            for call in message.tool_calls
+        ]
+    return encoded
+
 
 class OpenAIClient(ApiClient):
     """API client for the openai library."""
 
-    def __init__(self, model: str):
+    def __init__(self, model: str, base_url: Optional[str] = None):
         super().__init__(model)
-        self.client = OpenAI(
-            base_url="https://generativelanguage.googleapis.com/v1beta/",
-            api_key=os.environ["GEMINI_API_KEY"],
-        )
-        self.system_message = {"role": "system", "content": WEATHER_TOOL_INSTRUCTIONS}
-        self.messages = deque(maxlen=CONVERSATION_WINDOW_SIZE)
-        self.last_response_message = None
+        self.client = _shared_sdk_client(base_url or GEMINI_OPENAI_BASE_URL, os.environ["GEMINI_API_KEY"])
+        self.system_message = {"role": "system", "content": TOOL_REGISTRY.instructions()}
+        self.messages = ConversationHistory(describe=Message.describe)
+        self.last_response_message: Optional[Message] = None
+        self.prompt_tokens = 0
 
-    def generate_content(self, user_input: Optional[str], function_execution_result: Optional[dict]) -> None:
+    def _append_input(
+            self, user_input: Optional[str], function_execution_results: Optional[List[Dict[str, Any]]]
+    ) -> List[Dict[str, Any]]:
         if user_input:
-            self.messages.append({"role": "user", "content": user_input})
-
-        if function_execution_result:
-            tool_call_id = self.get_function_call()['id']
-            self.messages.append(
-                {
-                    "role": "tool",
-                    "tool_call_id": tool_call_id,
-                    "name": self.get_function_call()['name'],
-                    "content": str(function_execution_result),
-                }
-            )
+            self.messages.start_turn(Message("user", user_input))
+
+        for result in function_execution_results or []:
+            self.messages.append(Message("tool", tool_results=(tool_result(result),)))
+
+        summary_block = self.messages.summary_block()
+        summary = [{"role": "system", "content": summary_block}] if summary_block else []
+        self.prompt_tokens = estimate_tokens(self.system_message["content"] + summary_block) + self.messages.tokens
+        return [self.system_message] + summary + [message.encode("openai", _to_openai) for message in self.messages]
 
-        messages_to_send = [self.system_message] + list(self.messages)
+    def _record_response(self, content: Optional[str], tool_calls: List[ToolCall]) -> None:
+        self.last_response_message = Message("assistant", content, tuple(tool_calls))
+        self.messages.append(self.last_response_message)
 
-        self._last_response = self.client.chat.completions.create(
-            model=self.model,
-            messages=messages_to_send,
-            tools=[WEATHER_TOOL_OPENAI],
-            tool_choice="auto",
+    def generate_content(
+            self, user_input: Optional[str], function_execution_results: Optional[List[Dict[str, Any]]] = None
+    ) -> None:
+        messages_to_send = self._append_input(user_input, function_execution_results)
+
+        with tracing.span("llm.generate_content", provider="openai", model=self.model) as span:
+            response = SCHEDULER.call(
+                "gemini", self.model, self.prompt_tokens,
+                lambda: self.client.chat.completions.create(
+                    model=self.model,
+                    messages=messages_to_send,
+                    tools=TOOL_REGISTRY.schemas("openai"),
+                    tool_choice="auto",
+                ),
+            )
+            if response.usage:
+                span.set(prompt_tokens=response.usage.prompt_tokens, completion_tokens=response.usage.completion_tokens)
+        message = response.choices[0].message
+        self._record_response(
+            message.content,
+            [
+                ToolCall(tc.id, tc.function.name, json.loads(tc.function.arguments or "{}"))
+                for tc in message.tool_calls or []
+            ],
         )
-        self.last_response_message = self._last_response.choices[0].message
-        if self.last_response_message:
-            self.messages.append(self.last_response_message)
 
+    def stream_content(
+            self, user_input: Optional[str], function_execution_results: Optional[List[Dict[str, Any]]] = None
+    ) -> Iterator[str]:
+        messages_to_send = self._append_input(user_input, function_execution_results)
+
+        text_parts: List[str] = []
+        tool_calls: Dict[int, Dict[str, Any]] = {}
+        with tracing.span("llm.stream_content", provider="openai", model=self.model) as span:
+            start = time.perf_counter()
+            stream = SCHEDULER.call(
+                "gemini", self.model, self.prompt_tokens,
+                lambda: self.client.chat.completions.create(
+                    model=self.model,
+                    messages=messages_to_send,
+                    tools=TOOL_REGISTRY.schemas("openai"),
+                    tool_choice="auto",
+                    stream=True,
+                    stream_options={"include_usage": True},
+                ),
+            )
+            for chunk in stream:
+                if chunk.usage:
+                    span.set(prompt_tokens=chunk.usage.prompt_tokens, completion_tokens=chunk.usage.completion_tokens)
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta
+                if delta.content:
+                    if not text_parts:
+                        span.set(time_to_first_token_ms=round((time.perf_counter() - start) * 1000, 1))
+                    text_parts.append(delta.content)
+                    yield delta.content
+                for fragment in delta.tool_calls or []:
+                    # Tool calls arrive in pieces: the first fragment for an index carries
+                    # the id and name, later ones append to the JSON arguments string.
+                    index = fragment.index if fragment.index is not None else len(tool_calls)
+                    tool_call = tool_calls.setdefault(
+                        index, {"id": None, "type": "function", "function": {"name": "", "arguments": ""}}
+                    )
+                    if fragment.id:
+                        tool_call["id"] = fragment.id
+                    if fragment.function and fragment.function.name:
+                        tool_call["function"]["name"] += fragment.function.name
+                    if fragment.function and fragment.function.arguments:
+                        tool_call["function"]["arguments"] += fragment.function.arguments
+
+        self._record_response("".join(text_parts) or None, [
+            ToolCall(
+                tool_calls[index]["id"],
+                tool_calls[index]["function"]["name"],
+                json.loads(tool_calls[index]["function"]["arguments"] or "{}"),
+            )
+            for index in sorted(tool_calls)
+        ])
+
+    def inject_function_calls(
+            self,
+            user_input: Optional[str],
+            function_calls: List[Dict[str, Any]],
+            function_execution_results: Optional[List[Dict[str, Any]]] = None,
+    ) -> None:
+        self._append_input(user_input, function_execution_results)
+        self._record_response(None, [
+            ToolCall(call["id"], call["name"], call["arguments"]) for call in function_calls
+        ])
+
+    def inject_text_response(
+            self,
+            user_input: Optional[str],
+            function_execution_results: Optional[List[Dict[str, Any]]],
+            text: str,
+    ) -> None:
+        self._append_input(user_input, function_execution_results)
+        self._record_response(text, [])
+
+    def fork(self) -> "OpenAIClient":
+        clone = copy.copy(self)
+        clone.messages = self.messages.copy()
+        return clone
+
+    def state_fingerprint(self) -> Optional[str]:
+        return json.dumps([
+            self.model, self.system_message["content"], TOOL_REGISTRY.serialized("openai"), self.messages.fingerprint()
+        ])
 
     def get_text_response(self) -> str:
-        if self.last_response_message and self.last_response_message.content:
-            return self.last_response_message.content
+        if self.last_response_message and self.last_response_message.text:
+            return self.last_response_message.text
         return ""
 
-    def get_function_call(self) -> dict:
-        if self.last_response_message and self.last_response_message.tool_calls:
-            tc = self.last_response_message.tool_calls[0]
-            return {
-                "id": tc.id,
-                "name": tc.function.name,
-                "arguments": json.loads(tc.function.arguments),
+    def get_function_calls(self) -> List[Dict[str, Any]]:
+        if not self.last_response_message:
+            return []
+        return [
+            {
+                "id": call.id,
+                "name": call.name,
+                "arguments": dict(call.arguments),
                 "description": "Function call requested by the model."
             }
-        return {}
+            for call in self.last_response_message.tool_calls
+        ]
@@ -0,0 +1,247 @@
+# clients/response_cache.py
+"""
+Opt-in exact-match cache for model replies. `CachedClient` wraps any
+`ApiClient` and keys each request on a hash of the client's state
+fingerprint (model, instructions, tool schema and conversation window) plus
+the new input. On a hit the stored reply is recorded in the wrapped client's
+history as if the model had produced it, so later turns see the same
+conversation either way.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from clients.api_client import ApiClient
+
+RESPONSE_CACHE_TTL = float(os.environ.get("RESPONSE_CACHE_TTL", "600"))
+# Replies to tool results embed live weather, so they are not cached unless this is set.
+RESPONSE_CACHE_TOOL_RESULT_TTL = float(os.environ.get("RESPONSE_CACHE_TOOL_RESULT_TTL", "0"))
+RESPONSE_CACHE_SIZE = int(os.environ.get("RESPONSE_CACHE_SIZE", "1024"))
+RESPONSE_CACHE_PATH = os.environ.get(
+    "RESPONSE_CACHE_PATH",
+    os.path.join(os.path.expanduser("~"), ".cache", "gemini-function-calling", "responses.sqlite3"),
+)
+
+Reply = Dict[str, Any]
+
+
+class ResponseStore:
+    """Hit/miss bookkeeping shared by the stores; subclasses implement get, set and clear."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _counted(self, reply: Optional[Reply]) -> Optional[Reply]:
+        if reply is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return reply
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {"hits": self.hits, "misses": self.misses, "hit_ratio": self.hits / lookups if lookups else 0.0}
+
+
+class MemoryResponseStore(ResponseStore):
+    """In-process LRU of replies with per-entry expiry."""
+
+    def __init__(self, max_entries: int = RESPONSE_CACHE_SIZE):
+        super().__init__()
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[Reply, float]]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[Reply]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] <= time.time():
+                del self._entries[key]
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return self._counted(entry[0] if entry else None)
+
+    def set(self, key: str, reply: Reply, ttl: float) -> None:
+        with self._lock:
+            self._entries[key] = (reply, time.time() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+class SqliteResponseStore(ResponseStore):
+    """SQLite-backed store shared across processes and restarts, evicting the least recently used rows."""
+
+    def __init__(self, path: str = RESPONSE_CACHE_PATH, max_entries: int = RESPONSE_CACHE_SIZE):
+        super().__init__()
+        self.max_entries = max_entries
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY, reply TEXT NOT NULL, expires_at REAL NOT NULL, used_at REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS responses_used_at ON responses (used_at)")
+
+    def get(self, key: str) -> Optional[Reply]:
+        now = time.time()
+        with self._lock:
+            row = self._db.execute("SELECT reply, expires_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is not None and row[1] <= now:
+                self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                row = None
+            if row is not None:
+                self._db.execute("UPDATE responses SET used_at = ? WHERE key = ?", (now, key))
+            return self._counted(json.loads(row[0]) if row else None)
+
+    def set(self, key: str, reply: Reply, ttl: float) -> None:
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses (key, reply, expires_at, used_at) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(reply), now + ttl, now),
+            )
+            self._db.execute(
+                "DELETE FROM responses WHERE key IN ("
+                " SELECT key FROM responses ORDER BY used_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+    def clear(self) -> None:
+        with self._lock:
+            self._db.execute("DELETE FROM responses")
+
+
+def make_response_store(kind: str) -> ResponseStore:
+    """Returns the store for a `--response-cache` choice: "memory" or "sqlite"."""
+    if kind == "memory":
+        return MemoryResponseStore()
+    if kind == "sqlite":
+        return SqliteResponseStore()
+    raise ValueError(f"Unknown response cache: {kind}")
+
+
+class CachedClient(ApiClient):
+    """Wraps an `ApiClient`, answering repeated requests from a response store."""
+
+    def __init__(
+            self,
+            client: ApiClient,
+            store: ResponseStore,
+            ttl: float = RESPONSE_CACHE_TTL,
+            tool_result_ttl: float = RESPONSE_CACHE_TOOL_RESULT_TTL,
+    ):
+        self.client = client
+        self.model = client.model
+        self.store = store
+        self.ttl = ttl
+        self.tool_result_ttl = tool_result_ttl
+
+    def __getattr__(self, name: str):
+        # Anything not overridden here (history, config, ...) belongs to the wrapped client.
+        if name == "client":
+            raise AttributeError(name)
+        return getattr(self.client, name)
+
+    def _key(
+            self, user_input: Optional[str], function_execution_results: Optional[List[Dict[str, Any]]]
+    ) -> Optional[str]:
+        ttl = self.tool_result_ttl if function_execution_results else self.ttl
+        fingerprint = self.client.state_fingerprint()
+        if ttl <= 0 or fingerprint is None:
+            return None
+        request = json.dumps(
+            [fingerprint, " ".join((user_input or "").split()), function_execution_results], default=str
+        )
+        return hashlib.sha256(request.encode()).hexdigest()
+
+    def _replay(
+            self,
+            user_input: Optional[str],
+            function_execution_results: Optional[List[Dict[str, Any]]],
+            reply: Reply,
+    ) -> None:
+        if reply["function_calls"]:
+            self.client.inject_function_calls(user_input, reply["function_calls"])
+        else:
+            self.client.inject_text_response(user_input, function_execution_results, reply["text"])
+
+    def _store(self, key: str, function_execution_results: Optional[List[Dict[str, Any]]]) -> None:
+        function_calls = [
+            {"id": call["id"], "name": call["name"], "arguments": call["arguments"]}
+            for call in self.client.get_function_calls()
+        ]
+        if function_calls and function_execution_results:
+            # A follow-up call after tool results cannot be replayed together with those results.
+            return
+        reply = {"text": self.client.get_text_response() or "", "function_calls": function_calls}
+        self.store.set(key, reply, self.tool_result_ttl if function_execution_results else self.ttl)
+
+    def generate_content(
+            self, user_input: Optional[str], function_execution_results: Optional[List[Dict[str, Any]]] = None
+    ) -> None:
+        key = self._key(user_input, function_execution_results)
+        reply = self.store.get(key) if key else None
+        if reply is not None:
+            self._replay(user_input, function_execution_results, reply)
+            return
+        self.client.generate_content(user_input, function_execution_results)
+        if key:
+            self._store(key, function_execution_results)
+
+    def stream_content(
+            self, user_input: Optional[str], function_execution_results: Optional[List[Dict[str, Any]]] = None
+    ) -> Iterator[str]:
+        key = self._key(user_input, function_execution_results)
+        reply = self.store.get(key) if key else None
+        if reply is not None:
+            self._replay(user_input, function_execution_results, reply)
+            if reply["text"] and not reply["function_calls"]:
+                yield reply["text"]
+            return
+        # Only a fully consumed stream leaves a complete reply behind to store.
+        yield from self.client.stream_content(user_input, function_execution_results)
+        if key:
+            self._store(key, function_execution_results)
+
+    def inject_function_calls(
+            self,
+            user_input: Optional[str],
+            function_calls: List[Dict[str, Any]],
+            function_execution_results: Optional[List[Dict[str, Any]]] = None,
+    ) -> None:
+        self.client.inject_function_calls(user_input, function_calls, function_execution_results)
+
+    def inject_text_response(
+            self,
+            user_input: Optional[str],
+            function_execution_results: Optional[List[Dict[str, Any]]],
+            text: str,
+    ) -> None:
+        self.client.inject_text_response(user_input, function_execution_results, text)
+
+    def fork(self) -> "CachedClient":
+        return CachedClient(self.client.fork(), self.store, self.ttl, self.tool_result_ttl)
+
+    def state_fingerprint(self) -> Optional[str]:
+        return self.client.state_fingerprint()
+
+    def get_function_calls(self) -> List[Dict[str, Any]]:
+        return self.client.get_function_calls()
+
+    def get_text_response(self) -> Optional[str]:
+        return self.client.get_text_response()
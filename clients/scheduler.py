@@ -0,0 +1,281 @@
+# clients/scheduler.py
+"""
+Admission control for outbound model requests. Every client call goes
+through `SCHEDULER.call`, keyed by provider and model. The scheduler:
+-   paces requests with token buckets for requests and tokens per minute;
+-   admits waiting requests in priority order, interactive before batch,
+    and keeps some of each bucket back for interactive requests;
+-   bounds the queue, and sheds requests that cannot start before their
+    deadline;
+-   pauses a key and lowers its rate when the provider answers 429, then
+    retries the request and recovers the rate gradually afterwards.
+
+Limits are configured with `MODEL_RATE_LIMITS`, e.g.
+"gemini:gemini-2.5-flash=1000/1000000,ollama=60/0" (requests/tokens per
+minute, 0 for no limit). A key without limits is only paused on 429s.
+"""
+import contextlib
+import contextvars
+import heapq
+import itertools
+import os
+import random
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, TypeVar
+
+Result = TypeVar("Result")
+
+PRIORITIES = {"interactive": 0, "batch": 1}
+MODEL_RATE_LIMITS = os.environ.get("MODEL_RATE_LIMITS", "")
+MODEL_QUEUE_MAX = int(os.environ.get("MODEL_QUEUE_MAX", "256"))
+# Longest a request may wait for admission, per priority class.
+MODEL_QUEUE_DEADLINES = {
+    "interactive": float(os.environ.get("MODEL_QUEUE_DEADLINE_INTERACTIVE", "30")),
+    "batch": float(os.environ.get("MODEL_QUEUE_DEADLINE_BATCH", "600")),
+}
+# Share of each bucket that batch requests may not use, so interactive ones rarely wait for a refill.
+MODEL_INTERACTIVE_RESERVE = float(os.environ.get("MODEL_INTERACTIVE_RESERVE", "0.1"))
+MODEL_RATE_LIMIT_RETRIES = int(os.environ.get("MODEL_RATE_LIMIT_RETRIES", "3"))
+MODEL_BACKOFF_BASE = float(os.environ.get("MODEL_BACKOFF_BASE", "1"))
+MODEL_BACKOFF_MAX = float(os.environ.get("MODEL_BACKOFF_MAX", "60"))
+# After a 429 the rate is multiplied by this; every success then adds back a small step.
+MODEL_RATE_DECREASE = 0.5
+MODEL_RATE_RECOVERY = 0.05
+MODEL_RATE_FLOOR = 0.1
+
+_priority: contextvars.ContextVar[str] = contextvars.ContextVar("model_priority", default="interactive")
+
+
+class RequestShed(RuntimeError):
+    """Raised when a model request is dropped by the scheduler instead of being sent."""
+
+
+@contextlib.contextmanager
+def scheduling_priority(priority: str) -> Iterator[None]:
+    """Runs the model calls made in this context (and contexts copied from it) at `priority`."""
+    if priority not in PRIORITIES:
+        raise ValueError(f"Unknown priority: {priority}")
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def parse_rate_limits(spec: str) -> Dict[str, Tuple[float, float]]:
+    """Parses "key=rpm/tpm,..." into {key: (rpm, tpm)}."""
+    limits = {}
+    for entry in filter(None, (part.strip() for part in spec.split(","))):
+        key, _, values = entry.rpartition("=")
+        requests_per_minute, _, tokens_per_minute = values.partition("/")
+        limits[key] = (float(requests_per_minute or 0), float(tokens_per_minute or 0))
+    return limits
+
+
+def is_rate_limited(error: BaseException) -> bool:
+    """Whether `error` is a provider's 429 answer, as raised by the openai or google-genai SDK."""
+    return getattr(error, "status_code", None) == 429 or getattr(error, "code", None) == 429
+
+
+def _retry_after(error: BaseException) -> Optional[float]:
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def started(iterator: Iterator[Result]) -> Iterator[Result]:
+    """Pulls the first item of a lazy stream, so its request (and any 429) happens inside the scheduled call."""
+    try:
+        first = next(iterator)
+    except StopIteration:
+        return iter(())
+    return itertools.chain([first], iterator)
+
+
+class _Bucket:
+    """Token bucket holding up to one minute of `per_minute`, refilled continuously."""
+
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.level = per_minute
+        self.updated = time.monotonic()
+
+    def refill(self, now: float, factor: float) -> None:
+        self.level = min(self.capacity * factor, self.level + (now - self.updated) * self.capacity * factor / 60)
+        self.updated = now
+
+    def wait_for(self, amount: float, reserve: float, factor: float) -> float:
+        """Seconds until `amount` can be taken while leaving `reserve` of the capacity; 0 if it can now."""
+        capacity = self.capacity * factor
+        # Demand is capped at what the bucket can hold beside the reserve, or an oversized request would never start.
+        needed = min(amount, capacity * (1 - reserve)) + reserve * capacity
+        if self.level >= needed:
+            return 0.0
+        return (needed - self.level) * 60 / capacity
+
+
+class _Waiter:
+    __slots__ = ("priority", "tokens", "deadline", "enqueued")
+
+    def __init__(self, priority: str, tokens: int, deadline: float):
+        self.priority = priority
+        self.tokens = tokens
+        self.deadline = deadline
+        self.enqueued = time.monotonic()
+
+
+class _Lane:
+    """The queue, buckets and 429 state of one provider and model."""
+
+    def __init__(self, limits: Tuple[float, float], condition: threading.Condition):
+        requests_per_minute, tokens_per_minute = limits
+        self.requests = _Bucket(requests_per_minute) if requests_per_minute else None
+        self.tokens = _Bucket(tokens_per_minute) if tokens_per_minute else None
+        self.condition = condition
+        self.queue: List[Tuple[int, int, _Waiter]] = []
+        self.factor = 1.0
+        self.paused_until = 0.0
+        self.consecutive_429 = 0
+        self.counters = {"admitted": 0, "shed_queue_full": 0, "shed_deadline": 0, "rate_limited": 0, "retries": 0}
+        self.waited = {priority: [0, 0.0] for priority in PRIORITIES}
+
+    def wait_for(self, waiter: _Waiter, now: float) -> float:
+        reserve = MODEL_INTERACTIVE_RESERVE if waiter.priority != "interactive" else 0.0
+        wait = max(0.0, self.paused_until - now)
+        for bucket, amount in ((self.requests, 1), (self.tokens, waiter.tokens)):
+            if bucket:
+                bucket.refill(now, self.factor)
+                wait = max(wait, bucket.wait_for(amount, reserve, self.factor))
+        return wait
+
+    def take(self, waiter: _Waiter, now: float) -> None:
+        if self.requests:
+            self.requests.level -= 1
+        if self.tokens:
+            self.tokens.level -= min(waiter.tokens, self.tokens.level)
+        self.counters["admitted"] += 1
+        waited = self.waited[waiter.priority]
+        waited[0] += 1
+        waited[1] += now - waiter.enqueued
+
+
+class ModelScheduler:
+    """Shared by every client in the process; see the module docstring."""
+
+    def __init__(self, limits: Optional[Dict[str, Tuple[float, float]]] = None, max_queue: int = MODEL_QUEUE_MAX):
+        self.limits = parse_rate_limits(MODEL_RATE_LIMITS) if limits is None else limits
+        self.max_queue = max_queue
+        self._lock = threading.Lock()
+        self._lanes: Dict[str, _Lane] = {}
+        self._sequence = itertools.count()
+
+    def _lane(self, provider: str, model: str) -> Tuple[str, _Lane]:
+        key = f"{provider}:{model}"
+        with self._lock:
+            lane = self._lanes.get(key)
+            if lane is None:
+                limits = self.limits.get(key) or self.limits.get(provider) or (0.0, 0.0)
+                lane = self._lanes[key] = _Lane(limits, threading.Condition(threading.Lock()))
+            return key, lane
+
+    def _admit(self, key: str, lane: _Lane, tokens: int, priority: str, deadline: float) -> None:
+        waiter = _Waiter(priority, tokens, deadline)
+        entry = (PRIORITIES[priority], next(self._sequence), waiter)
+        with lane.condition:
+            if len(lane.queue) >= self.max_queue:
+                # A full queue makes room for a more urgent request by shedding its least urgent, newest entry.
+                victim = max(lane.queue)
+                if victim[0] <= entry[0]:
+                    lane.counters["shed_queue_full"] += 1
+                    raise RequestShed(f"{key}: model request queue is full")
+                lane.queue.remove(victim)
+                heapq.heapify(lane.queue)
+                lane.counters["shed_queue_full"] += 1
+                lane.condition.notify_all()
+            heapq.heappush(lane.queue, entry)
+            while True:
+                now = time.monotonic()
+                if entry not in lane.queue:
+                    raise RequestShed(f"{key}: model request was shed for a more urgent one")
+                if now >= waiter.deadline:
+                    lane.queue.remove(entry)
+                    heapq.heapify(lane.queue)
+                    lane.counters["shed_deadline"] += 1
+                    lane.condition.notify_all()
+                    raise RequestShed(f"{key}: model request could not start before its deadline")
+                wait = None
+                if lane.queue[0] is entry:
+                    wait = lane.wait_for(waiter, now)
+                    if wait <= 0:
+                        lane.take(waiter, now)
+                        heapq.heappop(lane.queue)
+                        lane.condition.notify_all()
+                        return
+                lane.condition.wait(min(wait, waiter.deadline - now) if wait is not None else waiter.deadline - now)
+
+    def _record_429(self, lane: _Lane, error: BaseException) -> None:
+        with lane.condition:
+            lane.counters["rate_limited"] += 1
+            lane.consecutive_429 += 1
+            lane.factor = max(MODEL_RATE_FLOOR, lane.factor * MODEL_RATE_DECREASE)
+            backoff = _retry_after(error)
+            if backoff is None:
+                backoff = random.uniform(0, min(MODEL_BACKOFF_MAX, MODEL_BACKOFF_BASE * 2 ** lane.consecutive_429))
+            lane.paused_until = max(lane.paused_until, time.monotonic() + backoff)
+            lane.condition.notify_all()
+
+    def _record_success(self, lane: _Lane) -> None:
+        with lane.condition:
+            lane.consecutive_429 = 0
+            lane.factor = min(1.0, lane.factor + MODEL_RATE_RECOVERY)
+
+    def call(self, provider: str, model: str, tokens: int, request: Callable[[], Result]) -> Result:
+        """
+        Runs `request` once admitted for `provider` and `model`, charging an
+        estimated `tokens` against the token bucket. A 429 pauses the key and
+        the request is retried up to `MODEL_RATE_LIMIT_RETRIES` times, within
+        the deadline of its priority class.
+        """
+        key, lane = self._lane(provider, model)
+        priority = _priority.get()
+        deadline = time.monotonic() + MODEL_QUEUE_DEADLINES[priority]
+        for attempt in itertools.count():
+            self._admit(key, lane, tokens, priority, deadline)
+            try:
+                result = request()
+            except Exception as e:
+                if not is_rate_limited(e):
+                    raise
+                self._record_429(lane, e)
+                if attempt >= MODEL_RATE_LIMIT_RETRIES:
+                    raise
+                with lane.condition:
+                    lane.counters["retries"] += 1
+                continue
+            self._record_success(lane)
+            return result
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Per provider and model: admissions, sheds, 429s, retries, queue length, rate factor and mean waits."""
+        with self._lock:
+            lanes = dict(self._lanes)
+        stats = {}
+        for key, lane in lanes.items():
+            with lane.condition:
+                stats[key] = {
+                    **lane.counters,
+                    "queued": len(lane.queue),
+                    "rate_factor": round(lane.factor, 2),
+                    **{
+                        f"mean_wait_ms_{priority}": round(total / count * 1000, 1) if count else 0.0
+                        for priority, (count, total) in lane.waited.items()
+                    },
+                }
+        return stats
+
+
+SCHEDULER = ModelScheduler()
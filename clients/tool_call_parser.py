@@ -0,0 +1,130 @@
+# clients/tool_call_parser.py
+"""
+Incremental parser for the JSON tool-call envelope that prompt-based models
+(see `OllamaClient`) write as their reply. It is fed the reply as it streams
+and decides from the first characters whether the reply is a tool call or
+prose, then tracks brace depth, so the caller can stop generation as soon
+as the JSON object is closed. The parsed calls are computed once and kept.
+"""
+import json
+import re
+from typing import Any, Dict, List, Optional
+
+# A reply that is a tool call opens with the object, optionally inside a ```json fence.
+_LEADING_OBJECT = re.compile(r"\s*(?:```(?:json)?\s*)?\{")
+# Openings that could still turn into the above once more characters arrive.
+_PARTIAL_OPENING = re.compile(r"\s*(?:`{1,2}|```(?:j(?:s(?:on?)?)?)?\s*)$")
+# Prose may still carry a fenced envelope further on; that is only looked for once the reply is complete.
+_FENCED_OBJECT = re.compile(r"```json\s*\{")
+
+
+def _envelope_calls(content: str) -> List[Dict[str, Any]]:
+    try:
+        parsed_content = json.loads(content)
+        tool_calls = parsed_content.get("tool_calls")
+        if tool_calls is None:
+            tool_calls = [parsed_content.get("tool_call")]
+    except (json.JSONDecodeError, AttributeError):
+        return []
+
+    if not isinstance(tool_calls, list):
+        return []
+
+    return [
+        {"id": f"call_{index}", "name": tool_call["name"], "arguments": tool_call["arguments"]}
+        for index, tool_call in enumerate(tool_calls)
+        if isinstance(tool_call, dict) and "name" in tool_call and "arguments" in tool_call
+    ]
+
+
+class ToolCallParser:
+    """
+    Feed it the reply chunk by chunk. `is_prose` is None until the opening
+    characters decide it; `closed` turns True once a leading JSON object is
+    balanced, after which anything further is generation to be cut off.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self.is_prose: Optional[bool] = None
+        self.closed = False
+        self._start: Optional[int] = None
+        self._end: Optional[int] = None
+        # Brace scan state, kept between chunks so each character is looked at once.
+        self._scanned = 0
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._function_calls: Optional[List[Dict[str, Any]]] = None
+
+    def feed(self, chunk: str) -> None:
+        if self.closed or not chunk:
+            return
+        self.text += chunk
+        if self.is_prose is None:
+            self._decide()
+        if self._start is not None:
+            self._scan()
+
+    def _decide(self) -> None:
+        match = _LEADING_OBJECT.match(self.text)
+        if match:
+            self.is_prose = False
+            self._start = self._scanned = match.end() - 1
+        elif self.text.strip() and not _PARTIAL_OPENING.match(self.text):
+            self.is_prose = True
+
+    def _scan(self) -> None:
+        text = self.text
+        for index in range(self._scanned, len(text)):
+            char = text[index]
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char == "{":
+                self._depth += 1
+            elif char == "}":
+                self._depth -= 1
+                if self._depth == 0:
+                    self._end = index + 1
+                    self.closed = True
+                    return
+        self._scanned = len(text)
+
+    def reply_text(self) -> str:
+        """
+        The reply as it should be recorded: once the object has closed,
+        everything generated after it is dropped and an open fence closed.
+        """
+        if not self.closed:
+            return self.text
+        text = self.text[:self._end]
+        return text + "\n```" if text.lstrip().startswith("```") else text
+
+    def function_calls(self) -> List[Dict[str, Any]]:
+        """The calls in the reply, parsed on first use and then reused."""
+        if self._function_calls is None:
+            self._function_calls = self._parse()
+        return self._function_calls
+
+    def _parse(self) -> List[Dict[str, Any]]:
+        if self.closed:
+            return _envelope_calls(self.text[self._start:self._end])
+        match = _FENCED_OBJECT.search(self.text)
+        if not match:
+            return []
+        fenced = parse_tool_calls(self.text[match.start():])
+        return fenced.function_calls() if fenced.closed else []
+
+
+def parse_tool_calls(content: Optional[str]) -> ToolCallParser:
+    """A parser fed a complete reply at once."""
+    parser = ToolCallParser()
+    parser.feed(content or "")
+    return parser
@@ -0,0 +1,217 @@
+# conversation.py
+import contextvars
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple, TypedDict
+
+import tracing
+from clients.api_client import ApiClient
+from tools.registry import TOOL_REGISTRY
+from tools.weather_prefetch import Speculation, WeatherPrefetcher
+from tools.weather_router import FastPathRouter
+
+MAX_TOOL_WORKERS = 4
+
+
+class TurnResult(TypedDict):
+    input: str
+    output: str
+    function_calls: List[Dict[str, Any]]
+
+
+def _make_client(client_type: str, model_type: str) -> ApiClient:
+    if client_type == "gemini-genai":
+        from clients.genai_client import GenAIClient
+        return GenAIClient(model=model_type)
+    elif client_type == "gemini-openai":
+        from clients.openai_client import OpenAIClient
+        return OpenAIClient(model=model_type)
+    elif client_type == "gemma-openai":
+        from clients.ollama_client import OllamaClient
+        return OllamaClient(model=model_type)
+    raise ValueError(f"Unknown client type: {client_type}")
+
+
+def get_api_client(
+        client_type: str,
+        model_type: str,
+        response_store: Optional[Any] = None,
+        fallbacks: Optional[List[Tuple[str, str]]] = None,
+        hedge_percentile: Optional[float] = None,
+) -> ApiClient:
+    """
+    Factory function to get the appropriate API client. With `fallbacks`
+    ((client_type, model_type) pairs), it is combined with them in a
+    `HedgedClient`; with a `response_store`, the client is wrapped in a
+    `CachedClient`.
+    """
+    client = _make_client(client_type, model_type)
+    if fallbacks:
+        from clients.hedged_client import MODEL_HEDGE_PERCENTILE, HedgedClient
+        client = HedgedClient(
+            [client] + [_make_client(*fallback) for fallback in fallbacks],
+            MODEL_HEDGE_PERCENTILE if hedge_percentile is None else hedge_percentile,
+        )
+
+    if response_store is not None:
+        from clients.response_cache import CachedClient
+        client = CachedClient(client, response_store)
+    return client
+
+
+def execute_function_call(
+        function_call: Dict[str, Any], speculation: Optional[Speculation] = None
+) -> Dict[str, Any]:
+    """
+    Runs a single function call through the tool registry and wraps its
+    outcome for the model, reusing the speculative lookup for it if any.
+    """
+    with tracing.span("tool.call", tool=function_call["name"]) as span:
+        try:
+            prefetched = speculation.take(function_call) if speculation else None
+            if prefetched is not None:
+                span.set(prefetched=1)
+                result = prefetched.result()
+            else:
+                result = TOOL_REGISTRY.call(function_call["name"], function_call["arguments"])
+        except Exception as e:
+            result = {"error": str(e)}
+            span.set(error=str(e))
+    return {"id": function_call.get("id"), "name": function_call["name"], "result": result}
+
+
+def execute_function_calls(
+        function_calls: List[Dict[str, Any]],
+        executor: ThreadPoolExecutor,
+        speculation: Optional[Speculation] = None,
+) -> List[Dict[str, Any]]:
+    """Runs every function call of a turn concurrently, preserving call order."""
+    if len(function_calls) == 1:
+        return [execute_function_call(function_calls[0], speculation)]
+    # Each worker runs in a copy of this thread's context so its spans join the current turn.
+    contexts = [contextvars.copy_context() for _ in function_calls]
+    return list(executor.map(
+        lambda context, call: context.run(execute_function_call, call, speculation), contexts, function_calls
+    ))
+
+
+def route_function_calls(
+        client: ApiClient,
+        user_input: str,
+        router: Optional[FastPathRouter],
+        first_model_call: Optional[Callable[[], None]] = None,
+        speculation: Optional[Speculation] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Decides the function calls of a turn: locally through `router` when it is
+    confident (recorded in the client as a synthetic tool exchange), otherwise
+    by the first model call, `first_model_call` if given. A `speculation`
+    starts its lookups before the model call and is settled against its calls.
+    """
+    function_calls = router.route(user_input) if router else []
+    if function_calls:
+        with tracing.span("turn.fast_path", function_calls=len(function_calls)):
+            client.inject_function_calls(user_input, function_calls)
+        return function_calls
+
+    if speculation:
+        speculation.start()
+    start = time.perf_counter()
+    with tracing.span("turn.first_model_call"):
+        if first_model_call:
+            first_model_call()
+        else:
+            client.generate_content(user_input, function_execution_results=None)
+    function_calls = client.get_function_calls()
+    if router and function_calls:
+        router.record_model_routing(time.perf_counter() - start)
+    if speculation:
+        speculation.settle(function_calls)
+    return function_calls
+
+
+def run_turn(
+        client: ApiClient,
+        user_input: str,
+        executor: ThreadPoolExecutor,
+        on_function_calls: Optional[Callable[[List[Dict[str, Any]]], None]] = None,
+        router: Optional[FastPathRouter] = None,
+        prefetcher: Optional[WeatherPrefetcher] = None,
+) -> TurnResult:
+    """
+    Runs one full turn without any rendering: the model call, any function
+    calls it requests and the follow-up call that turns their results into
+    the final answer. With a `router`, plain weather questions skip the first
+    model call and go straight to the tool. With a `prefetcher`, likely
+    locations are looked up while the first model call runs.
+    """
+    speculation = prefetcher.speculation(user_input, executor) if prefetcher else None
+    with tracing.span("turn", client=type(client).__name__) as turn_span:
+        function_calls = route_function_calls(client, user_input, router, speculation=speculation)
+        turn_span.set(function_calls=len(function_calls), fast_path=bool(router and function_calls))
+        if function_calls:
+            if on_function_calls:
+                on_function_calls(function_calls)
+            with tracing.span("turn.tools"):
+                results = execute_function_calls(function_calls, executor, speculation)
+            with tracing.span("turn.second_model_call"):
+                client.generate_content(user_input=None, function_execution_results=results)
+
+    return {
+        "input": user_input,
+        "output": (client.get_text_response() or "").strip(),
+        "function_calls": function_calls,
+    }
+
+
+def _respond_with_events(
+        client: ApiClient,
+        user_input: Optional[str],
+        function_execution_results: Optional[List[Dict[str, Any]]],
+        tool_label: str,
+        stream: bool,
+        send: Callable[[Dict[str, Any]], None],
+) -> None:
+    streamed = False
+    if stream:
+        for chunk in client.stream_content(user_input, function_execution_results):
+            if streamed or chunk.strip():
+                send({"type": "chunk", "tool": tool_label, "text": chunk if streamed else chunk.lstrip()})
+                streamed = True
+    else:
+        client.generate_content(user_input, function_execution_results=function_execution_results)
+    if not streamed and not client.get_function_calls():
+        send({"type": "message", "tool": tool_label, "text": (client.get_text_response() or "").strip()})
+
+
+def run_turn_events(
+        client: ApiClient,
+        user_input: str,
+        executor: ThreadPoolExecutor,
+        send: Callable[[Dict[str, Any]], None],
+        stream: bool = False,
+        router: Optional[FastPathRouter] = None,
+        prefetcher: Optional[WeatherPrefetcher] = None,
+) -> None:
+    """
+    Runs one full turn for a remote front end, reporting it through `send`
+    as "tool_calls", "chunk" (when streaming) and "message" events. The
+    caller sends the closing "done" or "error" event.
+    """
+    speculation = prefetcher.speculation(user_input, executor) if prefetcher else None
+    with tracing.span("turn", client=type(client).__name__, stream=stream) as turn_span:
+        function_calls = route_function_calls(
+            client, user_input, router,
+            lambda: _respond_with_events(client, user_input, None, "None", stream, send),
+            speculation,
+        )
+        turn_span.set(function_calls=len(function_calls), fast_path=bool(router and function_calls))
+        if function_calls:
+            send({"type": "tool_calls", "calls": [
+                {"name": call["name"], "arguments": call["arguments"]} for call in function_calls
+            ]})
+            with tracing.span("turn.tools"):
+                results = execute_function_calls(function_calls, executor, speculation)
+            tool_names = ", ".join(dict.fromkeys(call["name"] for call in function_calls))
+            with tracing.span("turn.second_model_call"):
+                _respond_with_events(client, None, results, tool_names, stream, send)
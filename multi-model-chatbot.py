@@ -1,13 +1,14 @@
 # multi-model-chatbot.py
 import argparse
 import json
+import time
+from typing import Any, Dict, List, Optional, Tuple
 
+import tracing
 from clients.api_client import ApiClient
-from tools.weather_tool import get_current_weather
 
-from prompt_toolkit import prompt
-from prompt_toolkit.formatted_text import FormattedText
-from prompt_toolkit import print_formatted_text
+# prompt_toolkit, the SDKs and the turn pipeline are imported where they are first
+# needed, so `--attach`, `--daemon` and `--batch` never pay for the interactive UI.
 
 class Color:
     """Class to hold prompt_toolkit-compatible color names."""
@@ -16,24 +17,92 @@ class Color:
     BLUE = "ansiblue"
     RED = "ansired"
     BOLD = "bold"
+    GRAY = "ansibrightblack"
 
-def get_api_client(client_type: str, model_type: str) -> ApiClient:
-    """Factory function to get the appropriate API client."""
-    if client_type == "gemini-genai":
-        from clients.genai_client import GenAIClient
-        return GenAIClient(model=model_type)
-    elif client_type == "gemini-openai":
-        from clients.openai_client import OpenAIClient
-        return OpenAIClient(model=model_type)
-    elif client_type == "gemma-openai":
-        from clients.ollama_client import OllamaClient
-        return OllamaClient(model=model_type)
-    else:
-        raise ValueError(f"Unknown client type: {client_type}")
+def print_bot_message(tool_label: str, text: Optional[str]) -> None:
+    from prompt_toolkit import print_formatted_text
+    from prompt_toolkit.formatted_text import FormattedText
+
+    with tracing.span("turn.render"):
+        bot_msg = FormattedText([
+            (f'{Color.GREEN} {Color.BOLD}', 'd[o_0]b'),
+            (Color.BLUE, f'[Tool: {tool_label}]: '),
+            ('', f'{(text or "").strip()}')
+        ])
+        print_formatted_text(bot_msg)
+
+def render_response(
+        client: ApiClient,
+        user_input: Optional[str],
+        function_execution_results: Optional[List[Dict[str, Any]]],
+        tool_label: str,
+        stream: bool,
+) -> None:
+    """
+    Sends a request and prints the model's text reply, token by token when
+    streaming. Nothing is printed for replies that only carry function calls.
+    """
+    from prompt_toolkit import print_formatted_text
+    from prompt_toolkit.formatted_text import FormattedText
+
+    if not stream:
+        client.generate_content(user_input, function_execution_results=function_execution_results)
+        if not client.get_function_calls():
+            print_bot_message(tool_label, client.get_text_response())
+        return
+
+    start = time.perf_counter()
+    time_to_first_token = None
+    for chunk in client.stream_content(user_input, function_execution_results):
+        if time_to_first_token is None:
+            chunk = chunk.lstrip()
+            if not chunk:
+                continue
+            time_to_first_token = time.perf_counter() - start
+            print_formatted_text(FormattedText([
+                (f'{Color.GREEN} {Color.BOLD}', 'd[o_0]b'),
+                (Color.BLUE, f'[Tool: {tool_label}]: '),
+            ]), end='')
+        print_formatted_text(FormattedText([('', chunk)]), end='', flush=True)
+
+    if time_to_first_token is None:
+        # Nothing was streamed: either a pure function-call turn or output the client held back.
+        if not client.get_function_calls():
+            print_bot_message(tool_label, client.get_text_response())
+        return
+
+    print_formatted_text('')
+    print_formatted_text(FormattedText([(Color.GRAY, f'(time to first token: {time_to_first_token:.2f}s)')]))
 
-def main(client_type: str, model_type: str) -> None:
+def main(
+        client_type: str,
+        model_type: str,
+        stream: bool = False,
+        fast_path: bool = False,
+        response_cache: Optional[str] = None,
+        fallbacks: Optional[List[Tuple[str, str]]] = None,
+        hedge_percentile: Optional[float] = None,
+        prefetch: bool = False,
+) -> None:
     """Executes the chatbot flow using the selected API client."""
-    client = get_api_client(client_type, model_type)
+    from concurrent.futures import ThreadPoolExecutor
+
+    from conversation import MAX_TOOL_WORKERS, execute_function_calls, get_api_client, route_function_calls
+    from clients.response_cache import make_response_store
+    from tools.weather_prefetch import WeatherPrefetcher
+    from tools.weather_router import FastPathRouter
+
+    response_store = make_response_store(response_cache) if response_cache else None
+    router = FastPathRouter() if fast_path else None
+    prefetcher = WeatherPrefetcher() if prefetch else None
+    tool_executor = ThreadPoolExecutor(max_workers=MAX_TOOL_WORKERS)
+    # The SDK import and client setup run in the background while the user types the first message.
+    pending_client = tool_executor.submit(
+        get_api_client, client_type, model_type, response_store, fallbacks, hedge_percentile
+    )
+
+    from prompt_toolkit import print_formatted_text, prompt
+    from prompt_toolkit.formatted_text import FormattedText
 
     header = FormattedText([
         (Color.BOLD, 'Multi-model Chatbot '),
@@ -55,35 +124,28 @@ def main(client_type: str, model_type: str) -> None:
             if user_input.lower() in ("exit", "quit"):
                 break
 
-            client.generate_content(user_input, function_execution_result=None)
-
-            function_call = client.get_function_call()
-            if function_call:
-                thinking_msg = FormattedText([
-                    (f'{Color.GREEN} {Color.BOLD}', 'd[o_0]b'),
-                    (Color.BLUE, '[Tool: None]: '),
-                    ('', f"I am gonna call {function_call['name']} tool with arguments: {json.dumps(function_call['arguments'])}")
-                ])
-                print_formatted_text(thinking_msg)
-
-                result = get_current_weather(**function_call["arguments"])
-                client.generate_content(user_input=None, function_execution_result=result)
-                chatbot_message = client.get_text_response()
-
-                bot_msg = FormattedText([
-                    (f'{Color.GREEN} {Color.BOLD}', 'd[o_0]b'),
-                    (Color.BLUE, f'[Tool: {function_call["name"]}]: '),
-                    ('', f'{chatbot_message.strip()}')
-                ])
-                print_formatted_text(bot_msg)
-            else:
-                text_response = client.get_text_response()
-                bot_msg = FormattedText([
-                    (f'{Color.GREEN} {Color.BOLD}', 'd[o_0]b'),
-                    (Color.BLUE, '[Tool: None]: '),
-                    ('', f'{text_response.strip()}')
-                ])
-                print_formatted_text(bot_msg)
+            client = pending_client.result()
+            speculation = prefetcher.speculation(user_input, tool_executor) if prefetcher else None
+            with tracing.span("turn", client=client_type, stream=stream) as turn_span:
+                function_calls = route_function_calls(
+                    client, user_input, router, lambda: render_response(client, user_input, None, "None", stream),
+                    speculation,
+                )
+                turn_span.set(function_calls=len(function_calls), fast_path=bool(router and function_calls))
+                if function_calls:
+                    for function_call in function_calls:
+                        thinking_msg = FormattedText([
+                            (f'{Color.GREEN} {Color.BOLD}', 'd[o_0]b'),
+                            (Color.BLUE, '[Tool: None]: '),
+                            ('', f"I am gonna call {function_call['name']} tool with arguments: {json.dumps(function_call['arguments'])}")
+                        ])
+                        print_formatted_text(thinking_msg)
+
+                    with tracing.span("turn.tools"):
+                        results = execute_function_calls(function_calls, tool_executor, speculation)
+                    tool_names = ", ".join(dict.fromkeys(call["name"] for call in function_calls))
+                    with tracing.span("turn.second_model_call"):
+                        render_response(client, None, results, tool_names, stream)
 
         except KeyboardInterrupt:
             print()
@@ -91,6 +153,32 @@ def main(client_type: str, model_type: str) -> None:
         except EOFError:
             break
 
+    tool_executor.shutdown(wait=False)
+    if router:
+        stats = router.stats()
+        print_formatted_text(FormattedText([(Color.GRAY, (
+            f"Fast path: {stats['hits']}/{stats['queries']} turns ({stats['hit_ratio']:.0%}), "
+            f"about {stats['estimated_saved_ms'] / 1000:.2f}s of model routing saved"
+        ))]))
+    if prefetcher:
+        stats = prefetcher.stats()
+        print_formatted_text(FormattedText([(Color.GRAY, (
+            f"Prefetch: {stats['paid_off_turns']}/{stats['turns']} speculative turns paid off, "
+            f"{stats['hits']}/{stats['lookups']} lookups used"
+        ))]))
+    if response_store:
+        stats = response_store.stats()
+        print_formatted_text(FormattedText([(Color.GRAY, (
+            f"Response cache: {stats['hits']}/{stats['hits'] + stats['misses']} requests answered from cache"
+        ))]))
+    if fallbacks and pending_client.done() and not pending_client.exception():
+        client = pending_client.result()
+        stats = getattr(client, "client", client).stats()
+        print_formatted_text(FormattedText([(Color.GRAY, (
+            f"Hedging: {stats['hedges_won']}/{stats['hedges_fired']} hedges won, "
+            f"{stats['failovers']} failovers over {stats['requests']} requests"
+        ))]))
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Multi-model Chatbot with Function Calling")
     parser.add_argument(
@@ -107,5 +195,117 @@ if __name__ == "__main__":
         default="gemini-2.5-flash-lite-preview-06-17",
         help="LLM model to use."
     )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Stream model replies token by token and report time to first token."
+    )
+    parser.add_argument(
+        "--fast-path",
+        action="store_true",
+        help="Answer plain weather questions without the model's routing call and report the hit rate."
+    )
+    parser.add_argument(
+        "--prefetch",
+        action="store_true",
+        help="Look up the weather for likely cities while the model decides, and report how often it paid off."
+    )
+    parser.add_argument(
+        "--response-cache",
+        choices=["memory", "sqlite"],
+        help="Answer repeated requests from a response cache kept in memory or in SQLite."
+    )
+    parser.add_argument(
+        "--fallback",
+        type=str,
+        action="append",
+        metavar="CLIENT:MODEL",
+        help="Another client and model to hedge slow requests to and fail over to; may be repeated."
+    )
+    parser.add_argument(
+        "--hedge-percentile",
+        type=float,
+        help="Hedge requests slower than this percentile of the primary's latency; 0 only fails over "
+             "(or set MODEL_HEDGE_PERCENTILE)."
+    )
+    parser.add_argument(
+        "--daemon",
+        action="store_true",
+        help="Run a long-lived daemon that keeps SDKs, HTTP pools and caches warm for --attach sessions."
+    )
+    parser.add_argument(
+        "--attach",
+        action="store_true",
+        help="Chat through a running --daemon instead of starting the clients in this process."
+    )
+    parser.add_argument(
+        "--socket",
+        type=str,
+        help="Unix socket shared by --daemon and --attach (or set CHATBOT_SOCKET)."
+    )
+    parser.add_argument(
+        "--serve",
+        type=str,
+        metavar="HOST:PORT",
+        help="Serve many concurrent chat sessions over HTTP, streaming replies as Server-Sent Events."
+    )
+    parser.add_argument(
+        "--batch",
+        type=str,
+        metavar="INPUT_JSONL",
+        help="Run the conversations in a JSONL file headlessly instead of the interactive prompt."
+    )
+    parser.add_argument(
+        "--output",
+        type=str,
+        metavar="RESULTS_JSONL",
+        help="Where --batch appends its results; re-running resumes an interrupted run."
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=4,
+        help="Number of conversations --batch runs in parallel."
+    )
+    parser.add_argument(
+        "--trace-file",
+        type=str,
+        help="Append per-turn timing spans to this JSON-lines file (or set CHATBOT_TRACE_FILE)."
+    )
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        help="Serve Prometheus-style metrics at http://127.0.0.1:PORT/metrics (or set CHATBOT_METRICS_PORT)."
+    )
     args = parser.parse_args()
-    main(args.client, args.model)
+    fallbacks = [tuple(fallback.split(":", 1)) for fallback in args.fallback or []]
+    if any(len(fallback) != 2 for fallback in fallbacks):
+        parser.error("--fallback expects CLIENT:MODEL")
+    if args.attach:
+        from chat_daemon import CHATBOT_SOCKET, attach
+        raise SystemExit(attach(
+            args.socket or CHATBOT_SOCKET, args.client, args.model,
+            stream=args.stream, fast_path=args.fast_path, prefetch=args.prefetch,
+        ))
+    tracing.configure(trace_file=args.trace_file, metrics_port=args.metrics_port)
+    if args.daemon:
+        from chat_daemon import CHATBOT_SOCKET, serve
+        serve(args.socket or CHATBOT_SOCKET, args.client, args.model)
+    elif args.serve:
+        from chat_server import serve
+        host, _, port = args.serve.rpartition(":")
+        serve(host or "127.0.0.1", int(port), args.client, args.model)
+    elif args.batch:
+        if not args.output:
+            parser.error("--batch requires --output")
+        from batch_runner import run_batch
+        print(json.dumps(run_batch(
+            args.batch, args.output, args.client, args.model, args.concurrency,
+            fast_path=args.fast_path, response_cache=args.response_cache, prefetch=args.prefetch,
+        )))
+    else:
+        main(
+            args.client, args.model,
+            stream=args.stream, fast_path=args.fast_path, response_cache=args.response_cache,
+            fallbacks=fallbacks, hedge_percentile=args.hedge_percentile, prefetch=args.prefetch,
+        )
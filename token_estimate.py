@@ -0,0 +1,11 @@
+# token_estimate.py
+"""
+Provider-neutral token estimate shared by the clients (conversation window,
+scheduler demand) and the tools (result budgets), so neither package has to
+import the other for it.
+"""
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap provider-neutral token estimate (~4 characters per token)."""
+    return len(text) // 4 + 1
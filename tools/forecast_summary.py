@@ -0,0 +1,81 @@
+# tools/forecast_summary.py
+"""
+Reduces Open-Meteo hourly series to the compact, schema-stable summary the
+model gets from `get_weather_forecast`. The API returns hourly data as
+columns (one array per variable); each day's slice of every column is
+reduced to a few numbers, so a week of hourly data becomes one short row per
+day. Rows are dropped from the end until the encoded summary fits the token
+budget, and the number dropped is reported instead.
+"""
+import os
+from typing import Any, Dict, List, Optional, Sequence
+
+from token_estimate import estimate_tokens
+from tools.registry import encode_result
+
+WEATHER_TOOL_RESULT_TOKEN_BUDGET = int(os.environ.get("WEATHER_TOOL_RESULT_TOKEN_BUDGET", "200"))
+
+FORECAST_COLUMNS = [
+    "date", "temp_min", "temp_max", "temp_mean", "precip_chance_max", "wind_max", "conditions",
+]
+
+
+def _present(values: Sequence[Optional[float]]) -> List[float]:
+    # Open-Meteo pads the ends of a series with nulls.
+    return [value for value in values if value is not None]
+
+
+def _mean(values: Sequence[float]) -> Optional[float]:
+    return sum(values) / len(values) if values else None
+
+
+def _round(value: Optional[float]) -> Optional[float]:
+    return round(value, 1) if value is not None else None
+
+
+def slope(values: Sequence[Optional[float]]) -> Optional[float]:
+    """Least-squares slope of `values` per step, ignoring gaps; None with fewer than two points."""
+    points = [(step, value) for step, value in enumerate(values) if value is not None]
+    if len(points) < 2:
+        return None
+    mean_step = _mean([step for step, _ in points])
+    mean_value = _mean([value for _, value in points])
+    spread = sum((step - mean_step) ** 2 for step, _ in points)
+    return sum((step - mean_step) * (value - mean_value) for step, value in points) / spread
+
+
+def daily_rows(hourly: Dict[str, List[Any]], describe_code) -> List[List[Any]]:
+    """One `FORECAST_COLUMNS` row per calendar day of the hourly columns."""
+    days: Dict[str, List[int]] = {}
+    for index, timestamp in enumerate(hourly["time"]):
+        days.setdefault(timestamp[:10], []).append(index)
+
+    rows = []
+    for date, indexes in days.items():
+        def column(name: str) -> List[float]:
+            values = hourly.get(name) or []
+            return _present([values[index] for index in indexes if index < len(values)])
+
+        temperatures = column("temperature_2m")
+        precipitation = column("precipitation_probability")
+        wind = column("wind_speed_10m")
+        codes = column("weather_code")
+        rows.append([
+            date,
+            _round(min(temperatures)) if temperatures else None,
+            _round(max(temperatures)) if temperatures else None,
+            _round(_mean(temperatures)),
+            round(max(precipitation)) if precipitation else None,
+            _round(max(wind)) if wind else None,
+            # WMO codes grow with severity, so the largest is the day's most notable weather.
+            describe_code(int(max(codes))) if codes else None,
+        ])
+    return rows
+
+
+def fit_to_budget(summary: Dict[str, Any], token_budget: int = WEATHER_TOOL_RESULT_TOKEN_BUDGET) -> Dict[str, Any]:
+    """Drops the last rows of `summary` until its encoding fits `token_budget`; always keeps one row."""
+    while len(summary["rows"]) > 1 and estimate_tokens(encode_result(summary)) > token_budget:
+        summary["rows"].pop()
+        summary["omitted_days"] += 1
+    return summary
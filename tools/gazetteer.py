@@ -0,0 +1,251 @@
+# tools/gazetteer.py
+"""
+Offline gazetteer: a sorted, memory-mapped index of city names built from
+the GeoNames `cities15000` dump, so common locations resolve without a
+geocoding request. Rebuild it with
+
+    python -m tools.gazetteer build
+
+The index is only mapped on the first lookup and pages are loaded on demand,
+so it costs next to nothing at startup.
+"""
+import argparse
+import bisect
+import io
+import mmap
+import os
+import struct
+import sys
+import threading
+import zipfile
+from typing import Iterator, List, NamedTuple, Optional, Tuple
+
+from tools.weather_cache import Coordinates, normalize_location
+
+GAZETTEER_PATH = os.environ.get(
+    "WEATHER_GAZETTEER",
+    os.path.join(os.path.expanduser("~"), ".cache", "gemini-function-calling", "gazetteer.idx"),
+)
+GEONAMES_CITIES_URL = "https://download.geonames.org/export/dump/cities15000.zip"
+
+MAGIC = b"GZT1"
+_HEADER = struct.Struct("<4sI")
+_OFFSET = struct.Struct("<I")
+FIELD_SEPARATOR = "\x1f"
+MAX_ALIAS_LENGTH = 40
+PREFIX_SCAN_LIMIT = 256
+
+# Match kinds, best first: the name as typed, the name case-folded, then an alternate name.
+EXACT, CASEFOLD, ALIAS = 0, 1, 2
+
+
+class Place(NamedTuple):
+    name: str
+    country: str
+    latitude: float
+    longitude: float
+    population: int
+
+
+def _is_latin(text: str) -> bool:
+    # Alternate names in other scripts are numerous and rarely typed into this chatbot.
+    return all(ord(char) < 0x250 for char in text)
+
+
+def _read_geonames(source: str) -> Iterator[List[str]]:
+    """Yields the tab-separated rows of a GeoNames dump, plain or zipped."""
+    if source.endswith(".zip"):
+        with zipfile.ZipFile(source) as archive:
+            member = next(name for name in archive.namelist() if name.endswith(".txt"))
+            with archive.open(member) as raw:
+                for line in io.TextIOWrapper(raw, encoding="utf-8"):
+                    yield line.rstrip("\n").split("\t")
+    else:
+        with open(source, encoding="utf-8") as dump:
+            for line in dump:
+                yield line.rstrip("\n").split("\t")
+
+
+def build_index(source: str, output_path: str) -> int:
+    """
+    Builds the index at `output_path` from a GeoNames cities dump and returns
+    the number of keys. Every city is indexed under its name, its ASCII name
+    and its Latin-script alternate names; entries sharing a key are ordered
+    by population, largest first.
+    """
+    entries = []
+    for row in _read_geonames(source):
+        if len(row) < 15:
+            continue
+        name, ascii_name, alternate_names = row[1], row[2], row[3]
+        latitude, longitude, country, population = row[4], row[5], row[8], int(row[14] or 0)
+        keys = {normalize_location(name): "n", normalize_location(ascii_name): "n"}
+        for alias in alternate_names.split(","):
+            key = normalize_location(alias)
+            if key and len(key) <= MAX_ALIAS_LENGTH and _is_latin(key) and not any(c.isdigit() for c in key):
+                keys.setdefault(key, "a")
+        record = FIELD_SEPARATOR.join((name, country, latitude, longitude, str(population)))
+        for key, kind in keys.items():
+            if key:
+                entries.append((key.encode(), -population, f"{key}{FIELD_SEPARATOR}{kind}{FIELD_SEPARATOR}{record}\n"))
+
+    entries.sort(key=lambda entry: (entry[0], entry[1]))
+    records = [entry[2].encode() for entry in entries]
+
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    temporary_path = f"{output_path}.tmp"
+    with open(temporary_path, "wb") as index_file:
+        index_file.write(_HEADER.pack(MAGIC, len(records)))
+        offset = 0
+        for record in records:
+            index_file.write(_OFFSET.pack(offset))
+            offset += len(record)
+        for record in records:
+            index_file.write(record)
+    os.replace(temporary_path, output_path)
+    return len(records)
+
+
+class Gazetteer:
+    """
+    Read-only view over an index built by `build_index`. Lookups binary-search
+    the memory-mapped key table; a missing index simply resolves nothing.
+    """
+
+    def __init__(self, path: Optional[str] = GAZETTEER_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._map: Optional[mmap.mmap] = None
+        self._count = 0
+        self._data_start = 0
+        self._loaded = False
+        self.hits = 0
+        self.misses = 0
+
+    def _open(self) -> bool:
+        if self._loaded:
+            return self._map is not None
+        with self._lock:
+            if not self._loaded:
+                self._loaded = True
+                # An empty or truncated index is treated like a missing one, so lookups fall back to geocoding.
+                if self.path and os.path.exists(self.path) and os.path.getsize(self.path) >= _HEADER.size:
+                    with open(self.path, "rb") as index_file:
+                        mapped = mmap.mmap(index_file.fileno(), 0, access=mmap.ACCESS_READ)
+                    magic, count = _HEADER.unpack_from(mapped, 0)
+                    if magic == MAGIC and len(mapped) >= _HEADER.size + count * _OFFSET.size:
+                        self._map, self._count = mapped, count
+                        self._data_start = _HEADER.size + count * _OFFSET.size
+                    else:
+                        mapped.close()
+        return self._map is not None
+
+    def _start(self, index: int) -> int:
+        return self._data_start + _OFFSET.unpack_from(self._map, _HEADER.size + index * _OFFSET.size)[0]
+
+    def _record(self, index: int) -> bytes:
+        start = self._start(index)
+        return self._map[start:self._map.find(b"\n", start)]
+
+    def _key(self, index: int) -> bytes:
+        start = self._start(index)
+        return self._map[start:self._map.find(b"\x1f", start)]
+
+    def _lower_bound(self, key: bytes) -> int:
+        return bisect.bisect_left(range(self._count), key, key=self._key)
+
+    def _entry(self, index: int) -> Tuple[str, Place]:
+        _, kind, name, country, latitude, longitude, population = self._record(index).decode().split(FIELD_SEPARATOR)
+        return kind, Place(name, country, float(latitude), float(longitude), int(population))
+
+    def lookup(self, location: str) -> Optional[Place]:
+        """
+        Resolves `location` by exact name, then case-folded name, then alternate
+        name; ties within the best kind of match go to the most populous city.
+        """
+        key = normalize_location(location)
+        if not key or not self._open():
+            return None
+        best: Optional[Tuple[int, int, Place]] = None
+        index = self._lower_bound(key.encode())
+        while index < self._count and self._key(index) == key.encode():
+            kind, place = self._entry(index)
+            rank = EXACT if place.name == location.strip() else CASEFOLD if kind == "n" else ALIAS
+            if best is None or (rank, -place.population) < best[:2]:
+                best = (rank, -place.population, place)
+            index += 1
+        with self._lock:
+            if best:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return best[2] if best else None
+
+    def complete(self, prefix: str, limit: int = 5) -> List[Place]:
+        """Returns up to `limit` distinct cities whose names start with `prefix`, most populous first."""
+        key = normalize_location(prefix).encode()
+        if not key or not self._open():
+            return []
+        places = {}
+        index = self._lower_bound(key)
+        scanned = 0
+        while index < self._count and scanned < PREFIX_SCAN_LIMIT and self._key(index).startswith(key):
+            _, place = self._entry(index)
+            places[(place.name, place.country, place.latitude, place.longitude)] = place
+            index += 1
+            scanned += 1
+        return sorted(places.values(), key=lambda place: -place.population)[:limit]
+
+    def coordinates(self, location: str) -> Optional[Coordinates]:
+        place = self.lookup(location)
+        return (place.latitude, place.longitude) if place else None
+
+    def close(self) -> None:
+        with self._lock:
+            if self._map is not None:
+                self._map.close()
+                self._map = None
+
+
+def _download(url: str, destination: str) -> None:
+    import requests
+
+    os.makedirs(os.path.dirname(os.path.abspath(destination)), exist_ok=True)
+    with requests.get(url, stream=True, timeout=60) as response:
+        response.raise_for_status()
+        with open(destination, "wb") as download:
+            for chunk in response.iter_content(chunk_size=1 << 16):
+                download.write(chunk)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Offline gazetteer for the weather tool")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    build = subcommands.add_parser("build", help="(Re)build the index from a GeoNames cities dump.")
+    build.add_argument("--source", help="Local cities dump (.txt or .zip); downloaded when omitted.")
+    build.add_argument("--url", default=GEONAMES_CITIES_URL)
+    build.add_argument("--output", default=GAZETTEER_PATH)
+    lookup = subcommands.add_parser("lookup", help="Resolve locations against the index.")
+    lookup.add_argument("locations", nargs="+")
+    lookup.add_argument("--prefix", action="store_true", help="List completions instead of the best match.")
+    lookup.add_argument("--index", default=GAZETTEER_PATH)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        source = args.source
+        if not source:
+            source = f"{args.output}.{os.path.basename(args.url)}"
+            print(f"Downloading {args.url} ...")
+            _download(args.url, source)
+        print(f"Wrote {build_index(source, args.output)} keys to {args.output}")
+        return 0
+
+    gazetteer = Gazetteer(args.index)
+    for location in args.locations:
+        found = gazetteer.complete(location) if args.prefix else [gazetteer.lookup(location)]
+        print(f"{location}: {[place for place in found if place] or 'not found'}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
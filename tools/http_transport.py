@@ -0,0 +1,194 @@
+# tools/http_transport.py
+import asyncio
+import os
+import random
+import threading
+import time
+import urllib.parse
+import weakref
+from typing import Any, Dict, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+RETRYABLE_STATUS_CODES = frozenset({429, 500, 502, 503, 504})
+
+
+def _env_float(name: str, default: float) -> float:
+    return float(os.environ.get(name, default))
+
+
+def _env_int(name: str, default: int) -> int:
+    return int(os.environ.get(name, default))
+
+
+class _TransportSettings:
+    """Connection, timeout and retry settings shared by the sync and async transports."""
+
+    def __init__(
+            self,
+            pool_size: Optional[int] = None,
+            connect_timeout: Optional[float] = None,
+            read_timeout: Optional[float] = None,
+            max_retries: Optional[int] = None,
+            backoff_base: Optional[float] = None,
+            backoff_max: Optional[float] = None,
+            max_per_host: Optional[int] = None,
+    ):
+        self.pool_size = pool_size if pool_size is not None else _env_int("WEATHER_HTTP_POOL_SIZE", 10)
+        self.connect_timeout = (
+            connect_timeout if connect_timeout is not None else _env_float("WEATHER_HTTP_CONNECT_TIMEOUT", 3.05)
+        )
+        self.read_timeout = read_timeout if read_timeout is not None else _env_float("WEATHER_HTTP_READ_TIMEOUT", 10)
+        self.max_retries = max_retries if max_retries is not None else _env_int("WEATHER_HTTP_MAX_RETRIES", 2)
+        self.backoff_base = backoff_base if backoff_base is not None else _env_float("WEATHER_HTTP_BACKOFF_BASE", 0.2)
+        self.backoff_max = backoff_max if backoff_max is not None else _env_float("WEATHER_HTTP_BACKOFF_MAX", 2)
+        self.max_per_host = max_per_host if max_per_host is not None else _env_int("WEATHER_HTTP_MAX_PER_HOST", 8)
+
+    @property
+    def timeout(self) -> tuple:
+        return self.connect_timeout, self.read_timeout
+
+    def backoff_delay(self, attempt: int, retry_after: Optional[str] = None) -> float:
+        """Full-jitter exponential backoff, honouring a numeric Retry-After header."""
+        if retry_after:
+            try:
+                return min(float(retry_after), self.backoff_max)
+            except ValueError:
+                pass
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+
+class HttpTransport(_TransportSettings):
+    """
+    Shared HTTP transport for the tools: a keep-alive connection pool with
+    connect/read timeouts, bounded retries with jittered exponential backoff
+    and a per-host concurrency limit. Unset arguments fall back to the
+    `WEATHER_HTTP_*` environment variables.
+    """
+
+    def __init__(self, **settings: Any):
+        super().__init__(**settings)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        self._host_limits: Dict[str, threading.BoundedSemaphore] = {}
+        self._host_limits_lock = threading.Lock()
+
+    def _host_limit(self, url: str) -> threading.BoundedSemaphore:
+        host = urllib.parse.urlsplit(url).netloc
+        with self._host_limits_lock:
+            limit = self._host_limits.get(host)
+            if limit is None:
+                limit = self._host_limits[host] = threading.BoundedSemaphore(self.max_per_host)
+            return limit
+
+    def get(self, url: str, params: Optional[Dict[str, Any]] = None) -> requests.Response:
+        """
+        Performs a GET, retrying connection errors, timeouts and retryable
+        status codes. The last response is returned as-is so callers can
+        `raise_for_status()` like they would with `requests.get`.
+        """
+        attempt = 0
+        while True:
+            try:
+                with self._host_limit(url):
+                    response = self.session.get(url, params=params, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt >= self.max_retries:
+                    raise
+                time.sleep(self.backoff_delay(attempt))
+            else:
+                if response.status_code not in RETRYABLE_STATUS_CODES or attempt >= self.max_retries:
+                    return response
+                delay = self.backoff_delay(attempt, response.headers.get("Retry-After"))
+                response.close()
+                time.sleep(delay)
+            attempt += 1
+
+    def close(self) -> None:
+        self.session.close()
+
+
+class AsyncHttpTransport(_TransportSettings):
+    """
+    asyncio counterpart of `HttpTransport` built on `httpx.AsyncClient`, with
+    the same pooling, timeout, retry and per-host limit settings. An instance
+    is bound to the event loop it is first used on.
+    """
+
+    def __init__(self, **settings: Any):
+        super().__init__(**settings)
+        import httpx  # only the async path needs httpx
+
+        self._httpx = httpx
+        self.client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size),
+            timeout=httpx.Timeout(self.read_timeout, connect=self.connect_timeout),
+        )
+        self._host_limits: Dict[str, asyncio.Semaphore] = {}
+
+    def _host_limit(self, url: str) -> asyncio.Semaphore:
+        host = urllib.parse.urlsplit(url).netloc
+        limit = self._host_limits.get(host)
+        if limit is None:
+            limit = self._host_limits[host] = asyncio.Semaphore(self.max_per_host)
+        return limit
+
+    async def get(self, url: str, params: Optional[Dict[str, Any]] = None):
+        """Async version of `HttpTransport.get`; returns an `httpx.Response`."""
+        attempt = 0
+        while True:
+            try:
+                async with self._host_limit(url):
+                    response = await self.client.get(url, params=params)
+            except self._httpx.TransportError:
+                if attempt >= self.max_retries:
+                    raise
+                await asyncio.sleep(self.backoff_delay(attempt))
+            else:
+                if response.status_code not in RETRYABLE_STATUS_CODES or attempt >= self.max_retries:
+                    return response
+                retry_after = response.headers.get("Retry-After")
+                # Release the connection before backing off instead of holding it for the whole delay.
+                await response.aclose()
+                await asyncio.sleep(self.backoff_delay(attempt, retry_after))
+            attempt += 1
+
+    async def aclose(self) -> None:
+        await self.client.aclose()
+
+
+_default_transport: Optional[HttpTransport] = None
+_default_transport_lock = threading.Lock()
+
+
+def get_transport() -> HttpTransport:
+    """Returns the process-wide transport, creating it on first use."""
+    global _default_transport
+    if _default_transport is None:
+        with _default_transport_lock:
+            if _default_transport is None:
+                _default_transport = HttpTransport()
+    return _default_transport
+
+
+def set_transport(transport: HttpTransport) -> None:
+    """Replaces the process-wide transport, e.g. to change pool size or timeouts."""
+    global _default_transport
+    with _default_transport_lock:
+        _default_transport = transport
+
+
+_async_transports: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncHttpTransport]" = weakref.WeakKeyDictionary()
+
+
+def get_async_transport() -> AsyncHttpTransport:
+    """Returns the async transport for the running event loop, creating it on first use."""
+    loop = asyncio.get_running_loop()
+    transport = _async_transports.get(loop)
+    if transport is None:
+        transport = _async_transports[loop] = AsyncHttpTransport()
+    return transport
@@ -0,0 +1,221 @@
+# tools/micro_batcher.py
+"""
+Micro-batching of upstream lookups. Calls that arrive within a short window
+are collected into one batch and sent as a single request; each caller then
+gets its own item of the response. A batch is sent when its window ends or
+it is full: by the thread that opened it, or for coroutines by a task on
+their event loop, so no background thread is needed. Threads and coroutines
+are batched separately, coroutines per event loop.
+
+A call only waits for others when other calls are in progress; a lone
+caller is sent at once. If a batched request fails, its items are retried
+one by one, so each caller gets its own result or error.
+"""
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Dict, Generic, List, Optional, Set, TypeVar
+
+Item = TypeVar("Item")
+
+
+class _Batch:
+    __slots__ = ("items", "results", "errors", "full", "done")
+
+    def __init__(self, full: Any, done: Any):
+        self.items: List[Any] = []
+        self.results: List[Any] = []
+        self.errors: List[Optional[BaseException]] = []
+        self.full = full
+        self.done = done
+
+    def outcome(self, index: int) -> Any:
+        if self.errors[index] is not None:
+            raise self.errors[index]
+        return self.results[index]
+
+
+class MicroBatcher(Generic[Item]):
+    """
+    Batches calls to `fetch_many` (and `fetch_many_async`), which take a list
+    of items and return one result per item, in order. `window` is the most a
+    call waits for others to join its batch; 0 sends every call on its own.
+    """
+
+    def __init__(
+            self,
+            fetch_many: Callable[[List[Item]], List[Any]],
+            fetch_many_async: Optional[Callable[[List[Item]], Awaitable[List[Any]]]] = None,
+            window: float = 0.01,
+            max_size: int = 50,
+    ):
+        self.fetch_many = fetch_many
+        self.fetch_many_async = fetch_many_async
+        self.window = window
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._open: Optional[_Batch] = None
+        self._open_async: Dict[asyncio.AbstractEventLoop, _Batch] = {}
+        self._senders: Set[asyncio.Task] = set()
+        # Calls that have not returned yet, per event loop for coroutines; a batch only waits when there are others.
+        self._active = 0
+        self._active_async: Dict[asyncio.AbstractEventLoop, int] = {}
+        self.calls = 0
+        self.batches = 0
+        self.retried_batches = 0
+
+    def _join(self, batch: _Batch, item: Item) -> int:
+        # Called with the lock held; returns the item's index within the batch.
+        self.calls += 1
+        batch.items.append(item)
+        return len(batch.items) - 1
+
+    def _check(self, batch: _Batch, results: List[Any]) -> List[Any]:
+        if len(results) != len(batch.items):
+            raise ValueError(f"Expected {len(batch.items)} results from a batched request, got {len(results)}")
+        return results
+
+    def _fill(self, batch: _Batch, results: List[Any], errors: List[Optional[BaseException]]) -> None:
+        batch.results = results
+        batch.errors = errors
+        if len(batch.items) > 1 and any(error is not None for error in errors):
+            with self._lock:
+                self.retried_batches += 1
+
+    def _send(self, batch: _Batch) -> None:
+        try:
+            results = self._check(batch, self.fetch_many(batch.items))
+            self._fill(batch, results, [None] * len(results))
+            return
+        except Exception as e:
+            if len(batch.items) == 1:
+                self._fill(batch, [None], [e])
+                return
+        # One bad item fails the whole request; retried alone, only that item's caller gets the error.
+        results, errors = [], []
+        for item in batch.items:
+            try:
+                results.append(self.fetch_many([item])[0])
+                errors.append(None)
+            except Exception as e:
+                results.append(None)
+                errors.append(e)
+        self._fill(batch, results, errors)
+
+    async def _send_batch_async(self, batch: _Batch) -> None:
+        try:
+            results = self._check(batch, await self.fetch_many_async(batch.items))
+            self._fill(batch, results, [None] * len(results))
+            return
+        except Exception as e:
+            if len(batch.items) == 1:
+                self._fill(batch, [None], [e])
+                return
+        outcomes = await asyncio.gather(
+            *(self.fetch_many_async([item]) for item in batch.items), return_exceptions=True
+        )
+        self._fill(
+            batch,
+            [None if isinstance(outcome, BaseException) else outcome[0] for outcome in outcomes],
+            [outcome if isinstance(outcome, BaseException) else None for outcome in outcomes],
+        )
+
+    def get(self, item: Item) -> Any:
+        """Returns the result for `item`, fetched together with whatever else arrives within the window."""
+        if self.window <= 0 or self.max_size <= 1:
+            with self._lock:
+                self.calls += 1
+                self.batches += 1
+            return self.fetch_many([item])[0]
+
+        with self._lock:
+            self._active += 1
+            batch = self._open
+            leader = batch is None
+            if leader:
+                batch = self._open = _Batch(threading.Event(), threading.Event())
+                self.batches += 1
+            index = self._join(batch, item)
+            if len(batch.items) >= self.max_size:
+                self._open = None
+                batch.full.set()
+
+        try:
+            if leader:
+                with self._lock:
+                    alone = self._active == 1
+                if not alone:
+                    batch.full.wait(self.window)
+                with self._lock:
+                    if self._open is batch:
+                        self._open = None
+                try:
+                    self._send(batch)
+                finally:
+                    batch.done.set()
+            else:
+                batch.done.wait()
+        finally:
+            with self._lock:
+                self._active -= 1
+        return batch.outcome(index)
+
+    async def get_async(self, item: Item) -> Any:
+        """Async counterpart of `get`, batching with other coroutines on the same event loop."""
+        if self.window <= 0 or self.max_size <= 1 or self.fetch_many_async is None:
+            with self._lock:
+                self.calls += 1
+                self.batches += 1
+            if self.fetch_many_async is None:
+                return (await asyncio.to_thread(self.fetch_many, [item]))[0]
+            return (await self.fetch_many_async([item]))[0]
+
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            self._active_async[loop] = self._active_async.get(loop, 0) + 1
+            batch = self._open_async.get(loop)
+            if batch is None:
+                batch = self._open_async[loop] = _Batch(asyncio.Event(), asyncio.Event())
+                self.batches += 1
+                # The batch is sent by its own task, so it goes out even if the caller that opened it is cancelled.
+                sender = loop.create_task(self._send_async(batch, loop))
+                self._senders.add(sender)
+                sender.add_done_callback(self._senders.discard)
+            index = self._join(batch, item)
+            if len(batch.items) >= self.max_size:
+                del self._open_async[loop]
+                batch.full.set()
+
+        try:
+            await asyncio.shield(batch.done.wait())
+        finally:
+            with self._lock:
+                self._active_async[loop] -= 1
+                if not self._active_async[loop]:
+                    del self._active_async[loop]
+        return batch.outcome(index)
+
+    async def _send_async(self, batch: _Batch, loop: asyncio.AbstractEventLoop) -> None:
+        with self._lock:
+            alone = self._active_async.get(loop, 0) <= 1
+        if not alone:
+            try:
+                await asyncio.wait_for(batch.full.wait(), self.window)
+            except asyncio.TimeoutError:
+                pass
+        with self._lock:
+            if self._open_async.get(loop) is batch:
+                del self._open_async[loop]
+        try:
+            await self._send_batch_async(batch)
+        finally:
+            batch.done.set()
+
+    def stats(self) -> Dict[str, float]:
+        """Calls, upstream requests (batches), batches retried item by item and the mean batch size."""
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "batches": self.batches,
+                "retried_batches": self.retried_batches,
+                "mean_batch_size": self.calls / self.batches if self.batches else 0.0,
+            }
@@ -0,0 +1,229 @@
+# tools/registry.py
+"""
+Registry of the tools the model may call. Tools, and the system
+instructions that go with them, are registered by import path and only
+imported when first needed. Each tool's JSON schema is derived
+once from its signature, docstring and `TypedDict` return type, and the
+per-provider forms (and their serialized text) are cached. Calls are
+dispatched by name and validated against the derived schema.
+"""
+import importlib
+import inspect
+import json
+import re
+import threading
+import typing
+from typing import Any, Callable, Dict, List, Literal, Optional, Tuple, Union, get_args, get_origin
+
+_JSON_TYPES = {str: "string", int: "integer", float: "number", bool: "boolean"}
+_ARGS_SECTION = re.compile(r"^\s*Args:\s*$(?P<body>.*?)(?:^\s*\w+:\s*$|\Z)", re.MULTILINE | re.DOTALL)
+_ARG_LINE = re.compile(r"^\s*(?P<name>\w+)(?:\s*\([^)]*\))?:\s*(?P<description>.+)$", re.MULTILINE)
+
+
+def encode_result(result: Any) -> str:
+    """A tool result as compact JSON text, the one encoding every client sends to the model."""
+    return json.dumps(result, ensure_ascii=False, separators=(",", ":"), default=str)
+
+
+class ToolArgumentError(ValueError):
+    """Raised when a function call's arguments do not match the tool's schema."""
+
+
+def _json_schema(annotation: Any) -> Dict[str, Any]:
+    """Maps a type annotation to a JSON schema fragment."""
+    origin = get_origin(annotation)
+    if annotation in _JSON_TYPES:
+        return {"type": _JSON_TYPES[annotation]}
+    if origin is Union:
+        members = [member for member in get_args(annotation) if member is not type(None)]
+        return _json_schema(members[0]) if len(members) == 1 else {"anyOf": [_json_schema(m) for m in members]}
+    if origin is Literal:
+        return {"type": _JSON_TYPES[type(get_args(annotation)[0])], "enum": list(get_args(annotation))}
+    if origin in (list, List):
+        (item,) = get_args(annotation) or (Any,)
+        return {"type": "array", "items": _json_schema(item)} if item is not Any else {"type": "array"}
+    if typing.is_typeddict(annotation):
+        hints = typing.get_type_hints(annotation)
+        return {
+            "type": "object",
+            "properties": {name: _json_schema(hint) for name, hint in hints.items()},
+            "required": sorted(annotation.__required_keys__),
+        }
+    if origin in (dict, Dict) or annotation is dict:
+        return {"type": "object"}
+    raise TypeError(f"Unsupported tool annotation: {annotation!r}")
+
+
+def _docstring_parts(function: Callable[..., Any]) -> Tuple[str, Dict[str, str]]:
+    """Splits a docstring into its summary paragraph and the `Args:` descriptions."""
+    docstring = inspect.getdoc(function) or ""
+    summary = " ".join(docstring.split("\n\n")[0].split())
+    section = _ARGS_SECTION.search(docstring)
+    arguments = {
+        match.group("name"): match.group("description").strip()
+        for match in _ARG_LINE.finditer(section.group("body") if section else "")
+    }
+    return summary, arguments
+
+
+class RegisteredTool:
+    """A tool known by import path; the module is imported on first use."""
+
+    def __init__(self, name: str, import_path: str):
+        self.name = name
+        self.import_path = import_path
+        self._function: Optional[Callable[..., Any]] = None
+        self._schema: Optional[Dict[str, Any]] = None
+
+    @property
+    def function(self) -> Callable[..., Any]:
+        if self._function is None:
+            module_name, _, attribute = self.import_path.partition(":")
+            self._function = getattr(importlib.import_module(module_name), attribute)
+        return self._function
+
+    @property
+    def schema(self) -> Dict[str, Any]:
+        """Provider-neutral schema: name, description, parameters and, when annotated, returns."""
+        if self._schema is None:
+            function = self.function
+            hints = typing.get_type_hints(function)
+            summary, descriptions = _docstring_parts(function)
+            properties, required = {}, []
+            for parameter in inspect.signature(function).parameters.values():
+                if parameter.kind in (parameter.VAR_POSITIONAL, parameter.VAR_KEYWORD):
+                    continue
+                property_schema = _json_schema(hints.get(parameter.name, str))
+                if parameter.name in descriptions:
+                    property_schema["description"] = descriptions[parameter.name]
+                properties[parameter.name] = property_schema
+                if parameter.default is parameter.empty:
+                    required.append(parameter.name)
+            schema = {
+                "name": self.name,
+                "description": summary,
+                "parameters": {"type": "object", "properties": properties, "required": required},
+            }
+            if "return" in hints:
+                schema["returns"] = _json_schema(hints["return"])
+            self._schema = schema
+        return self._schema
+
+
+class ToolRegistry:
+    """Name-indexed tools with per-provider schema caches."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tools: Dict[str, RegisteredTool] = {}
+        self._provider_schemas: Dict[str, List[Dict[str, Any]]] = {}
+        self._serialized: Dict[str, str] = {}
+        self._instruction_paths: List[str] = []
+        self._instructions: Optional[str] = None
+
+    def register(self, name: str, import_path: str) -> None:
+        """Registers `module:function` under `name` without importing it."""
+        with self._lock:
+            self._tools[name] = RegisteredTool(name, import_path)
+            self._provider_schemas.clear()
+            self._serialized.clear()
+
+    def register_instructions(self, import_path: str) -> None:
+        """Registers `module:attribute`, system instructions for the tools, without importing it."""
+        with self._lock:
+            self._instruction_paths.append(import_path)
+            self._instructions = None
+
+    def instructions(self) -> str:
+        """The registered instructions, imported on first request and joined into one system prompt."""
+        if self._instructions is None:
+            parts = []
+            for import_path in self._instruction_paths:
+                module_name, _, attribute = import_path.partition(":")
+                parts.append(getattr(importlib.import_module(module_name), attribute))
+            self._instructions = "\n\n".join(parts)
+        return self._instructions
+
+    def names(self) -> List[str]:
+        return list(self._tools)
+
+    def get(self, name: str) -> RegisteredTool:
+        tool = self._tools.get(name)
+        if tool is None:
+            raise ToolArgumentError(f"Unknown tool: {name}")
+        return tool
+
+    def description(self, name: str) -> Optional[str]:
+        tool = self._tools.get(name)
+        return tool.schema["description"] if tool else None
+
+    def schemas(self, provider: str) -> List[Dict[str, Any]]:
+        """The tool declarations in `provider`'s format, derived on first request and cached."""
+        schemas = self._provider_schemas.get(provider)
+        if schemas is None:
+            with self._lock:
+                schemas = [self._for_provider(provider, tool.schema) for tool in self._tools.values()]
+                self._provider_schemas[provider] = schemas
+        return schemas
+
+    def serialized(self, provider: str) -> str:
+        """`schemas(provider)` as indented JSON text, for prompt-based providers and cache keys."""
+        text = self._serialized.get(provider)
+        if text is None:
+            text = self._serialized[provider] = json.dumps(self.schemas(provider), indent=2, ensure_ascii=False)
+        return text
+
+    @staticmethod
+    def _for_provider(provider: str, schema: Dict[str, Any]) -> Dict[str, Any]:
+        declaration = {key: schema[key] for key in ("name", "description", "parameters")}
+        if provider == "openai":
+            return {"type": "function", "function": declaration}
+        if provider in ("genai", "ollama"):
+            # The neutral schema's `returns` is left out: it would only add prompt tokens to every request.
+            return declaration
+        raise ValueError(f"Unknown provider: {provider}")
+
+    def validate(self, name: str, arguments: Any) -> Dict[str, Any]:
+        """Checks `arguments` against the tool's parameters and returns them."""
+        parameters = self.get(name).schema["parameters"]
+        if not isinstance(arguments, dict):
+            raise ToolArgumentError(f"{name} expects an object of arguments, got {type(arguments).__name__}")
+        missing = [key for key in parameters["required"] if key not in arguments]
+        unknown = [key for key in arguments if key not in parameters["properties"]]
+        if missing or unknown:
+            raise ToolArgumentError(f"{name}: missing arguments {missing}, unknown arguments {unknown}")
+        for key, value in arguments.items():
+            if not _matches(parameters["properties"][key], value):
+                raise ToolArgumentError(f"{name}: argument {key!r} has the wrong type ({type(value).__name__})")
+        return arguments
+
+    def call(self, name: str, arguments: Any) -> Any:
+        """Validates `arguments` and runs the tool registered as `name`."""
+        return self.get(name).function(**self.validate(name, arguments))
+
+
+def _matches(schema: Dict[str, Any], value: Any) -> bool:
+    if "anyOf" in schema:
+        return any(_matches(member, value) for member in schema["anyOf"])
+    if "enum" in schema and value not in schema["enum"]:
+        return False
+    expected = schema.get("type")
+    if expected == "string":
+        return isinstance(value, str)
+    if expected == "integer":
+        return isinstance(value, int) and not isinstance(value, bool)
+    if expected == "number":
+        return isinstance(value, (int, float)) and not isinstance(value, bool)
+    if expected == "boolean":
+        return isinstance(value, bool)
+    if expected == "array":
+        return isinstance(value, list)
+    if expected == "object":
+        return isinstance(value, dict)
+    return True
+
+
+TOOL_REGISTRY = ToolRegistry()
+TOOL_REGISTRY.register("get_current_weather", "tools.weather_tool:get_current_weather")
+TOOL_REGISTRY.register("get_weather_forecast", "tools.weather_tool:get_weather_forecast")
+TOOL_REGISTRY.register_instructions("tools.weather_tool:WEATHER_TOOL_INSTRUCTIONS")
@@ -0,0 +1,98 @@
+# tools/single_flight.py
+"""
+Single-flight call coalescing. While a call for a key is in flight, further
+calls for the same key wait for it instead of starting their own, and all of
+them get its result or its exception. Threads and coroutines are coalesced
+separately: a thread waits on the in-flight thread call, a coroutine on the
+in-flight task of its own event loop.
+"""
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+
+class _Flight:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls by key. Callers share the leader's result
+    object, so it must be treated as read-only.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights: Dict[Hashable, _Flight] = {}
+        self._tasks: Dict[Tuple[asyncio.AbstractEventLoop, Hashable], asyncio.Task] = {}
+        self.calls = 0
+        self.collapsed = 0
+
+    def do(self, key: Hashable, function: Callable[..., Any], *args: Any) -> Tuple[Any, bool]:
+        """Runs `function(*args)` unless a call for `key` is in flight; returns (result, shared)."""
+        with self._lock:
+            self.calls += 1
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+            else:
+                self.collapsed += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result, True
+
+        try:
+            flight.result = function(*args)
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+        return flight.result, False
+
+    async def do_async(self, key: Hashable, function: Callable[..., Awaitable[Any]], *args: Any) -> Tuple[Any, bool]:
+        """
+        Async counterpart of `do`. The call runs as a task, so a caller being
+        cancelled does not cancel it for the others waiting on it.
+        """
+        loop = asyncio.get_running_loop()
+        task_key = (loop, key)
+        with self._lock:
+            self.calls += 1
+            task = self._tasks.get(task_key)
+            shared = task is not None
+            if shared:
+                self.collapsed += 1
+            else:
+                task = self._tasks[task_key] = loop.create_task(function(*args))
+                task.add_done_callback(lambda finished: self._finish(task_key, finished))
+        return await asyncio.shield(task), shared
+
+    def _finish(self, task_key: Tuple[asyncio.AbstractEventLoop, Hashable], task: asyncio.Task) -> None:
+        with self._lock:
+            del self._tasks[task_key]
+        if not task.cancelled():
+            # Marks the exception as retrieved even if every waiter was cancelled.
+            task.exception()
+
+    def stats(self) -> Dict[str, float]:
+        """Calls made, calls that ran upstream, and how many were collapsed into another's flight."""
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "upstream": self.calls - self.collapsed,
+                "collapsed": self.collapsed,
+                "collapse_ratio": self.collapsed / self.calls if self.calls else 0.0,
+                "in_flight": len(self._flights) + len(self._tasks),
+            }
@@ -0,0 +1,228 @@
+# tools/weather_cache.py
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional, Tuple
+
+Coordinates = Tuple[float, float]
+
+GEOCODING_CACHE_PATH = os.environ.get(
+    "WEATHER_GEOCODING_CACHE",
+    os.path.join(os.path.expanduser("~"), ".cache", "gemini-function-calling", "geocoding.sqlite3"),
+)
+GEOCODING_CACHE_SIZE = int(os.environ.get("WEATHER_GEOCODING_CACHE_SIZE", "1024"))
+# City coordinates do not move, but the upstream index does get corrected now and then.
+GEOCODING_POSITIVE_TTL = 30 * 24 * 3600
+# "No results" answers are cached briefly so typos don't hammer the API, yet new spellings recover quickly.
+GEOCODING_NEGATIVE_TTL = 3600
+
+# Open-Meteo's default models resolve to roughly a tenth of a degree.
+FORECAST_GRID_RESOLUTION = float(os.environ.get("WEATHER_FORECAST_GRID_RESOLUTION", "0.1"))
+FORECAST_CACHE_SIZE = int(os.environ.get("WEATHER_FORECAST_CACHE_SIZE", "4096"))
+
+CACHE_MISS = object()
+
+
+def normalize_location(location: str) -> str:
+    """Normalizes a location string into a cache key."""
+    return " ".join(location.casefold().split())
+
+
+class GeocodingCache:
+    """
+    Two-tier cache for geocoding lookups: an in-process LRU in front of an
+    on-disk SQLite store that survives restarts. A cached value of None means
+    the location is known to have no results (negative caching).
+    """
+
+    def __init__(
+            self,
+            path: Optional[str] = GEOCODING_CACHE_PATH,
+            max_entries: int = GEOCODING_CACHE_SIZE,
+            positive_ttl: float = GEOCODING_POSITIVE_TTL,
+            negative_ttl: float = GEOCODING_NEGATIVE_TTL,
+    ):
+        self.max_entries = max_entries
+        self.positive_ttl = positive_ttl
+        self.negative_ttl = negative_ttl
+        self._lock = threading.Lock()
+        self._memory: "OrderedDict[str, Tuple[Optional[Coordinates], float]]" = OrderedDict()
+        self._db = self._open_db(path) if path else None
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _open_db(path: str) -> Optional[sqlite3.Connection]:
+        try:
+            if path != ":memory:":
+                os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS geocoding ("
+                " key TEXT PRIMARY KEY, latitude REAL, longitude REAL, expires_at REAL NOT NULL)"
+            )
+            return db
+        except sqlite3.Error:
+            # A read-only home directory should cost us persistence, not the tool.
+            return None
+
+    def get(self, location: str):
+        """
+        Returns the cached coordinates, None for a cached "no results" answer,
+        or the `CACHE_MISS` sentinel when the lookup must go upstream.
+        """
+        key = normalize_location(location)
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and entry[1] > now:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return entry[0]
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT latitude, longitude, expires_at FROM geocoding WHERE key = ?", (key,)
+                ).fetchone()
+                if row and row[2] > now:
+                    coordinates = None if row[0] is None else (row[0], row[1])
+                    self._remember(key, coordinates, row[2])
+                    self.disk_hits += 1
+                    return coordinates
+
+            self.misses += 1
+            return CACHE_MISS
+
+    def set(self, location: str, coordinates: Optional[Coordinates]) -> None:
+        """Stores coordinates, or None to record that the location has no results."""
+        key = normalize_location(location)
+        ttl = self.positive_ttl if coordinates is not None else self.negative_ttl
+        expires_at = time.time() + ttl
+        latitude, longitude = coordinates if coordinates is not None else (None, None)
+        with self._lock:
+            self._remember(key, coordinates, expires_at)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO geocoding (key, latitude, longitude, expires_at) VALUES (?, ?, ?, ?)",
+                    (key, latitude, longitude, expires_at),
+                )
+
+    def _remember(self, key: str, coordinates: Optional[Coordinates], expires_at: float) -> None:
+        self._memory[key] = (coordinates, expires_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def clear(self) -> None:
+        """Drops every entry from both tiers."""
+        with self._lock:
+            self._memory.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM geocoding")
+
+    def stats(self) -> Dict[str, float]:
+        """Returns hit/miss counters for both tiers."""
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_ratio": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+                "memory_entries": len(self._memory),
+            }
+
+
+class ForecastCache:
+    """
+    Thread-safe cache of `current_weather` observations keyed by grid cell.
+    Each entry expires when Open-Meteo publishes the next value, i.e. at the
+    observation `time` plus its reporting `interval`.
+    """
+
+    def __init__(
+            self,
+            grid_resolution: float = FORECAST_GRID_RESOLUTION,
+            max_entries: int = FORECAST_CACHE_SIZE,
+    ):
+        self.grid_resolution = grid_resolution
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Tuple[int, int], Tuple[Dict[str, Any], float, float]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self._staleness_total = 0.0
+        self._staleness_max = 0.0
+
+    def cell(self, latitude: float, longitude: float) -> Tuple[int, int]:
+        """The grid cell observations at these coordinates are cached under."""
+        return math.floor(latitude / self.grid_resolution), math.floor(longitude / self.grid_resolution)
+
+    @staticmethod
+    def _observed_at(weather: Dict[str, Any]) -> Optional[float]:
+        try:
+            observed = datetime.fromisoformat(weather["time"])
+        except (KeyError, TypeError, ValueError):
+            return None
+        if observed.tzinfo is None:
+            # Open-Meteo reports GMT unless a timezone is requested.
+            observed = observed.replace(tzinfo=timezone.utc)
+        return observed.timestamp()
+
+    def get(self, latitude: float, longitude: float) -> Optional[Dict[str, Any]]:
+        """Returns a copy of the current observation for the grid cell, or None."""
+        key = self.cell(latitude, longitude)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[2] <= now:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            staleness = max(0.0, now - entry[1])
+            self._staleness_total += staleness
+            self._staleness_max = max(self._staleness_max, staleness)
+            return dict(entry[0])
+
+    def set(self, latitude: float, longitude: float, weather: Dict[str, Any]) -> None:
+        """Caches an observation until its reporting window closes."""
+        observed_at = self._observed_at(weather)
+        interval = weather.get("interval")
+        if observed_at is None or not interval:
+            return
+        expires_at = observed_at + interval
+        if expires_at <= time.time():
+            return
+        key = self.cell(latitude, longitude)
+        with self._lock:
+            self._entries[key] = (dict(weather), observed_at, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        """Drops every cached observation."""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, float]:
+        """Returns the hit ratio and how old served observations were, in seconds."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "mean_staleness": self._staleness_total / self.hits if self.hits else 0.0,
+                "max_staleness": self._staleness_max,
+                "entries": len(self._entries),
+            }
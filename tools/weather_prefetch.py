@@ -0,0 +1,121 @@
+# tools/weather_prefetch.py
+"""
+Speculative weather lookups. While the first model call of a turn decides
+which tools to call, the locations the user probably means are already being
+looked up in the background. When the model then calls `get_current_weather`
+for one of them, the lookup in flight (or its result) is used instead of
+starting a new one; guesses the model does not confirm are cancelled if
+they have not started, and otherwise only warm the weather caches.
+"""
+import contextvars
+import os
+import threading
+from concurrent.futures import Executor, Future
+from typing import Any, Dict, List, Optional
+
+import tracing
+from tools.registry import TOOL_REGISTRY
+from tools.weather_cache import normalize_location
+from tools.weather_router import candidate_locations
+
+WEATHER_PREFETCH_MAX_LOCATIONS = int(os.environ.get("WEATHER_PREFETCH_MAX_LOCATIONS", "3"))
+
+
+def _is_weather_call(function_call: Dict[str, Any]) -> bool:
+    arguments = function_call.get("arguments")
+    return (
+        function_call.get("name") == "get_current_weather"
+        and isinstance(arguments, dict)
+        and isinstance(arguments.get("location"), str)
+    )
+
+
+class Speculation:
+    """The speculative lookups of one turn; created by `WeatherPrefetcher.speculation`."""
+
+    def __init__(self, prefetcher: "WeatherPrefetcher", user_input: str, executor: Executor):
+        self._prefetcher = prefetcher
+        self._user_input = user_input
+        self._executor = executor
+        self._lookups: Dict[str, Future] = {}
+
+    def start(self) -> None:
+        """Starts the lookups; called right before the model call they are meant to overlap."""
+        locations = candidate_locations(self._user_input, self._prefetcher.max_locations)
+        if not locations:
+            return
+        with tracing.span("turn.prefetch", locations=len(locations)):
+            for location in locations:
+                # Each lookup runs in a copy of this context so its spans join the current turn.
+                context = contextvars.copy_context()
+                self._lookups[normalize_location(location)] = self._executor.submit(
+                    context.run, TOOL_REGISTRY.call, "get_current_weather", {"location": location}
+                )
+        self._prefetcher._record_start(len(self._lookups))
+
+    def settle(self, function_calls: List[Dict[str, Any]]) -> None:
+        """Matches the lookups against the calls the turn makes and cancels the unused ones."""
+        if not self._lookups:
+            return
+        wanted = {
+            normalize_location(call["arguments"]["location"]) for call in function_calls if _is_weather_call(call)
+        }
+        hits = len(wanted & self._lookups.keys())
+        unused = self._lookups.keys() - wanted
+        cancelled = sum(self._lookups.pop(key).cancel() for key in unused)
+        self._prefetcher._record_outcome(hits, len(wanted) - hits, len(unused), cancelled)
+
+    def take(self, function_call: Dict[str, Any]) -> Optional[Future]:
+        """The lookup already made for `function_call`, if there is one."""
+        if not self._lookups or not _is_weather_call(function_call):
+            return None
+        return self._lookups.get(normalize_location(function_call["arguments"]["location"]))
+
+
+class WeatherPrefetcher:
+    """
+    Creates a `Speculation` per turn and keeps the numbers needed to judge
+    speculation: lookups started, model calls they answered (hits), calls
+    they missed, and guesses that went unused.
+    """
+
+    def __init__(self, max_locations: int = WEATHER_PREFETCH_MAX_LOCATIONS):
+        self.max_locations = max_locations
+        self._lock = threading.Lock()
+        self.turns = 0
+        self.paid_off_turns = 0
+        self.lookups = 0
+        self.hits = 0
+        self.misses = 0
+        self.wasted = 0
+        self.cancelled = 0
+
+    def speculation(self, user_input: str, executor: Executor) -> Speculation:
+        return Speculation(self, user_input, executor)
+
+    def _record_start(self, lookups: int) -> None:
+        with self._lock:
+            self.turns += 1
+            self.lookups += lookups
+
+    def _record_outcome(self, hits: int, misses: int, wasted: int, cancelled: int) -> None:
+        with self._lock:
+            self.paid_off_turns += hits > 0
+            self.hits += hits
+            self.misses += misses
+            self.wasted += wasted
+            self.cancelled += cancelled
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "turns": self.turns,
+                "paid_off_turns": self.paid_off_turns,
+                "lookups": self.lookups,
+                "hits": self.hits,
+                "misses": self.misses,
+                "wasted": self.wasted,
+                "cancelled": self.cancelled,
+                "hit_ratio": self.hits / (self.hits + self.misses) if self.hits + self.misses else 0.0,
+                "waste_ratio": self.wasted / self.lookups if self.lookups else 0.0,
+            }
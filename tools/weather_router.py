@@ -0,0 +1,243 @@
+# tools/weather_router.py
+"""
+Deterministic fast path for plain weather questions. `FastPathRouter.route`
+recognises queries such as "weather in Tokyo" or "temperature in NYC and
+St. Louis, MO" and turns them into `get_current_weather` calls with the same
+location rules as `WEATHER_TOOL_INSTRUCTIONS`, so the first model round trip
+can be skipped. Anything it is not sure about is left to the model.
+"""
+import re
+import threading
+from typing import Any, Dict, List, Optional
+
+CITY_NICKNAMES = {
+    "big apple": "New York",
+    "eternal city": "Rome",
+    "city of light": "Paris",
+    "city of lights": "Paris",
+    "windy city": "Chicago",
+    "big easy": "New Orleans",
+    "city of angels": "Los Angeles",
+    "emerald city": "Seattle",
+    "motor city": "Detroit",
+    "mile high city": "Denver",
+    "sin city": "Las Vegas",
+    "city by the bay": "San Francisco",
+    "big smoke": "London",
+    "venice of the north": "Amsterdam",
+    "city of canals": "Venice",
+    "pearl of the orient": "Hong Kong",
+    "lion city": "Singapore",
+}
+
+CITY_ABBREVIATIONS = {
+    "NY": "New York",
+    "NYC": "New York",
+    "LA": "Los Angeles",
+    "SF": "San Francisco",
+    "DC": "Washington",
+    "KL": "Kuala Lumpur",
+    "HK": "Hong Kong",
+    "BCN": "Barcelona",
+    "CDMX": "Mexico City",
+}
+
+# Trailing ", <region>" qualifiers that are safe to strip from a location.
+REGIONS = {
+    region.casefold()
+    for region in (
+        "AL AK AZ AR CA CO CT DE FL GA HI ID IL IN IA KS KY LA ME MD MA MI MN MS MO MT NE NV NH NJ NM NY NC "
+        "ND OH OK OR PA RI SC SD TN TX UT VT VA WA WV WI WY DC US USA UK UAE EU"
+    ).split()
+} | {
+    region.casefold()
+    for region in (
+        "United States", "United Kingdom", "England", "Scotland", "Wales", "Ireland", "Canada", "Mexico",
+        "Brazil", "Argentina", "Chile", "Peru", "Colombia", "France", "Germany", "Italy", "Spain", "Portugal",
+        "Netherlands", "Belgium", "Switzerland", "Austria", "Poland", "Czechia", "Sweden", "Norway",
+        "Denmark", "Finland", "Greece", "Turkey", "Russia", "Ukraine", "Egypt", "Morocco", "Nigeria",
+        "Kenya", "South Africa", "Israel", "India", "China", "Japan", "South Korea", "Korea", "Thailand",
+        "Vietnam", "Indonesia", "Philippines", "Malaysia", "Australia", "New Zealand", "California",
+        "Texas", "Florida", "Ontario", "Quebec", "Bavaria", "Russian Federation",
+    )
+}
+
+# Lowercase words that may appear inside a city name ("Rio de Janeiro").
+CITY_NAME_PARTICLES = {"de", "del", "da", "do", "dos", "la", "le", "les", "el", "al", "am", "an", "upon", "on", "of"}
+MAX_CITY_WORDS = 5
+
+_LEAD_IN = r"(?:(?:and|so|ok|okay|now|also|hey|hi|please)[,\s]+)*"
+_ASK = (
+    r"(?:(?:what(?:'s|\s+is)|how(?:'s|\s+is)|tell\s+me|show(?:\s+me)?|give\s+me|get(?:\s+me)?|check|compare)\s+)?"
+    r"(?:(?:the|current|me)\s+)*"
+)
+# Current conditions only: a forecast question needs `get_weather_forecast`, so it is left to the model.
+_TOPIC = r"(?:weather|temperature|temp|wind(?:\s+speed)?|conditions)"
+_WHEN = r"(?:\s+(?:like|right\s+now|now|today|currently|please))*"
+_END = r"[\s?.!]*$"
+
+_TOPIC_FIRST = re.compile(
+    rf"^{_LEAD_IN}{_ASK}{_TOPIC}{_WHEN}\s+(?:in|for|at|of)\s+(?P<places>.+?){_WHEN}{_END}", re.IGNORECASE
+)
+_PLACE_FIRST = re.compile(
+    rf"^{_LEAD_IN}{_ASK}(?P<places>.+?)(?:'s)?\s+{_TOPIC}{_WHEN}{_END}",
+    re.IGNORECASE,
+)
+# Looser signals used only to guess locations ahead of the model; a wrong guess just wastes a lookup.
+_WEATHER_HINT = re.compile(
+    rf"\b(?:{_TOPIC}|forecast|rain\w*|snow\w*|sunny|cloudy|windy|storm\w*|hot|cold|warm|chilly|humid|umbrella|"
+    r"jacket|degrees|celsius|fahrenheit)\b",
+    re.IGNORECASE,
+)
+_CAPITALIZED_RUN = re.compile(
+    r"\b(?:St\.?\s+)?[A-Z][\w'-]*(?:\s+(?:(?:de|del|da|do|dos|la|le|les|el|al|am|an|upon|on|of)\s+)*[A-Z][\w'-]*)*"
+)
+# Capitalized words that start sentences or questions rather than name places.
+NON_PLACE_WORDS = {
+    "i", "i'm", "what", "what's", "whats", "how", "how's", "is", "are", "was", "will", "does", "do", "did", "the",
+    "a", "hey", "hi", "hello", "please", "tell", "show", "give", "get", "can", "could", "would", "should", "and",
+    "so", "ok", "okay", "thanks", "thank", "yes", "no", "also", "compare", "check", "it", "it's", "in", "me", "my",
+    "any", "need", "weather", "temperature", "forecast", "wind", "today", "tonight", "tomorrow", "now",
+    "monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday",
+}
+# Words that describe the weather or its time rather than name a place, as in "Nice weather" or "Today weather".
+# Only a place named before the topic is checked against them: "weather in Nice" is still Nice.
+NOT_PLACE_FIRST_WORDS = NON_PLACE_WORDS | {
+    "good", "nice", "bad", "great", "terrible", "awful", "horrible", "lovely", "beautiful", "perfect", "fine",
+    "weird", "crazy", "strange", "cold", "hot", "warm", "mild", "wet", "dry", "current", "local", "this", "that",
+    "next", "last", "weekend", "morning", "afternoon", "evening", "tonight's", "today's", "tomorrow's", "our",
+    "your", "outside", "find", "see", "look", "let's", "want",
+}
+_PLACE_SEPARATOR = re.compile(r"\s*(?:,\s*and\s+|\s+and\s+|\s*&\s*)\s*", re.IGNORECASE)
+_SAINT = re.compile(r"\bSt\.?\s+")
+
+
+def _resolve_city(place: str) -> Optional[str]:
+    """Applies the location rules to one place, or returns None when it does not look like a city."""
+    city, _, region = place.partition(",")
+    if region and region.strip().casefold() not in REGIONS:
+        return None
+    city = city.strip()
+
+    bare = re.sub(r"^the\s+", "", city, flags=re.IGNORECASE)
+    if bare.casefold() in CITY_NICKNAMES:
+        return CITY_NICKNAMES[bare.casefold()]
+    if city in CITY_ABBREVIATIONS:
+        return CITY_ABBREVIATIONS[city]
+
+    city = _SAINT.sub("Saint ", city)
+    words = city.split()
+    if not words or len(words) > MAX_CITY_WORDS or not words[0][0].isupper():
+        return None
+    for word in words:
+        if not (word[0].isupper() or word in CITY_NAME_PARTICLES) or not word.replace("-", "").replace("'", "").isalpha():
+            return None
+    return " ".join(words)
+
+
+def _is_known_place(place: str) -> bool:
+    from tools.weather_tool import GAZETTEER
+
+    return GAZETTEER.lookup(place) is not None
+
+
+def _is_place_first_city(place: str, city: str) -> bool:
+    """
+    Whether a place named before the topic ("Tokyo weather") can be trusted
+    without the model: it must not start with a descriptive word, and a lone
+    word must be a known nickname, abbreviation or gazetteer city.
+    """
+    if city.split()[0].casefold() in NOT_PLACE_FIRST_WORDS:
+        return False
+    if len(city.split()) > 1 or place.strip() in CITY_ABBREVIATIONS:
+        return True
+    return place.strip().casefold() in CITY_NICKNAMES or _is_known_place(city)
+
+
+def extract_locations(user_input: str) -> Optional[List[str]]:
+    """Returns the cities of a plain weather question, or None if the query is not one."""
+    match = _TOPIC_FIRST.match(user_input.strip())
+    place_first = match is None
+    match = match or _PLACE_FIRST.match(user_input.strip())
+    if not match:
+        return None
+    locations = []
+    for place in _PLACE_SEPARATOR.split(match.group("places")):
+        city = _resolve_city(place)
+        if city is None or place_first and not _is_place_first_city(place, city):
+            return None
+        if city not in locations:
+            locations.append(city)
+    return locations or None
+
+
+def candidate_locations(user_input: str, limit: int = 3) -> List[str]:
+    """
+    Guesses the cities a weather question is probably about, the way
+    `WEATHER_TOOL_INSTRUCTIONS` tells the model to: the cities of a plain
+    weather question, otherwise nicknames and runs of capitalized words.
+    Returns nothing when the input does not look weather-related.
+    """
+    locations = extract_locations(user_input)
+    if locations:
+        return locations[:limit]
+    if not _WEATHER_HINT.search(user_input):
+        return []
+
+    candidates = []
+    folded = user_input.casefold()
+    candidates.extend(city for nickname, city in CITY_NICKNAMES.items() if nickname in folded)
+    for run in _CAPITALIZED_RUN.findall(user_input):
+        words = run.split()
+        while words and words[0].casefold() in NON_PLACE_WORDS:
+            words.pop(0)
+        city = _resolve_city(" ".join(words)) if words else None
+        if city and city.casefold() not in NON_PLACE_WORDS:
+            candidates.append(city)
+    return list(dict.fromkeys(candidates))[:limit]
+
+
+class FastPathRouter:
+    """
+    Routes obvious weather questions straight to the tool and keeps the
+    numbers needed to judge it: the hit rate and, from the model's own
+    routing calls on misses, an estimate of the latency the hits saved.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.queries = 0
+        self.hits = 0
+        self._model_routing_seconds = 0.0
+        self._model_routing_calls = 0
+
+    def route(self, user_input: str) -> List[Dict[str, Any]]:
+        """Returns the function calls for `user_input`, or an empty list to defer to the model."""
+        locations = extract_locations(user_input)
+        with self._lock:
+            self.queries += 1
+            if locations:
+                self.hits += 1
+        return [
+            {"id": f"call_{index}", "name": "get_current_weather", "arguments": {"location": location}}
+            for index, location in enumerate(locations or [])
+        ]
+
+    def record_model_routing(self, seconds: float) -> None:
+        """Records a miss where the model's first call produced function calls, i.e. what a hit saves."""
+        with self._lock:
+            self._model_routing_seconds += seconds
+            self._model_routing_calls += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            mean_routing = (
+                self._model_routing_seconds / self._model_routing_calls if self._model_routing_calls else 0.0
+            )
+            return {
+                "queries": self.queries,
+                "hits": self.hits,
+                "hit_ratio": self.hits / self.queries if self.queries else 0.0,
+                "mean_model_routing_ms": round(mean_routing * 1000, 1),
+                "estimated_saved_ms": round(self.hits * mean_routing * 1000, 1),
+            }
@@ -1,8 +1,16 @@
+import asyncio
 import os
-from typing import Tuple, TypedDict
-import requests
+from typing import Any, Dict, List, Optional, Tuple, TypedDict
 import urllib.parse
 
+import tracing
+from tools.forecast_summary import FORECAST_COLUMNS, daily_rows, fit_to_budget, slope
+from tools.gazetteer import Gazetteer
+from tools.http_transport import get_async_transport, get_transport
+from tools.micro_batcher import MicroBatcher
+from tools.single_flight import SingleFlight
+from tools.weather_cache import CACHE_MISS, ForecastCache, GeocodingCache, normalize_location
+
 WEATHER_TOOL_INSTRUCTIONS = """
 ## Overall Goal
 You are a helpful assistant that provides weather information by using the `get_current_weather` function. Your primary role is to interpret user queries, call the function correctly, and then present the data returned by the function in a clear, human-readable format.
@@ -18,6 +26,7 @@ When you receive a user's request for weather, you MUST follow these rules to fo
 4.  **Handle "St." Prefix:** Convert "St." in a city name to "Saint" (e.g., "St. Petersburg" becomes "Saint Petersburg").
 5.  **Global Scope:** Assume cities can be from anywhere in the world.
 6.  **Avoid Ambiguity:** If you are unsure if city name is provided in the request, attempt to find capitalized words and use them as a parameter to the function call.
+7.  **Forecasts:** For questions about later today, tomorrow or the coming days, use `get_weather_forecast` with enough `days` to cover them instead of `get_current_weather`.
 
 ## Output Generation Rules (After Function Call)
 After the `get_current_weather` function is executed and returns data, you MUST follow these rules to formulate your response to the user:
@@ -69,6 +78,28 @@ WEATHER_CODES = {
     99: "Thunderstorm with heavy hail",
 }
 
+GEOCODING_API_URL = os.environ.get("OPENMETEO_GEOCODING_URL", "https://geocoding-api.open-meteo.com/v1/search")
+FORECAST_API_URL = os.environ.get("OPENMETEO_FORECAST_URL", "https://api.open-meteo.com/v1/forecast")
+
+MAX_CONCURRENT_LOCATIONS = int(os.environ.get("WEATHER_MAX_CONCURRENT_LOCATIONS", "8"))
+# Forecast fetches arriving within this window go out as one multi-coordinate request; 0 disables batching.
+FORECAST_BATCH_WINDOW = float(os.environ.get("WEATHER_FORECAST_BATCH_WINDOW_MS", "10")) / 1000
+FORECAST_BATCH_MAX_SIZE = int(os.environ.get("WEATHER_FORECAST_BATCH_MAX_SIZE", "50"))
+# Only the hourly variables the forecast summary reduces are requested.
+FORECAST_HOURLY_FIELDS = ("temperature_2m", "precipitation_probability", "wind_speed_10m", "weather_code")
+MAX_FORECAST_DAYS = 7
+
+GEOCODING_CACHE = GeocodingCache()
+GAZETTEER = Gazetteer()
+FORECAST_CACHE = ForecastCache()
+# Concurrent cache misses for the same place share one upstream request.
+GEOCODING_FLIGHTS = SingleFlight()
+FORECAST_FLIGHTS = SingleFlight()
+FORECAST_SERIES_FLIGHTS = SingleFlight()
+
+class LocationNotFoundError(LookupError):
+    """Raised when the geocoding API has no results for a location."""
+
 class InitWeatherData(TypedDict):
     time: str
     interval: int
@@ -85,6 +116,14 @@ class FinalWeatherData(TypedDict):
     is_day: str
     weathercode: str
 
+class ForecastSummary(TypedDict):
+    location: str
+    units: Dict[str, str]
+    temp_trend_per_day: Optional[float]
+    columns: List[str]
+    rows: List[List[Any]]
+    omitted_days: int
+
 def _get_wind_direction(degrees: float) -> str:
     match degrees:
         case x if 348.75 <= x <= 360 or 0 <= x < 11.25:
@@ -133,39 +172,228 @@ def _map_weather_data(init_weather_data: InitWeatherData) -> FinalWeatherData:
 
     return final_weather_data
 
-def _get_location_coordinates(location: str) -> Tuple[float, float]:
-    """Gets the coordinates for a given location."""
-    url = "https://geocoding-api.open-meteo.com/v1/search?"
+def _geocoding_url(location: str) -> str:
+    url = GEOCODING_API_URL + "?"
     params = {"name": location, "count": 1, "language": "en", "format": "json"}
     api_key = os.environ.get("OPENMETEO_API_KEY")
     if api_key:
             params["apikey"] = api_key
-    geocode_url = url + urllib.parse.urlencode(params)
-    geocode_response = requests.get(geocode_url)
-    geocode_response.raise_for_status()
-    geocode_data = geocode_response.json()
-    geocode_data = geocode_data["results"]
+    return url + urllib.parse.urlencode(params)
+
+def _parse_geocoding(geocode_data: dict) -> Optional[Tuple[float, float]]:
+    geocode_data = geocode_data.get("results")
+    if not geocode_data:
+        return None
 
     latitude = geocode_data[0]["latitude"]
     longitude = geocode_data[0]["longitude"]
 
     return latitude, longitude
 
+def _forecast_url(coordinates: List[Tuple[float, float]]) -> str:
+    url = FORECAST_API_URL + "?"
+    params = {
+        "latitude": ",".join(str(latitude) for latitude, _ in coordinates),
+        "longitude": ",".join(str(longitude) for _, longitude in coordinates),
+        "current_weather": "true",
+    }
+    return url + urllib.parse.urlencode(params, safe=",")
+
+def _forecast_series_url(latitude: float, longitude: float, days: int) -> str:
+    params = {
+        "latitude": latitude,
+        "longitude": longitude,
+        "hourly": ",".join(FORECAST_HOURLY_FIELDS),
+        "forecast_days": days,
+        "timezone": "auto",
+    }
+    return FORECAST_API_URL + "?" + urllib.parse.urlencode(params, safe=",")
+
+def _parse_forecasts(data) -> List[InitWeatherData]:
+    # One location comes back as an object, several as a list in request order.
+    return [location["current_weather"] for location in (data if isinstance(data, list) else [data])]
+
+def _get_location_coordinates(location: str) -> Tuple[float, float]:
+    """Gets the coordinates for a given location, consulting the geocoding cache first."""
+    with tracing.span("weather.geocode", location=location) as span:
+        coordinates = GEOCODING_CACHE.get(location)
+        span.set(cache="miss" if coordinates is CACHE_MISS else "hit")
+        if coordinates is CACHE_MISS:
+            coordinates = GAZETTEER.coordinates(location)
+            span.set(source="gazetteer" if coordinates else "api")
+            if coordinates is None:
+                coordinates, shared = GEOCODING_FLIGHTS.do(
+                    normalize_location(location), _fetch_location_coordinates, location
+                )
+                span.set(coalesced=int(shared))
+            GEOCODING_CACHE.set(location, coordinates)
+    if coordinates is None:
+        raise LocationNotFoundError(f"No geocoding results for location: {location}")
+    return coordinates
+
+def _fetch_location_coordinates(location: str) -> Optional[Tuple[float, float]]:
+    """Looks up the coordinates for a location via the geocoding API, or None if unknown."""
+    with tracing.span("weather.geocode.http") as span:
+        geocode_response = get_transport().get(_geocoding_url(location))
+        span.set(status=geocode_response.status_code, response_bytes=len(geocode_response.content))
+    geocode_response.raise_for_status()
+    return _parse_geocoding(geocode_response.json())
+
 def _get_location_weather(latitude: float, longitude: float) -> InitWeatherData:
-    """Gets the current weather for a given latitude & longtitude."""
-    url = "https://api.open-meteo.com/v1/forecast?"
-    params = {"latitude": latitude, "longitude": longitude, "current_weather": "true"}
-    open_meteo_url = url + urllib.parse.urlencode(params)
-    response = requests.get(open_meteo_url)
+    """Gets the current weather for a given latitude & longtitude, reusing observations still in their reporting window."""
+    with tracing.span("weather.forecast") as span:
+        weather = FORECAST_CACHE.get(latitude, longitude)
+        span.set(cache="miss" if weather is None else "hit")
+        if weather is None:
+            weather, shared = FORECAST_FLIGHTS.do(
+                FORECAST_CACHE.cell(latitude, longitude), _fetch_location_weather, latitude, longitude
+            )
+            span.set(coalesced=int(shared))
+            FORECAST_CACHE.set(latitude, longitude, weather)
+    return weather
+
+def _fetch_forecasts(coordinates: List[Tuple[float, float]]) -> List[InitWeatherData]:
+    """Fetches the current weather for every (latitude, longitude) pair in one forecast API request."""
+    with tracing.span("weather.forecast.http", batch_size=len(coordinates)) as span:
+        response = get_transport().get(_forecast_url(coordinates))
+        span.set(status=response.status_code, response_bytes=len(response.content))
     response.raise_for_status()
-    data = response.json()
+    return _parse_forecasts(response.json())
 
-    init_weather_data: InitWeatherData = data["current_weather"]
-    return init_weather_data
+def _fetch_location_weather(latitude: float, longitude: float) -> InitWeatherData:
+    """Fetches the current weather for a given latitude & longtitude, batched with concurrent fetches."""
+    return FORECAST_BATCHER.get((latitude, longitude))
 
 def get_current_weather(location: str) -> FinalWeatherData:
-    """Gets the current weather for a given location."""
+    """
+    🌡️Gets the current weather for a given location.
+
+    Args:
+        location: The city name, e.g. New York
+    """
     latitude, longitude = _get_location_coordinates(location)
     weather = _get_location_weather(latitude, longitude)
     weather = _map_weather_data(weather)
     return weather
+
+def _fetch_forecast_series(latitude: float, longitude: float, days: int) -> Dict[str, Any]:
+    """Fetches `days` days of the hourly forecast fields as Open-Meteo's columns: "time" plus one array per field."""
+    with tracing.span("weather.forecast_series.http", days=days) as span:
+        response = get_transport().get(_forecast_series_url(latitude, longitude, days))
+        span.set(status=response.status_code, response_bytes=len(response.content))
+    response.raise_for_status()
+    return response.json()["hourly"]
+
+def get_weather_forecast(location: str, days: int = 3) -> ForecastSummary:
+    """
+    📅Gets the weather forecast for the coming days at a given location, one row per day.
+
+    Args:
+        location: The city name, e.g. New York
+        days: Number of days to forecast, from 1 to 7, starting today
+    """
+    days = max(1, min(days, MAX_FORECAST_DAYS))
+    latitude, longitude = _get_location_coordinates(location)
+    hourly, _ = FORECAST_SERIES_FLIGHTS.do(
+        (FORECAST_CACHE.cell(latitude, longitude), days), _fetch_forecast_series, latitude, longitude, days
+    )
+    rows = daily_rows(hourly, lambda code: WEATHER_CODES.get(code, "Unknown"))
+    # Fitted to the daily means, so the day-night swing does not register as a trend.
+    trend = slope([row[FORECAST_COLUMNS.index("temp_mean")] for row in rows])
+    summary: ForecastSummary = {
+        "location": location,
+        "units": {"temp": "°C", "wind": "km/h", "precip_chance": "%"},
+        "temp_trend_per_day": round(trend, 1) if trend is not None else None,
+        "columns": FORECAST_COLUMNS,
+        "rows": rows,
+        "omitted_days": 0,
+    }
+    return fit_to_budget(summary)
+
+async def _get_location_coordinates_async(location: str) -> Tuple[float, float]:
+    """Async version of `_get_location_coordinates`."""
+    with tracing.span("weather.geocode", location=location) as span:
+        # The cache's disk tier is SQLite, so it is read and written off the event loop.
+        coordinates = await asyncio.to_thread(GEOCODING_CACHE.get, location)
+        span.set(cache="miss" if coordinates is CACHE_MISS else "hit")
+        if coordinates is CACHE_MISS:
+            coordinates = GAZETTEER.coordinates(location)
+            span.set(source="gazetteer" if coordinates else "api")
+            if coordinates is None:
+                coordinates, shared = await GEOCODING_FLIGHTS.do_async(
+                    normalize_location(location), _fetch_location_coordinates_async, location
+                )
+                span.set(coalesced=int(shared))
+            await asyncio.to_thread(GEOCODING_CACHE.set, location, coordinates)
+    if coordinates is None:
+        raise LocationNotFoundError(f"No geocoding results for location: {location}")
+    return coordinates
+
+async def _fetch_location_coordinates_async(location: str) -> Optional[Tuple[float, float]]:
+    """Async version of `_fetch_location_coordinates`."""
+    with tracing.span("weather.geocode.http") as span:
+        geocode_response = await get_async_transport().get(_geocoding_url(location))
+        span.set(status=geocode_response.status_code, response_bytes=len(geocode_response.content))
+    geocode_response.raise_for_status()
+    return _parse_geocoding(geocode_response.json())
+
+async def _get_location_weather_async(latitude: float, longitude: float) -> InitWeatherData:
+    """Async version of `_get_location_weather`."""
+    with tracing.span("weather.forecast") as span:
+        weather = FORECAST_CACHE.get(latitude, longitude)
+        span.set(cache="miss" if weather is None else "hit")
+        if weather is None:
+            weather, shared = await FORECAST_FLIGHTS.do_async(
+                FORECAST_CACHE.cell(latitude, longitude), _fetch_location_weather_async, latitude, longitude
+            )
+            span.set(coalesced=int(shared))
+            FORECAST_CACHE.set(latitude, longitude, weather)
+    return weather
+
+async def _fetch_forecasts_async(coordinates: List[Tuple[float, float]]) -> List[InitWeatherData]:
+    """Async version of `_fetch_forecasts`."""
+    with tracing.span("weather.forecast.http", batch_size=len(coordinates)) as span:
+        response = await get_async_transport().get(_forecast_url(coordinates))
+        span.set(status=response.status_code, response_bytes=len(response.content))
+    response.raise_for_status()
+    return _parse_forecasts(response.json())
+
+async def _fetch_location_weather_async(latitude: float, longitude: float) -> InitWeatherData:
+    """Async version of `_fetch_location_weather`."""
+    return await FORECAST_BATCHER.get_async((latitude, longitude))
+
+FORECAST_BATCHER = MicroBatcher(
+    _fetch_forecasts, _fetch_forecasts_async, window=FORECAST_BATCH_WINDOW, max_size=FORECAST_BATCH_MAX_SIZE
+)
+
+async def get_current_weather_async(location: str) -> FinalWeatherData:
+    """Async version of `get_current_weather`."""
+    latitude, longitude = await _get_location_coordinates_async(location)
+    weather = await _get_location_weather_async(latitude, longitude)
+    return _map_weather_data(weather)
+
+def single_flight_stats() -> Dict[str, Dict[str, float]]:
+    """How many geocoding and forecast lookups were collapsed into another caller's upstream request."""
+    return {"geocoding": GEOCODING_FLIGHTS.stats(), "forecast": FORECAST_FLIGHTS.stats()}
+
+def forecast_batch_stats() -> Dict[str, float]:
+    """Forecast fetches, the batched requests that carried them and the mean batch size."""
+    return FORECAST_BATCHER.stats()
+
+async def get_current_weather_many(
+        locations: List[str], max_concurrency: int = MAX_CONCURRENT_LOCATIONS
+) -> Dict[str, FinalWeatherData]:
+    """
+    Gets the current weather for several locations at once. Every location is
+    geocoded and fetched concurrently, at most `max_concurrency` at a time, so
+    the wall-clock cost is roughly one lookup rather than one per location.
+    """
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def lookup(location: str) -> FinalWeatherData:
+        async with semaphore:
+            return await get_current_weather_async(location)
+
+    unique_locations = list(dict.fromkeys(locations))
+    results = await asyncio.gather(*(lookup(location) for location in unique_locations))
+    return dict(zip(unique_locations, results))
@@ -0,0 +1,211 @@
+# tracing.py
+"""
+Lightweight per-turn tracing. Code marks stages with `span(name, **attrs)`;
+when tracing is disabled (the default) that returns a shared no-op object,
+so instrumented hot paths pay one global lookup and a function call.
+Enabled spans are written to a JSON-lines trace file and/or aggregated into
+Prometheus-style metrics served over HTTP.
+"""
+import contextvars
+import itertools
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+# Numeric span attributes that are summed into `chatbot_<name>_total` counters.
+COUNTED_ATTRIBUTES = ("prompt_tokens", "completion_tokens", "response_bytes", "coalesced", "prefetched")
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_enabled = False
+_exporters: List[Any] = []
+_span_ids = itertools.count(1)
+_current: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("current_span", default=None)
+
+
+class _NoopSpan:
+    recording = False
+
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        return None
+
+    def set(self, **attributes: Any) -> None:
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class Span:
+    """A timed, named stage. Nested spans share the trace id of the outermost one (the turn)."""
+
+    __slots__ = ("name", "attributes", "trace_id", "span_id", "parent_id", "start", "duration", "error", "_token")
+    recording = True
+
+    def __init__(self, name: str, attributes: Dict[str, Any]):
+        self.name = name
+        self.attributes = attributes
+        self.span_id = next(_span_ids)
+        self.error: Optional[str] = None
+        self.duration = 0.0
+
+    def __enter__(self) -> "Span":
+        parent = _current.get()
+        self.parent_id = parent.span_id if parent else None
+        self.trace_id = parent.trace_id if parent else f"{os.getpid():x}-{self.span_id:x}"
+        self._token = _current.set(self)
+        self.start = time.time()
+        self.duration = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback) -> None:
+        self.duration = time.perf_counter() - self.duration
+        _current.reset(self._token)
+        # GeneratorExit just means a streaming consumer stopped early.
+        if exc_type is not None and not issubclass(exc_type, GeneratorExit):
+            self.error = f"{exc_type.__name__}: {exc}"
+        for exporter in _exporters:
+            exporter.export(self)
+
+    def set(self, **attributes: Any) -> None:
+        self.attributes.update(attributes)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": round(self.start, 6),
+            "duration_ms": round(self.duration * 1000, 3),
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+
+def span(name: str, **attributes: Any):
+    """Returns a context manager timing `name`, or the shared no-op span when tracing is off."""
+    if not _enabled:
+        return NOOP_SPAN
+    return Span(name, attributes)
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+class JsonlExporter:
+    """Appends every finished span to a JSON-lines file."""
+
+    def __init__(self, path: str):
+        self._file = open(path, "a", encoding="utf-8")
+        self._lock = threading.Lock()
+
+    def export(self, finished: Span) -> None:
+        line = json.dumps(finished.to_dict(), default=str) + "\n"
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class PrometheusMetrics:
+    """Aggregates span durations into histograms and counted attributes into totals."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms: Dict[str, Tuple[List[int], List[float]]] = {}
+        self._errors: Dict[str, int] = {}
+        self._totals: Dict[Tuple[str, str], float] = {}
+
+    def export(self, finished: Span) -> None:
+        with self._lock:
+            buckets, sums = self._histograms.setdefault(finished.name, ([0] * len(DURATION_BUCKETS), [0.0, 0]))
+            for index, bound in enumerate(DURATION_BUCKETS):
+                if finished.duration <= bound:
+                    buckets[index] += 1
+            sums[0] += finished.duration
+            sums[1] += 1
+            if finished.error:
+                self._errors[finished.name] = self._errors.get(finished.name, 0) + 1
+            for attribute in COUNTED_ATTRIBUTES:
+                value = finished.attributes.get(attribute)
+                if isinstance(value, (int, float)):
+                    key = (attribute, finished.name)
+                    self._totals[key] = self._totals.get(key, 0) + value
+
+    def render(self) -> str:
+        """Renders the Prometheus text exposition format."""
+        lines = [
+            "# HELP chatbot_span_duration_seconds Duration of traced chatbot stages.",
+            "# TYPE chatbot_span_duration_seconds histogram",
+        ]
+        with self._lock:
+            for name, (buckets, (total, count)) in sorted(self._histograms.items()):
+                for bound, bucket_count in zip(DURATION_BUCKETS, buckets):
+                    lines.append(f'chatbot_span_duration_seconds_bucket{{span="{name}",le="{bound}"}} {bucket_count}')
+                lines.append(f'chatbot_span_duration_seconds_bucket{{span="{name}",le="+Inf"}} {count}')
+                lines.append(f'chatbot_span_duration_seconds_sum{{span="{name}"}} {total}')
+                lines.append(f'chatbot_span_duration_seconds_count{{span="{name}"}} {count}')
+            lines.append("# TYPE chatbot_span_errors_total counter")
+            for name, count in sorted(self._errors.items()):
+                lines.append(f'chatbot_span_errors_total{{span="{name}"}} {count}')
+            for attribute in COUNTED_ATTRIBUTES:
+                lines.append(f"# TYPE chatbot_{attribute}_total counter")
+                for (counted, name), value in sorted(self._totals.items()):
+                    if counted == attribute:
+                        lines.append(f'chatbot_{attribute}_total{{span="{name}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+
+def serve_metrics(metrics: PrometheusMetrics, port: int, host: str = "127.0.0.1"):
+    """Serves `metrics` at http://host:port/metrics from a daemon thread."""
+    # Imported here: http.server is one of the slowest stdlib imports and most runs never serve metrics.
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = metrics.render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def configure(trace_file: Optional[str] = None, metrics_port: Optional[int] = None) -> Optional[PrometheusMetrics]:
+    """
+    Enables tracing when a trace file and/or metrics port is given, falling
+    back to `CHATBOT_TRACE_FILE` and `CHATBOT_METRICS_PORT`. Returns the
+    metrics aggregator when the endpoint was started.
+    """
+    global _enabled
+    trace_file = trace_file or os.environ.get("CHATBOT_TRACE_FILE")
+    metrics_port = metrics_port or int(os.environ.get("CHATBOT_METRICS_PORT", 0)) or None
+
+    metrics = None
+    if trace_file:
+        _exporters.append(JsonlExporter(trace_file))
+    if metrics_port:
+        metrics = PrometheusMetrics()
+        serve_metrics(metrics, metrics_port)
+        _exporters.append(metrics)
+    _enabled = bool(_exporters)
+    return metrics